@@ -1,73 +1,114 @@
+import os
 import json
 import re
 import time
-import openai
+import random
 import asyncio
 import logging
-from openai import AsyncOpenAI
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
-from typing import List
+from datetime import datetime
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional
 from models import StudyRequest, Session, ScheduleResponse
+from availability import with_expanded_slots
+from columnar import RequestColumns
+from scheduler import COLUMN_STRATEGIES, DEFAULT_BREAK_MINUTES, Placement, run_strategy
+from prompting import build_compact_prompts, estimate_tokens, expected_sessions, SAMPLE_REPLY_SESSION
+from cache import cache_key, response_cache
+from ratelimit import FairQueue
+from metrics import STAGE_SECONDS, OPENAI_REQUESTS, OPENAI_RETRIES, OPENAI_TIMEOUTS, OPENAI_TOKENS
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI # The SDK itself is imported on first use, see load_llm_stack
 
 load_dotenv()  # Load environment variables from .env file
 
+# Connection pool and concurrency settings for the shared OpenAI client
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_MAX_BACKOFF = float(os.getenv("OPENAI_MAX_BACKOFF", "20.0"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30.0")) # Seconds before a completion (or the first streamed token) times out
+
+# Prompt building: "auto" keeps the verbose prompt while it fits the budget and
+# switches to compact, date-windowed sub-prompts for large requests
+PROMPT_FORMAT = os.getenv("PROMPT_FORMAT", "auto") # "auto", "verbose" or "compact"
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000")) # Estimated prompt tokens per sub-prompt
+
+# "full" sends the whole request to the LLM; "hybrid" lets the rule-based engine
+# place what it can and only sends the remaining tasks and free time;
+# "speculative" runs the rule-based engine alongside the LLM and returns its
+# schedule when no valid AI schedule arrives within AI_DEADLINE_SECONDS
+AI_SCHEDULE_MODE = os.getenv("AI_SCHEDULE_MODE", "full")
+AI_DEADLINE_SECONDS = float(os.getenv("AI_DEADLINE_SECONDS", "5.0"))
+
+# When to import the OpenAI SDK and create the client: "none" (first AI request),
+# "background" (right after startup) or "startup" (before serving, slowest cold start)
+LLM_WARMUP = os.getenv("LLM_WARMUP", "none")
+
+# Model parameters; these are part of the response cache key
+OPENAI_MODEL = "gpt-4"
+OPENAI_TEMPERATURE = 0.7 # Adjust temperature for creativity vs. precision
+OPENAI_MAX_TOKENS = 1000 # Limit response length
+OPENAI_SYSTEM_PROMPT = "You are a helpful assistant that generates study schedules."
+
+_openai_client: Optional["AsyncOpenAI"] = None
+# Concurrency slots, shared round-robin between users when they are all busy
+openai_queue = FairQueue(OPENAI_MAX_CONCURRENCY)
+
+# Single-flight: concurrent callers with the same prompt key share one in-flight request
+_inflight: Dict[str, asyncio.Future] = {}
+singleflight_counters = {"leaders": 0, "deduplicated": 0}
+
+def validate_request(request: StudyRequest) -> Optional[str]:
+    """Returns an error message if the request cannot be scheduled, otherwise None."""
+    if not request.available_slots and not request.availability:
+        return "No available time slots provided."
+    if not request.tasks:
+        return "No tasks provided for scheduling."
+    return None
+
+def placements_to_sessions(placements: List[Placement]) -> List[Session]:
+    """Converts engine placements to Sessions."""
+    # Placements come from validated requests, so models are built without validating them again
+    return [
+        Session.model_construct(task=p.task, start_time=p.start_time, end_time=p.end_time, break_after=p.break_after)
+        for p in placements
+    ]
+
 def generate_schedule(request: StudyRequest) -> ScheduleResponse:
-    sessions: List[Session] = []
-    remaining_tasks = sorted(request.tasks, key=lambda t: t.due_date) # Sort tasks by due date
-    unscheduled_tasks = []
-    break_after = 5 # Default break after the session in minutes
-    total_study_time = 0
-    total_break_time = 0
-
-    slot_index = 0
-    while remaining_tasks and slot_index < len(request.available_slots):
-        slot = request.available_slots[slot_index]
-        slot_start = slot.start_time
-        slot_end = slot.end_time
-
-        while remaining_tasks and slot_start < slot_end:
-            task = remaining_tasks[0]
-            energy = request.energy_level[slot_index] # 1 = low, 2 = medium, 3 = high
-            multiplier = {1: 1.25, 2: 1.0, 3: 0.75}.get(energy, 1.0) # task duration increases with lower energy and increases with higher energy
-            adjusted_duration_minutes = round(task.duration_minutes * multiplier)
-            task_duration = timedelta(minutes=adjusted_duration_minutes)
-
-            # Check if the task fits in the current time slot
-            if slot_start + task_duration <= slot_end:
-                session = Session(
-                    task=task,
-                    start_time=slot_start,
-                    end_time=slot_start + task_duration,
-                    break_after=break_after
-                )
-                sessions.append(session)
-                total_study_time += adjusted_duration_minutes
-                total_break_time += break_after
-                slot_start += task_duration + timedelta(minutes=break_after)
-
-                # Move to the next time slot after the session and break
-                remaining_tasks.pop(0)
-            else:
-                # If the task doesn't fit, move to the next time slot
-                break
-
-        slot_index += 1
-    
+    """
+    Generates a schedule with the rule-based engine selected by `request.strategy`.
+    The greedy engines run on the columnar view of the request (see columnar.py),
+    so Sessions are the only objects built per placement.
+    """
+    engine = COLUMN_STRATEGIES.get(request.strategy)
+    if engine is not None:
+        result = engine(RequestColumns(request), DEFAULT_BREAK_MINUTES)
+        sessions = result.to_sessions()
+        unscheduled_tasks = result.unscheduled_tasks()
+        total_study_time = sum(result.minutes)
+        total_break_time = result.break_after * len(result)
+        stats = None
+    else:
+        placements, unscheduled_tasks, stats = run_strategy(with_expanded_slots(request))
+        sessions = placements_to_sessions(placements)
+        total_study_time = sum(p.duration_minutes for p in placements)
+        total_break_time = sum(p.break_after for p in placements)
+
     # If there are still remaining tasks that couldn't be scheduled
-    unscheduled_tasks.extend(remaining_tasks)
     warning_messages = [
         f"Unable to schedule task '{task.title}' before its duedate of {task.due_date.strftime("%Y-%m-%d %H:%M")}." for task in unscheduled_tasks
     ]
     
-    return ScheduleResponse(
+    return ScheduleResponse.model_construct(
         user_id=request.user_id,
         sessions=sessions,
         total_study_time=total_study_time,
         total_break_time=total_break_time,
         success=len(unscheduled_tasks) == 0,
         message="All tasks scheduled successfully." if not unscheduled_tasks else "Some tasks could not be scheduled due to time constraints.",
-        warnings=warning_messages
+        warnings=warning_messages,
+        stats=stats
     )
 
 def format_schedule_prompt(request: StudyRequest) -> str:
@@ -106,6 +147,20 @@ def format_schedule_prompt(request: StudyRequest) -> str:
 """)
     return "\n".join(lines)
 
+def build_schedule_prompts(request: StudyRequest, prompt_format: str = PROMPT_FORMAT) -> List[str]:
+    """
+    Returns the prompts for an AI schedule request. Several prompts cover
+    disjoint date windows; they can be sent in parallel and their sessions merged.
+    """
+    if prompt_format != "compact":
+        prompt = format_schedule_prompt(request)
+        reply_fits = expected_sessions(request.tasks, request.pomodoro_length) * estimate_tokens(SAMPLE_REPLY_SESSION) <= OPENAI_MAX_TOKENS
+        if prompt_format == "verbose" or (reply_fits and estimate_tokens(prompt) <= PROMPT_TOKEN_BUDGET):
+            return [prompt]
+    prompts = build_compact_prompts(request, PROMPT_TOKEN_BUDGET, OPENAI_MAX_TOKENS)
+    logging.info(f"[PROMPT] Built {len(prompts)} compact prompt(s) for user_id={request.user_id}")
+    return prompts
+
 def format_chat_prompt(message: str, context: str = "") -> str:
     """
     Formats the chat prompt for OpenAI API.
@@ -141,46 +196,190 @@ def format_chat_prompt(message: str, context: str = "") -> str:
     return formatted_prompt
 
 
-async def call_openai_api(prompt: str, max_retries: int = 3, delay: float = 2.0) -> List[dict]:
+def load_llm_stack():
+    """
+    Imports the OpenAI SDK, the slowest import of the service. It is deferred
+    to the first AI request (or the LLM_WARMUP hook) so cold starts answer
+    /ping without paying for it.
+    """
+    with STAGE_SECONDS.time(stage="llm_import"):
+        import openai # noqa: F401
+
+async def warm_up_llm(mode: str = LLM_WARMUP):
+    """
+    Warm-up hook for the lifespan handler: "startup" loads the LLM stack and
+    creates the client before serving, "background" does it after startup
+    without blocking requests, "none" leaves it to the first AI request.
+    """
+    if mode == "none":
+        return
+    if mode == "background":
+        await asyncio.to_thread(load_llm_stack) # Module imports are thread-safe; the client is created on the loop
+    init_openai_client()
+
+def init_openai_client() -> "AsyncOpenAI":
+    """
+    Creates the app-lifetime OpenAI client with a pooled HTTP connection.
+    Called on the first AI request or from warm_up_llm; safe to call more than once.
+    """
+    global _openai_client
+    if _openai_client is None:
+        load_llm_stack()
+        import httpx
+        import openai
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+            )
+        )
+        _openai_client = openai.AsyncOpenAI(http_client=http_client)
+        logging.info(f"[GPT] Shared client ready (max_connections={OPENAI_MAX_CONNECTIONS}, concurrency={OPENAI_MAX_CONCURRENCY})")
+    return _openai_client
+
+async def close_openai_client():
+    """Closes the shared OpenAI client and its connection pool."""
+    global _openai_client
+    if _openai_client is not None:
+        await _openai_client.close()
+        _openai_client = None
+
+def backoff_delay(attempt: int, delay: float) -> float:
+    """Exponential backoff with full jitter, capped at OPENAI_MAX_BACKOFF seconds."""
+    return random.uniform(0, min(OPENAI_MAX_BACKOFF, delay * 2 ** attempt))
+
+async def call_openai_api(prompt: str, max_retries: int = 3, delay: float = 2.0, use_cache: bool = True, user_id: str = "") -> List[dict]:
     """
     Calls OpenAI with retry logic on timeout and parses JSON from the response.
+    Uses the shared client and at most OPENAI_MAX_CONCURRENCY in-flight requests per process;
+    callers waiting for a slot are served round-robin by `user_id`.
+    Parsed responses are cached by prompt and model parameters, so repeated prompts skip OpenAI,
+    and concurrent identical prompts are coalesced onto a single request.
     """
-    client = AsyncOpenAI()  # Initialize OpenAI client
+    key = cache_key(prompt, model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE, max_tokens=OPENAI_MAX_TOKENS)
+    if use_cache and response_cache is not None:
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            logging.info("[GPT] Serving cached response")
+            return cached
+
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        singleflight_counters["deduplicated"] += 1
+        logging.info("[GPT] Joining in-flight request for identical prompt")
+        # Shield so a cancelled waiter doesn't cancel the request the others are waiting on
+        return await asyncio.shield(inflight)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    singleflight_counters["leaders"] += 1
+    try:
+        parsed_json = await _request_completion(prompt, max_retries, delay, user_id)
+        # Joiners get the reply now; the request stays in flight until it is cached, so no caller misses both
+        future.set_result(parsed_json)
+        if use_cache and response_cache is not None:
+            try:
+                await response_cache.aset(key, parsed_json)
+            except Exception as e:
+                # The cache is best-effort; the reply is still good
+                logging.warning(f"[CACHE] Failed to store LLM response: {e}")
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        if not future.done():
+            future.set_exception(e)
+            future.exception() # Mark as retrieved in case no other caller joined
+        raise
+    finally:
+        del _inflight[key]
+    return parsed_json
+
+def record_token_usage(response):
+    """Adds the token usage reported by a completion response to the token counters."""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        OPENAI_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, type="prompt")
+        OPENAI_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, type="completion")
+
+async def _request_completion(prompt: str, max_retries: int, delay: float, user_id: str = "") -> List[dict]:
+    """Sends the prompt to OpenAI, retrying timeouts and transient errors with backoff."""
+    import openai
+    client = init_openai_client()
 
     for attempt in range(max_retries):
+        if attempt > 0:
+            OPENAI_RETRIES.inc()
+        response = None
         try:
             logging.info(f"[GPT] Attempt {attempt + 1} to call OpenAI")
-            response = await asyncio.wait_for(
-                client.chat.completions.create(
-                    model = "gpt-4",
-                    messages = [
-                        {"role": "system", "content": "You are a helpful assistant that generates study schedules."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature = 0.7, # Adjust temperature for creativity vs. precision
-                    max_tokens = 1000, # Limit response length
-                    n = 1 # Number of responses to generate
-                ),
-                timeout=30.0 # Timeout for the API call in seconds
-            )
+            queued_at = time.perf_counter()
+            async with openai_queue.slot(user_id):
+                STAGE_SECONDS.observe(time.perf_counter() - queued_at, stage="openai_queue")
+                with STAGE_SECONDS.time(stage="openai_request"):
+                    response = await asyncio.wait_for(
+                        client.chat.completions.create(
+                            model = OPENAI_MODEL,
+                            messages = [
+                                {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
+                                {"role": "user", "content": prompt}
+                            ],
+                            temperature = OPENAI_TEMPERATURE,
+                            max_tokens = OPENAI_MAX_TOKENS,
+                            n = 1 # Number of responses to generate
+                        ),
+                        timeout=OPENAI_TIMEOUT
+                    )
+            record_token_usage(response)
             text = response.choices[0].message.content.strip()
             logging.debug(f"[GPT RAW TEXT] {text}")
-            json_str = re.search(r"\[.*\]", text, re.DOTALL).group(0)
-            parsed_json = json.loads(json_str)
+            with STAGE_SECONDS.time(stage="json_extract"):
+                json_str = re.search(r"\[.*\]", text, re.DOTALL).group(0)
+                parsed_json = json.loads(json_str)
+            OPENAI_REQUESTS.inc(outcome="success")
             logging.info("[GPT] Successfully parsed JSON response")
             return parsed_json
         
-        except openai.APITimeoutError as te:
+        except (openai.APITimeoutError, asyncio.TimeoutError) as te:
+            OPENAI_REQUESTS.inc(outcome="timeout")
+            OPENAI_TIMEOUTS.inc()
             logging.warning(f"[GPT TIMEOUT] Timeout on attempt {attempt + 1}: {te}")
-            time.sleep(delay)
+            await asyncio.sleep(backoff_delay(attempt, delay))
 
         except json.JSONDecodeError as je:
+            OPENAI_REQUESTS.inc(outcome="invalid_response")
             logging.error(f"[GPT ERROR] JSON parsing failed: {je}")
             raise ValueError("Malformed JSON response from OpenAI API.")
         
         except Exception as e:
+            OPENAI_REQUESTS.inc(outcome="error" if response is None else "invalid_response")
             logging.error(f"[GPT ERROR] Unexpected exception: {e}")
             if attempt == max_retries - 1:
                 raise e
-            time.sleep(delay)
-    raise RuntimeError("Failed to get a valid response from OpenAI after multiple attempts.")
\ No newline at end of file
+            await asyncio.sleep(backoff_delay(attempt, delay))
+    raise RuntimeError("Failed to get a valid response from OpenAI after multiple attempts.")
+
+async def stream_openai_api(prompt: str, first_token_timeout: float = OPENAI_TIMEOUT, user_id: str = "") -> AsyncIterator[str]:
+    """
+    Streams the completion for a prompt from OpenAI, yielding text deltas as they arrive.
+    Holds one of the shared concurrency slots for the duration of the stream.
+    """
+    client = init_openai_client()
+    async with openai_queue.slot(user_id):
+        logging.info("[GPT] Opening streaming completion")
+        stream = await asyncio.wait_for(
+            client.chat.completions.create(
+                model = OPENAI_MODEL,
+                messages = [
+                    {"role": "system", "content": OPENAI_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature = OPENAI_TEMPERATURE,
+                max_tokens = OPENAI_MAX_TOKENS,
+                stream = True
+            ),
+            timeout=first_token_timeout
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
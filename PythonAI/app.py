@@ -1,92 +1,522 @@
+import json
+import math
+import time
+import asyncio
 import logging
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Annotated, List, Literal, Optional
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from ai_model import generate_schedule, format_schedule_prompt, format_chat_prompt, call_openai_api
-from utils import parse_llm_response
-from models import StudyRequest, ScheduleResponse
+from ai_model import generate_schedule, placements_to_sessions, validate_request, build_schedule_prompts, AI_SCHEDULE_MODE, AI_DEADLINE_SECONDS, format_chat_prompt, call_openai_api, stream_openai_api, warm_up_llm, LLM_WARMUP, close_openai_client, singleflight_counters, openai_queue
+from utils import parse_llm_response, IncrementalSessionParser
+from validation import validate_llm_sessions, ValidationResult
+from cache import response_cache
+from offload import scheduler_executor, ExecutorSaturated
+from batch import submit_batch, iter_completed, iter_ndjson, shutdown_batch_executor, BatchTooLarge, BATCH_MAX_ITEMS
+from metrics import REQUEST_SECONDS, STAGE_SECONDS, AI_SCHEDULES, LLM_RATE_LIMITED, GaugeCallback, render_metrics, snapshot_metrics
+from shared_state import shared_state, SHARED_STATE_FLUSH_SECONDS
+from ratelimit import rate_limiter, RateLimited
+from reschedule import reschedule
+from hybrid import remainder_request, merge_schedules
+from availability import with_expanded_slots
+from chat_memory import chat_memory, clip_tokens, describe_reply, schedule_digest, CHAT_CLIENT_CONTEXT_TOKENS, CHAT_DIGEST_DAYS
+from scheduler import run_strategy
+from store import create_store, SCHEDULE_QUERY_LIMIT
+from serialization import schedule_response
+from models import StudyRequest, ScheduleResponse, RescheduleRequest, Session
 
 logging.basicConfig(level=logging.DEBUG)
 
+schedule_store = None # Opened at startup when SCHEDULE_STORE is set
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Runs the LLM_WARMUP hook on startup (by default the OpenAI client is created
+    on the first AI request), opens the schedule store and closes shared
+    resources on shutdown.
+    """
+    global schedule_store
+    schedule_store = await asyncio.to_thread(create_store)
+
+    async def warm_up():
+        try:
+            await warm_up_llm()
+        except Exception as e:
+            # Without credentials the AI endpoints fall back to the rule-based engine
+            logging.warning(f"[STARTUP] OpenAI client unavailable: {e}")
+
+    warm_up_task = None
+    if LLM_WARMUP == "background":
+        warm_up_task = asyncio.create_task(warm_up())
+    else:
+        await warm_up()
+    publish_task = asyncio.create_task(publish_metrics_periodically()) if shared_state is not None else None
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    if publish_task is not None:
+        publish_task.cancel()
+        await publish_metrics()
+    await close_openai_client()
+    shutdown_batch_executor()
+    scheduler_executor.shutdown()
+    if schedule_store is not None:
+        schedule_store.close()
+        schedule_store = None
+
 # Initialize the FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+async def publish_metrics():
+    """Shares this worker's metrics with the other workers of serve.py."""
+    try:
+        await asyncio.to_thread(shared_state.publish_metrics, snapshot_metrics())
+    except Exception as e:
+        logging.warning(f"[SHARED] Failed to publish metrics: {e}")
+
+async def publish_metrics_periodically():
+    while True:
+        await asyncio.sleep(SHARED_STATE_FLUSH_SECONDS)
+        await publish_metrics()
+
+async def worker_metrics() -> list:
+    """Metric snapshots of the other workers (empty when running a single process)."""
+    if shared_state is None:
+        return []
+    await publish_metrics()
+    try:
+        return await asyncio.to_thread(shared_state.other_metrics)
+    except Exception as e:
+        logging.warning(f"[SHARED] Failed to read worker metrics: {e}")
+        return []
+
+# Counters owned by other components, read when /metrics is scraped
+CACHE_LOOKUPS = GaugeCallback(
+    "studybuddy_llm_cache_lookups", "LLM response cache lookups by result.",
+    lambda: {("hit",): response_cache.hits, ("miss",): response_cache.misses} if response_cache is not None else {},
+    ["result"]
+)
+GaugeCallback(
+    "studybuddy_llm_singleflight_calls", "OpenAI calls that led a request or joined an in-flight one.",
+    lambda: {("leader",): singleflight_counters["leaders"], ("deduplicated",): singleflight_counters["deduplicated"]},
+    ["role"]
+)
+GaugeCallback(
+    "studybuddy_scheduler_executor_jobs", "Rule-based engine jobs currently pending, and rejected in total.",
+    lambda: {("pending",): scheduler_executor.pending, ("rejected",): scheduler_executor.rejected},
+    ["state"]
+)
+GaugeCallback(
+    "studybuddy_llm_queue", "OpenAI concurrency slots in use, and calls and users waiting for one.",
+    lambda: {("active",): openai_queue.active, ("waiting",): openai_queue.depth, ("waiting_users",): openai_queue.waiting_users()},
+    ["state"]
+)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Records the latency of every request by route template and status code."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, path=path, status=response.status_code)
+    return response
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    """Tells clients to back off when the rule-based engine is at capacity."""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(BatchTooLarge)
+async def batch_too_large_handler(request: Request, exc: BatchTooLarge):
+    """Rejects batches over BATCH_MAX_ITEMS; clients should split them."""
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    """Tells a client that has used up its AI allowance when to come back."""
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))})
 
 @app.get("/ping")
 def ping():
     """A simple endpoint to check if the server is running."""
     return {"message": "pong"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Exposes latency histograms and counters in the Prometheus text format.
+    Under serve.py with several workers, values are summed over all workers.
+    """
+    others = await worker_metrics()
+    return PlainTextResponse(render_metrics(others), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Returns hit/miss counters for the LLM response cache and coalesced requests.
+    Under serve.py with several workers, hits and misses are summed over all workers.
+    """
+    stats = await asyncio.to_thread(response_cache.stats) if response_cache is not None else {"backend": "none"}
+    stats["singleflight"] = dict(singleflight_counters)
+    others = await worker_metrics()
+    if others and response_cache is not None:
+        lookups = {key[0]: value for key, value in CACHE_LOOKUPS.merge([CACHE_LOOKUPS.snapshot()] + [o.get(CACHE_LOOKUPS.name, []) for o in others])}
+        stats["hits"], stats["misses"] = lookups.get("hit", 0), lookups.get("miss", 0)
+        stats["hit_rate"] = stats["hits"] / (stats["hits"] + stats["misses"]) if stats["hits"] + stats["misses"] else 0.0
+        stats["workers"] = len(others) + 1
+    return stats
+
+# Schedule endpoints take ?format=full|compact; see serialization.py
+ResponseFormat = Annotated[Literal["full", "compact"], Query(alias="format")]
+AIScheduleMode = Literal["full", "hybrid", "speculative"]
+
+async def persist_schedule(response: ScheduleResponse):
+    """
+    Stores a generated schedule off the event loop. Endpoints run it as a
+    background task after the response is sent; storage errors are only logged.
+    """
+    if schedule_store is None:
+        return
+    try:
+        with STAGE_SECONDS.time(stage="store_write"):
+            await asyncio.to_thread(schedule_store.save_schedule, response)
+    except Exception as e:
+        logging.warning(f"[STORE] Failed to persist schedule for user_id={response.user_id}: {e}")
+
 @app.post("/generate_schedule", response_model=ScheduleResponse)
-def schedule(request: StudyRequest):
+async def schedule(request: StudyRequest, background_tasks: BackgroundTasks, response_format: ResponseFormat = "full"):
     """
     Generates a schedule using a deterministic, rule-based engine.
-    This endpoint is stateless and purely computational.
+    The engine runs on the bounded scheduler executor and returns 503 when it is
+    saturated; the result is persisted to the schedule store when one is configured.
+    Pass `?format=compact` to list each task once and reference it from the sessions.
     """
     logging.info(f"Received Rule-Based StudyRequest: user_id={request.user_id}")
     # Basic validation of the request payload
-    if not request.available_slots:
-        raise HTTPException(status_code=400, detail="No available time slots provided.")
-    if not request.tasks:
-        raise HTTPException(status_code=400, detail="No tasks provided for scheduling.")
-    return generate_schedule(request)
+    error = validate_request(request)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    with STAGE_SECONDS.time(stage="rule_based"):
+        response = await scheduler_executor.run(generate_schedule, request)
+    background_tasks.add_task(persist_schedule, response)
+    return schedule_response(response, response_format)
+
+@app.post("/reschedule", response_model=ScheduleResponse)
+async def reschedule_endpoint(request: RescheduleRequest, background_tasks: BackgroundTasks, response_format: ResponseFormat = "full"):
+    """
+    Patches a previous rule-based schedule with added, removed or changed tasks
+    and slots. Sessions before the first affected one are returned unchanged.
+    Tasks the previous schedule left unscheduled are not retried unless they are
+    sent again in `delta.added_tasks`.
+    """
+    logging.info(f"Received RescheduleRequest: user_id={request.user_id}, kept={len(request.previous.sessions)} sessions")
+    with STAGE_SECONDS.time(stage="reschedule"):
+        response = await scheduler_executor.run(reschedule, request)
+    background_tasks.add_task(persist_schedule, response)
+    return schedule_response(response, response_format)
+
+@app.get("/schedules/{user_id}", response_model=List[Session])
+async def stored_sessions(
+    user_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    days: int = Query(7, ge=1),
+    limit: int = Query(SCHEDULE_QUERY_LIMIT, ge=1, le=SCHEDULE_QUERY_LIMIT)
+):
+    """
+    Returns a user's stored sessions starting in [start, end) without regenerating
+    the schedule. Defaults to the next `days` days from now.
+    """
+    if schedule_store is None:
+        raise HTTPException(status_code=404, detail="Schedule storage is disabled.")
+    start = start or datetime.now()
+    end = end or start + timedelta(days=days)
+    with STAGE_SECONDS.time(stage="store_read"):
+        return await asyncio.to_thread(schedule_store.get_sessions, user_id, start, end, limit)
+
+@app.post("/generate_schedule/batch")
+async def schedule_batch(request: Request):
+    """
+    Schedules many StudyRequests in one call using the rule-based engine.
+    Accepts a JSON array, or an NDJSON stream with Content-Type application/x-ndjson.
+    Streams back one NDJSON line per item in completion order, tagged with the item's
+    input index and holding either a `response` (ScheduleResponse) or an `error`.
+    Batches over BATCH_MAX_ITEMS requests are rejected with 413.
+    """
+    if "ndjson" in request.headers.get("content-type", ""):
+        items = iter_ndjson(request.stream())
+    else:
+        try:
+            items = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Request body must be a JSON array of StudyRequests.")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Request body must be a JSON array of StudyRequests.")
+        if len(items) > BATCH_MAX_ITEMS:
+            raise BatchTooLarge(BATCH_MAX_ITEMS)
+    logging.info("Received batch StudyRequest")
+    # The body must be consumed before streaming starts, since the response listens on the same channel
+    pending = await submit_batch(items, max_items=BATCH_MAX_ITEMS)
+
+    async def lines():
+        async for result in iter_completed(pending):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+async def llm_sessions(request: StudyRequest) -> ValidationResult:
+    """
+    Asks the LLM to schedule `request`, then parses and validates its reply:
+    overlapping sessions, sessions outside the available slots or past their
+    due date are repaired or dropped, see validation.py. Raises RateLimited
+    when the user is over their AI rate limit.
+    """
+    with STAGE_SECONDS.time(stage="prompt_build"):
+        prompts = build_schedule_prompts(request)
+    # The token is only taken once the LLM is really going to be asked
+    await rate_limiter.check(request.user_id)
+    with STAGE_SECONDS.time(stage="llm_call"):
+        replies = await asyncio.gather(*(call_openai_api(prompt, user_id=request.user_id) for prompt in prompts))
+    
+    if not all(isinstance(reply, list) for reply in replies):
+        raise ValueError("Invalid response format from OpenAI API.")
+    gpt_response = [item for reply in replies for item in reply]
+
+    with STAGE_SECONDS.time(stage="parse_llm_response"):
+        result = validate_llm_sessions(gpt_response, request)
+    logging.info(f"Parsed {len(result.sessions)} sessions from GPT response")
+    if result.diagnostics:
+        logging.warning(f"[VALIDATE] {len(result.diagnostics)} issues in GPT response: {'; '.join(d.message for d in result.diagnostics)}")
+    return result
+
+async def hybrid_schedule(request: StudyRequest) -> ScheduleResponse:
+    """
+    Places what the rule-based engine can, then asks the LLM to fit only the
+    remaining tasks into the remaining free time and merges both plans.
+    """
+    with STAGE_SECONDS.time(stage="rule_based"):
+        placements, unscheduled, _ = await scheduler_executor.run(run_strategy, request)
+    rule_sessions = placements_to_sessions(placements)
+    remainder = remainder_request(request, placements, unscheduled)
+    if not unscheduled or not remainder.available_slots:
+        logging.info(f"[HYBRID] Rules placed {len(placements)} sessions, nothing left for the LLM")
+        AI_SCHEDULES.inc(result="rules")
+        return merge_schedules(request, rule_sessions, remainder, [])
+
+    logging.info(f"[HYBRID] Sending {len(unscheduled)} of {len(request.tasks)} tasks to the LLM")
+    result = await llm_sessions(remainder)
+    with STAGE_SECONDS.time(stage="merge"):
+        response = merge_schedules(request, rule_sessions, remainder, result.sessions, result.diagnostics)
+    AI_SCHEDULES.inc(result="hybrid")
+    return response
+
+async def ai_schedule(request: StudyRequest) -> ScheduleResponse:
+    """Schedules the whole request with the LLM."""
+    result = await llm_sessions(request)
+    sessions = result.sessions
+
+    # Calculate metrics and format the response to send back to the client
+    total_study_time = sum(s.task.duration_minutes for s in sessions)
+    total_break_time = sum(s.break_after for s in sessions if s.break_after)
+    warnings = [f"AI did not schedule task: '{t.title}'" for t in result.unscheduled]
+
+    return ScheduleResponse(
+        user_id=request.user_id,
+        sessions=sessions,
+        total_study_time=total_study_time,
+        total_break_time=total_break_time,
+        success=not result.unscheduled,
+        message="Schedule generated by AI.",
+        warnings=warnings,
+        diagnostics=result.diagnostics or None
+    )
+
+def note_rate_limited(response: ScheduleResponse):
+    """Marks a rule-based schedule as the answer to a rate-limited AI schedule request."""
+    logging.info(f"[RATE LIMIT] user_id={response.user_id} over the AI limit, using rule-based scheduling")
+    LLM_RATE_LIMITED.inc(endpoint="generate_ai_schedule")
+    AI_SCHEDULES.inc(result="rate_limited")
+    response.warnings.append("AI request limit reached. Using rule-based scheduling.")
+
+# LLM calls that outlived their request's deadline; referenced so they are not garbage collected
+_late_ai_tasks = set()
+
+def _finish_late_ai_task(task: asyncio.Task):
+    _late_ai_tasks.discard(task)
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logging.info(f"[SPECULATIVE] Late AI schedule failed: {task.exception()}")
+    else:
+        # call_openai_api has cached the reply, so the next identical request gets it in time
+        AI_SCHEDULES.inc(result="late")
+        logging.info("[SPECULATIVE] Late AI schedule finished and cached")
+
+async def speculative_schedule(request: StudyRequest, deadline: Optional[float] = None) -> ScheduleResponse:
+    """
+    Runs the rule-based engine and the LLM at the same time. Returns the AI
+    schedule if a valid one is ready within `deadline` seconds (default
+    AI_DEADLINE_SECONDS), otherwise the rule-based schedule. A late LLM call
+    keeps running so its reply is cached for the next identical request.
+    """
+    deadline = AI_DEADLINE_SECONDS if deadline is None else deadline
+    rules = asyncio.ensure_future(scheduler_executor.run(generate_schedule, request))
+    ai = asyncio.ensure_future(ai_schedule(request))
+    with STAGE_SECONDS.time(stage="speculative_wait"):
+        done, _ = await asyncio.wait({ai}, timeout=deadline)
+
+    if ai in done and ai.exception() is None and ai.result().sessions:
+        rules.cancel()
+        AI_SCHEDULES.inc(result="ai")
+        return ai.result()
+
+    with STAGE_SECONDS.time(stage="rule_based"):
+        response = await rules
+    if ai in done and isinstance(ai.exception(), RateLimited):
+        note_rate_limited(response)
+    elif ai in done:
+        reason = ai.exception() or "no valid sessions"
+        logging.warning(f"[SPECULATIVE] AI scheduling failed: {reason}. Using rule-based schedule.")
+        AI_SCHEDULES.inc(result="fallback")
+        response.warnings.append("AI scheduling failed. Using rule-based fallback.")
+        response.success = False
+    else:
+        logging.info(f"[SPECULATIVE] No AI schedule within {deadline:g}s, returning rule-based schedule")
+        AI_SCHEDULES.inc(result="deadline")
+        _late_ai_tasks.add(ai)
+        ai.add_done_callback(_finish_late_ai_task)
+        response.warnings.append(f"AI schedule was not ready within {deadline:g}s. Using rule-based schedule.")
+    return response
 
 @app.post("/generate_ai_schedule", response_model=ScheduleResponse)
-async def generate_ai_schedule(request: StudyRequest):
+async def generate_ai_schedule(request: StudyRequest, background_tasks: BackgroundTasks, response_format: ResponseFormat = "full", mode: AIScheduleMode = AI_SCHEDULE_MODE):
     """
     Generates a schedule using the OpenAI API.
-    This endpoint is stateless and falls back to the rule-based engine on failure.
+    With `?mode=hybrid` the rule-based engine runs first and only the tasks it could
+    not place are sent to the LLM. With `?mode=speculative` both run at once and the
+    rule-based schedule is returned if the AI misses the AI_DEADLINE_SECONDS deadline.
+    Falls back to the rule-based engine on failure, and answers with the rule-based
+    engine when the user is over their AI rate limit. A rate limit token is only
+    taken when the LLM is called, so hybrid requests the rules fully answer do
+    not use one. The result is persisted like /generate_schedule.
     """
+    # Prompts and validation work on slot objects, so recurring availability is materialized here
+    request = with_expanded_slots(request)
     try:
-        logging.info(f"[START] /generate_ai_schedule for user_id={request.user_id}")
-        prompt = format_schedule_prompt(request)
-        gpt_response = await call_openai_api(prompt)
-        
-        if not isinstance(gpt_response, list):
-            raise ValueError("Invalid response format from OpenAI API.")
-
-        sessions = parse_llm_response(gpt_response)
-        logging.info(f"Parsed {len(sessions)} sessions from GPT response")
-
-        # Calculate metrics and format the response to send back to the client
-        total_study_time = sum(s.task.duration_minutes for s in sessions)
-        total_break_time = sum(s.break_after for s in sessions if s.break_after)
-        scheduled_titles = {s.task.title for s in sessions}
-        unscheduled_tasks = [t for t in request.tasks if t.title not in scheduled_titles]
-        warnings = [f"AI did not schedule task: '{t.title}'" for t in unscheduled_tasks]
-
-        logging.info(f"[DONE] Schedule generated with {len(warnings)} warnings")
-        return ScheduleResponse(
-            user_id=request.user_id,
-            sessions=sessions,
-            total_study_time=total_study_time,
-            total_break_time=total_break_time,
-            success=not unscheduled_tasks,
-            message="Schedule generated by AI.",
-            warnings=warnings
-        )
+        logging.info(f"[START] /generate_ai_schedule for user_id={request.user_id} mode={mode}")
+        if mode == "speculative":
+            response = await speculative_schedule(request)
+        elif mode == "hybrid":
+            response = await hybrid_schedule(request)
+        else:
+            response = await ai_schedule(request)
+            AI_SCHEDULES.inc(result="ai")
+        logging.info(f"[DONE] Schedule generated with {len(response.warnings)} warnings")
+    except RateLimited:
+        with STAGE_SECONDS.time(stage="rule_based"):
+            response = await scheduler_executor.run(generate_schedule, request)
+        note_rate_limited(response)
     except Exception as e:
         logging.warning(f"[FALLBACK] AI scheduling failed: {e}. Using rule-based scheduling.")
-        fallback_response = generate_schedule(request)
+        AI_SCHEDULES.inc(result="fallback")
+        with STAGE_SECONDS.time(stage="fallback"):
+            fallback_response = await scheduler_executor.run(generate_schedule, request)
         fallback_response.warnings.append("AI scheduling failed. Using rule-based fallback.")
         fallback_response.success = False
-        return fallback_response
+        response = fallback_response
+    background_tasks.add_task(persist_schedule, response)
+    return schedule_response(response, response_format)
 
 class ChatPrompt(BaseModel):
     """The data model for a chat request from the client."""
     user_id: int
     message: str
-    context: Optional[str] = "" # Context is provided by the client
+    context: Optional[str] = "" # Extra context from the client; history is kept server-side
+
+async def check_chat_rate_limit(prompt: ChatPrompt, endpoint: str):
+    """Raises RateLimited (429) when the user is over their AI rate limit."""
+    try:
+        await rate_limiter.check(str(prompt.user_id))
+    except RateLimited:
+        LLM_RATE_LIMITED.inc(endpoint=endpoint)
+        raise
+
+async def chat_context(prompt: ChatPrompt) -> str:
+    """
+    Builds the context of a chat prompt from the client's context (clipped), a
+    digest of the user's stored schedule and the server-side conversation memory.
+    """
+    user_id = str(prompt.user_id)
+    digest = ""
+    if schedule_store is not None:
+        start = datetime.now()
+        try:
+            with STAGE_SECONDS.time(stage="store_read"):
+                sessions = await asyncio.to_thread(schedule_store.get_sessions, user_id, start, start + timedelta(days=CHAT_DIGEST_DAYS))
+            digest = schedule_digest(sessions)
+        except Exception as e:
+            logging.warning(f"[STORE] Failed to read schedule digest for user_id={user_id}: {e}")
+    context = chat_memory.context(user_id, digest)
+    if prompt.context:
+        context = clip_tokens(prompt.context, CHAT_CLIENT_CONTEXT_TOKENS) + "\n\n" + context
+    return context
 
 @app.post("/chat")
 async def chat(prompt: ChatPrompt):
     """
     Handles chat requests by forwarding them to the OpenAI API.
-    This endpoint is stateless.
+    Earlier turns are remembered per user on the server, so the client only sends
+    the new message. Returns 429 when the user is over their AI rate limit.
     """
+    await check_chat_rate_limit(prompt, "chat")
     try:
-        final_prompt = format_chat_prompt(prompt.message, prompt.context)
-        gpt_response = await call_openai_api(final_prompt)
+        final_prompt = format_chat_prompt(prompt.message, await chat_context(prompt))
+        gpt_response = await call_openai_api(final_prompt, user_id=str(prompt.user_id))
+        chat_memory.record(str(prompt.user_id), prompt.message, describe_reply(gpt_response))
         return {"response": gpt_response}
     except Exception as e:
         logging.error(f"[CHAT ERROR] {e}")
         raise HTTPException(status_code=500, detail="Error processing chat request")
+
+@app.delete("/chat/{user_id}")
+def reset_chat(user_id: int):
+    """Forgets the server-side conversation of a user."""
+    return {"cleared": chat_memory.reset(str(user_id))}
+
+def sse_event(event: str, data) -> str:
+    """Formats a Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(prompt: ChatPrompt):
+    """
+    Streams a chat reply as Server-Sent Events.
+    Emits `token` events with text deltas, a `session` event for each scheduled session
+    as soon as it is complete in the reply, and a final `done` (or `error`) event.
+    """
+    await check_chat_rate_limit(prompt, "chat_stream")
+    final_prompt = format_chat_prompt(prompt.message, await chat_context(prompt))
+
+    async def events():
+        parser = IncrementalSessionParser()
+        session_count = 0
+        reply = []
+        try:
+            async for text in stream_openai_api(final_prompt, user_id=str(prompt.user_id)):
+                reply.append(text)
+                yield sse_event("token", {"text": text})
+                for item in parser.feed(text):
+                    for session in parse_llm_response([item]):
+                        session_count += 1
+                        yield sse_event("session", session.model_dump(mode="json"))
+            chat_memory.record(str(prompt.user_id), prompt.message, "".join(reply))
+            yield sse_event("done", {"sessions": session_count})
+        except Exception as e:
+            logging.error(f"[CHAT STREAM ERROR] {e}")
+            yield sse_event("error", {"detail": "Error processing chat request"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,130 @@
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterator, List, Optional, Tuple, Union
+from dotenv import load_dotenv
+from models import StudyRequest, TimeSlot
+
+load_dotenv()  # Load environment variables from .env file
+
+# Recurring availability settings, see docs/setup-python-backend.md
+AVAILABILITY_MAX_DAYS = int(os.getenv("AVAILABILITY_MAX_DAYS", "366")) # Rules are never expanded further ahead than this
+DEFAULT_ENERGY_LEVEL = 2 # Stands in for listed slots sent without an energy level when slots are materialized
+
+ONE_DAY = timedelta(days=1)
+
+# (start, end, energy level or None when the request sent none)
+SlotTuple = Tuple[datetime, datetime, Optional[int]]
+
+def as_aware(moment: datetime) -> datetime:
+    """`moment` with naive datetimes read as UTC, like columnar.to_micros, so naive and aware values compare."""
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+def clip_to(moment: datetime, like: datetime) -> datetime:
+    """`moment` expressed in the timezone of `like` (naive UTC when `like` is naive)."""
+    if like.tzinfo is None:
+        return as_aware(moment).astimezone(timezone.utc).replace(tzinfo=None)
+    return as_aware(moment).astimezone(like.tzinfo)
+
+def rule_slots(request: StudyRequest, now: Union[date, datetime, None] = None) -> Iterator[SlotTuple]:
+    """
+    Lazily expands `request.availability` into slots, day by day and in
+    start order within a day, from now (or each rule's later starts_on) up
+    to the latest task due date, at most AVAILABILITY_MAX_DAYS ahead.
+    Windows that have ended by `now` are skipped and the one in progress
+    starts at `now`. `now` defaults to the current time; a date stands for
+    its midnight.
+    """
+    if not request.availability or not request.tasks:
+        return
+    if now is None:
+        now = datetime.now(timezone.utc)
+    elif not isinstance(now, datetime):
+        now = datetime.combine(now, time.min)
+    cutoff = as_aware(now)
+    # Yesterday's windows may run past midnight into today
+    earliest = now.date() - ONE_DAY
+    horizon = max((task.due_date for task in request.tasks), key=as_aware).date()
+    windows = []
+    # Wall-clock order, so rules with and without a UTC offset can be mixed
+    for rule in sorted(request.availability, key=lambda rule: rule.start.replace(tzinfo=None)):
+        # Past days are never offered, so a rule that started long ago is expanded from now
+        first = max(rule.starts_on, earliest) if rule.starts_on else earliest
+        last = min(horizon, first + timedelta(days=AVAILABILITY_MAX_DAYS), rule.ends_on or horizon)
+        length = datetime.combine(date.min, rule.end.replace(tzinfo=None)) - datetime.combine(date.min, rule.start.replace(tzinfo=None))
+        if length <= timedelta(0):
+            length += ONE_DAY # The window runs past midnight
+        windows.append((first, last, set(rule.weekdays), set(rule.except_dates), rule.start, length, rule.energy_level))
+
+    day = min(window[0] for window in windows)
+    end = max(window[1] for window in windows)
+    while day <= end:
+        weekday = day.weekday()
+        for first, last, weekdays, skipped, start, length, level in windows:
+            if first <= day <= last and weekday in weekdays and day not in skipped:
+                begin = datetime.combine(day, start)
+                finish = begin + length
+                if as_aware(finish) <= cutoff:
+                    continue
+                if as_aware(begin) < cutoff:
+                    begin = clip_to(now, begin)
+                yield begin, finish, level
+        day += ONE_DAY
+
+def merge_overlapping(slots: List[SlotTuple]) -> List[SlotTuple]:
+    """
+    Sorts slots by start and merges the ones that overlap, since the engines
+    assume slots do not. A merged slot keeps the lowest energy level among
+    its parts (None only when none of them had one).
+    """
+    merged: List[SlotTuple] = []
+    for start, end, level in sorted(slots, key=lambda slot: as_aware(slot[0])):
+        if merged and as_aware(start) < as_aware(merged[-1][1]):
+            first, last, kept = merged[-1]
+            levels = [value for value in (kept, level) if value is not None]
+            merged[-1] = (first, max(last, end, key=as_aware), min(levels) if levels else None)
+        else:
+            merged.append((start, end, level))
+    return merged
+
+def slot_stream(request: StudyRequest, now: Union[date, datetime, None] = None) -> Iterator[SlotTuple]:
+    """
+    All slots of a request. Without availability rules these are the listed
+    available_slots in request order. With rules, the listed and expanded
+    slots are sorted by start and overlapping ones merged (see
+    merge_overlapping), so a rule repeating a listed slot is not booked twice.
+    Slot indices used by the engines refer to this order.
+    """
+    levels = request.energy_level
+    listed = [
+        (slot.start_time, slot.end_time, levels[i] if i < len(levels) else None)
+        for i, slot in enumerate(request.available_slots)
+    ]
+    if not request.availability:
+        return iter(listed)
+    return iter(merge_overlapping(listed + list(rule_slots(request, now))))
+
+def with_expanded_slots(request: StudyRequest, now: Union[date, datetime, None] = None) -> StudyRequest:
+    """
+    Returns `request` with its availability rules materialized into
+    available_slots and energy_level, for the code paths that need slot
+    objects (optimizer, AI prompts and validation). When the request mixes
+    naive and timezone-aware times, e.g. a rule with a UTC offset and naive
+    due dates, the naive ones are made UTC so they can be compared. Other
+    requests without rules are returned as they are.
+    """
+    moments = [slot.start_time for slot in request.available_slots] + [rule.start for rule in request.availability] + [task.due_date for task in request.tasks]
+    mixed = len({moment.tzinfo is None for moment in moments}) > 1
+    if not request.availability and not mixed:
+        return request
+    slots: List[TimeSlot] = []
+    energy: List[int] = []
+    for start, end, level in slot_stream(request, now):
+        if mixed:
+            start, end = as_aware(start), as_aware(end)
+        # Expanded from validated rules, so the slots are built without validating them again
+        slots.append(TimeSlot.model_construct(start_time=start, end_time=end))
+        energy.append(DEFAULT_ENERGY_LEVEL if level is None else level)
+    tasks = request.tasks
+    if mixed:
+        tasks = [task if task.due_date.tzinfo else task.model_copy(update={"due_date": as_aware(task.due_date)}) for task in tasks]
+    return request.model_copy(update={"available_slots": slots, "energy_level": energy, "availability": [], "tasks": tasks})
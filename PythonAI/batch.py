@@ -0,0 +1,181 @@
+import os
+import json
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, AsyncIterator, Iterable, Iterator, List, Optional, Tuple, Union
+from pydantic import ValidationError
+from ai_model import generate_schedule, validate_request
+from models import StudyRequest
+from offload import new_process_pool
+
+# Batch scheduling settings, see docs/setup-python-backend.md
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "0")) or None # None uses one worker per CPU
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "64"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000")) # Larger batches are rejected with 413
+BATCH_MAX_INFLIGHT_CHUNKS = int(os.getenv("BATCH_MAX_INFLIGHT_CHUNKS", "8")) # Chunks queued or running in the pool, over all batches
+
+_batch_executor: Optional[ProcessPoolExecutor] = None
+_batch_slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+
+class BatchTooLarge(Exception):
+    """Raised when a batch holds more than the allowed number of items."""
+
+    def __init__(self, max_items: int = BATCH_MAX_ITEMS):
+        super().__init__(f"Batch holds more than {max_items} requests.")
+        self.max_items = max_items
+
+def schedule_chunk(chunk: List[Tuple[int, Any]]) -> List[dict]:
+    """
+    Schedules a chunk of requests inside a worker process.
+
+    Each payload may be a StudyRequest, a dict or a raw JSON string, so parsing
+    and validation happen in the worker rather than the server process.
+    Returns one result per item: {"index", "response"} or {"index", "error"}.
+    """
+    results = []
+    for index, payload in chunk:
+        try:
+            if isinstance(payload, (str, bytes)):
+                payload = json.loads(payload)
+            request = payload if isinstance(payload, StudyRequest) else StudyRequest.model_validate(payload)
+            error = validate_request(request)
+            if error:
+                results.append({"index": index, "error": error})
+                continue
+            results.append({"index": index, "response": generate_schedule(request).model_dump(mode="json")})
+        except (ValueError, ValidationError) as e:
+            results.append({"index": index, "error": str(e)})
+        except Exception as e:
+            logging.error(f"[BATCH ERROR] Item {index} failed: {e}")
+            results.append({"index": index, "error": "Error processing schedule request"})
+    return results
+
+def chunked(items: Iterable[Any], chunk_size: int) -> Iterator[List[Tuple[int, Any]]]:
+    """Groups items into lists of (index, item) tuples of at most `chunk_size`."""
+    chunk = []
+    for index, item in enumerate(items):
+        chunk.append((index, item))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def schedule_batch(
+    requests: Iterable[Union[StudyRequest, dict, str]],
+    workers: Optional[int] = BATCH_WORKERS,
+    chunk_size: int = BATCH_CHUNK_SIZE
+) -> Iterator[dict]:
+    """
+    Schedules many requests across a process pool.
+
+    Args:
+        requests: StudyRequests, dicts or JSON strings to schedule.
+        workers: Number of worker processes (default: one per CPU).
+        chunk_size: Number of requests sent to a worker at a time.
+
+    Yields:
+        dict: Per-item results in completion order, tagged with the item's input index.
+    """
+    with new_process_pool(workers) as executor:
+        futures = [executor.submit(schedule_chunk, chunk) for chunk in chunked(requests, chunk_size)]
+        for future in as_completed(futures):
+            yield from future.result()
+
+def get_batch_executor() -> ProcessPoolExecutor:
+    """Returns the app-lifetime process pool used by the batch endpoint."""
+    global _batch_executor
+    if _batch_executor is None:
+        _batch_executor = new_process_pool(BATCH_WORKERS)
+    return _batch_executor
+
+def get_batch_slots() -> asyncio.Semaphore:
+    """Returns the semaphore bounding the chunks in the pool, created on the running loop."""
+    global _batch_slots
+    loop = asyncio.get_running_loop()
+    if _batch_slots is None or _batch_slots[0] is not loop:
+        _batch_slots = (loop, asyncio.Semaphore(BATCH_MAX_INFLIGHT_CHUNKS))
+    return _batch_slots[1]
+
+def shutdown_batch_executor():
+    """Shuts down the batch process pool, if it was started."""
+    global _batch_executor
+    if _batch_executor is not None:
+        _batch_executor.shutdown(cancel_futures=True)
+        _batch_executor = None
+
+async def submit_batch(
+    items: Union[Iterable[Any], AsyncIterator[Any]],
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    max_items: int = BATCH_MAX_ITEMS
+) -> List[asyncio.Future]:
+    """
+    Reads items and dispatches them to the shared process pool in chunks while
+    the input is still arriving. Returns the futures of the submitted chunks.
+
+    At most BATCH_MAX_INFLIGHT_CHUNKS chunks are in the pool at once over all
+    batches; further chunks wait for a free slot, which in turn stops reading
+    a streamed body. Raises BatchTooLarge past `max_items` items, after
+    cancelling the chunks that have not started.
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_batch_executor()
+    slots = get_batch_slots()
+    pending = []
+    chunk = []
+    index = 0
+
+    async def submit(chunk: List[Tuple[int, Any]]):
+        await slots.acquire()
+        future = loop.run_in_executor(executor, schedule_chunk, chunk)
+        future.add_done_callback(lambda _: slots.release())
+        pending.append(future)
+
+    async def source():
+        if hasattr(items, "__aiter__"):
+            async for item in items:
+                yield item
+        else:
+            for item in items:
+                yield item
+
+    try:
+        async for item in source():
+            if index >= max_items:
+                raise BatchTooLarge(max_items)
+            chunk.append((index, item))
+            index += 1
+            if len(chunk) >= chunk_size:
+                await submit(chunk)
+                chunk = []
+        if chunk:
+            await submit(chunk)
+    except BaseException:
+        for future in pending:
+            future.cancel()
+        raise
+    return pending
+
+async def iter_completed(pending: List[asyncio.Future]) -> AsyncIterator[dict]:
+    """Yields per-item results of submitted chunks in completion order."""
+    for future in asyncio.as_completed(pending):
+        for result in await future:
+            yield result
+
+async def schedule_batch_async(items: Union[Iterable[Any], AsyncIterator[Any]], chunk_size: int = BATCH_CHUNK_SIZE) -> AsyncIterator[dict]:
+    """Async variant of schedule_batch on the shared process pool."""
+    async for result in iter_completed(await submit_batch(items, chunk_size)):
+        yield result
+
+async def iter_ndjson(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Splits a byte stream into non-empty NDJSON lines."""
+    buffer = b""
+    async for data in stream:
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line.decode("utf-8")
+    if buffer.strip():
+        yield buffer.decode("utf-8")
@@ -0,0 +1,443 @@
+"""
+Benchmark harness for the scheduling engine, prompt formatting, LLM response
+parsing, end-to-end endpoint throughput, service cold starts and multi-worker scaling.
+
+Run from the PythonAI folder:
+    python benchmark.py --output bench.json
+    python benchmark.py --sizes 10 100 1000 --compare bench.json
+
+Results are written as JSON so runs from different commits can be compared.
+"""
+import os
+import sys
+import json
+import socket
+import time
+import tracemalloc
+import random
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import urllib.request
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from unittest.mock import patch
+from models import ScheduleResponse, StudyRequest, TaskSchema, TimeSlot
+from ai_model import generate_schedule, format_schedule_prompt, build_schedule_prompts
+from prompting import estimate_tokens
+from ratelimit import RateLimiter
+from serialization import schedule_response
+from utils import parse_llm_response
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+FULL_SIZES = [10, 100, 1000, 10000, 100000]
+BASE_TIME = datetime(2025, 9, 1, 8, 0)
+CATEGORIES = ["Math", "History", "Science", "Writing", "Languages", None]
+
+def make_study_request(num_tasks: int, num_slots: int, seed: int = 0, skew: float = 3.0, strategy: str = "pack") -> StudyRequest:
+    """
+    Builds a reproducible synthetic StudyRequest.
+
+    Slots are 30-180 minute windows separated by 1-12 hour gaps, each with a
+    random energy level. Due dates are skewed towards the start of the plan:
+    a higher `skew` puts more tasks close to the first slots.
+    """
+    rng = random.Random(seed)
+    slots = []
+    cursor = BASE_TIME
+    for _ in range(num_slots):
+        cursor += timedelta(hours=rng.randint(1, 12))
+        end = cursor + timedelta(minutes=rng.randint(30, 180))
+        slots.append(TimeSlot(start_time=cursor, end_time=end))
+        cursor = end
+    horizon_minutes = max(int((cursor - BASE_TIME).total_seconds() / 60), 1)
+
+    tasks = []
+    for i in range(num_tasks):
+        offset = int(horizon_minutes * rng.random() ** skew)
+        tasks.append(TaskSchema(
+            title=f"Task {i}",
+            due_date=BASE_TIME + timedelta(minutes=offset + 60),
+            duration_minutes=rng.choice([15, 25, 30, 45, 60, 90, 120]),
+            category=rng.choice(CATEGORIES)
+        ))
+    return StudyRequest(
+        user_id=f"bench_{seed}",
+        energy_level=[rng.randint(1, 3) for _ in range(num_slots)],
+        available_slots=slots,
+        tasks=tasks,
+        strategy=strategy
+    )
+
+def make_llm_response(num_sessions: int, seed: int = 0) -> List[dict]:
+    """Builds a synthetic structured LLM response with `num_sessions` session dicts."""
+    rng = random.Random(seed)
+    items = []
+    cursor = BASE_TIME
+    for i in range(num_sessions):
+        end = cursor + timedelta(minutes=rng.choice([25, 30, 45]))
+        items.append({"task": f"Task {i}", "start": cursor.isoformat(), "end": end.isoformat(), "category": rng.choice(CATEGORIES[:-1])})
+        cursor = end + timedelta(minutes=5)
+    return items
+
+def summarize(timings: List[float]) -> Dict[str, float]:
+    """Summary statistics of timings in seconds."""
+    return {
+        "repeats": len(timings),
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.fmean(timings)
+    }
+
+def measure(fn: Callable, repeats: int) -> Dict[str, float]:
+    """Times `fn` over `repeats` runs and returns summary statistics in seconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+def peak_memory_mb(fn: Callable) -> float:
+    """Peak memory allocated by one run of `fn`, in MB. Run apart from the timings, as tracing slows it down."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+def bench_engine(sizes: List[int], repeats: int) -> List[dict]:
+    results = []
+    for strategy in ("pack", "edd", "pomodoro", "optimize"):
+        for num_tasks in sizes:
+            for num_slots in sizes:
+                request = make_study_request(num_tasks, num_slots, strategy=strategy)
+                stats = measure(lambda: generate_schedule(request), repeats)
+                stats["peak_mb"] = peak_memory_mb(lambda: generate_schedule(request))
+                results.append({"name": "generate_schedule", "params": {"strategy": strategy, "tasks": num_tasks, "slots": num_slots}, **stats})
+    return results
+
+def bench_prompt(sizes: List[int], repeats: int) -> List[dict]:
+    results = []
+    for size in sizes:
+        request = make_study_request(size, size)
+        stats = measure(lambda: format_schedule_prompt(request), repeats)
+        tokens = estimate_tokens(format_schedule_prompt(request))
+        results.append({"name": "format_schedule_prompt", "params": {"tasks": size, "slots": size}, "tokens": tokens, **stats})
+        stats = measure(lambda: build_schedule_prompts(request, "compact"), repeats)
+        prompts = build_schedule_prompts(request, "compact")
+        results.append({
+            "name": "build_schedule_prompts",
+            "params": {"format": "compact", "tasks": size, "slots": size},
+            "prompts": len(prompts),
+            "tokens": sum(estimate_tokens(p) for p in prompts),
+            **stats
+        })
+    return results
+
+def bench_parse(sizes: List[int], repeats: int) -> List[dict]:
+    results = []
+    for size in sizes:
+        items = make_llm_response(size)
+        stats = measure(lambda: parse_llm_response(items), repeats)
+        results.append({"name": "parse_llm_response", "params": {"sessions": size}, **stats})
+    return results
+
+def make_schedule_response(num_sessions: int, num_tasks: int, seed: int = 0) -> ScheduleResponse:
+    """Builds a ScheduleResponse with `num_sessions` sessions spread over `num_tasks` tasks."""
+    items = make_llm_response(num_sessions, seed)
+    for i, item in enumerate(items):
+        item["task"] = f"Task {i % num_tasks}"
+    sessions = parse_llm_response(items)
+    by_title = {}
+    for session in sessions:
+        session.task = by_title.setdefault(session.task.title, session.task) # Sessions of a task share its TaskSchema
+    return ScheduleResponse(
+        user_id=f"bench_{seed}",
+        sessions=sessions,
+        total_study_time=sum(s.task.duration_minutes for s in sessions),
+        total_break_time=sum(s.break_after for s in sessions)
+    )
+
+def bench_serialize(sizes: List[int], repeats: int) -> List[dict]:
+    """
+    Compares today's response path (dump, re-validate through response_model,
+    json.dumps) with direct serialization of the full and compact formats.
+    Sessions come in Pomodoro-sized blocks, four per task.
+    """
+    results = []
+    for size in sizes:
+        response = make_schedule_response(size, max(size // 4, 1))
+
+        def validated() -> bytes:
+            content = ScheduleResponse.model_validate(response.model_dump())
+            return json.dumps(content.model_dump(mode="json")).encode("utf-8")
+
+        variants = {
+            "validated": validated,
+            "full": lambda: schedule_response(response, "full").body,
+            "compact": lambda: schedule_response(response, "compact").body
+        }
+        for name, fn in variants.items():
+            stats = measure(fn, repeats)
+            results.append({"name": "serialize_response", "params": {"format": name, "sessions": size}, "bytes": len(fn()), **stats})
+    return results
+
+async def drive_requests(client, path: str, payload: dict, requests: int, concurrency: int) -> Dict[str, float]:
+    """Sends `requests` POSTs with at most `concurrency` in flight; returns throughput and latency percentiles."""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(path, json=payload)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "elapsed_s": elapsed,
+        "throughput_rps": requests / elapsed,
+        "p50_s": latencies[len(latencies) // 2],
+        "p99_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    }
+
+def bench_endpoints(requests: int = 200, concurrency: int = 16, size: int = 50) -> List[dict]:
+    """Measures end-to-end throughput through an in-process ASGI client with OpenAI mocked out."""
+    import httpx
+    import logging
+    from app import app
+
+    root_logger = logging.getLogger()
+    log_level = root_logger.level
+
+    payload = json.loads(make_study_request(size, size).model_dump_json())
+    llm_response = make_llm_response(size)
+
+    async def fake_call_openai_api(prompt: str, *args, **kwargs) -> List[dict]:
+        return llm_response
+
+    async def drive(path: str) -> Dict[str, float]:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await drive_requests(client, path, payload, requests, concurrency)
+
+    results = []
+    root_logger.setLevel(logging.WARNING) # Keep per-request logging out of the measurement
+    try:
+        # One synthetic user sends every request, so the per-user rate limit is lifted
+        with patch("app.call_openai_api", fake_call_openai_api), patch("app.rate_limiter", RateLimiter(per_minute=0)):
+            for path in ("/generate_schedule", "/generate_ai_schedule"):
+                stats = asyncio.run(drive(path))
+                results.append({"name": f"endpoint {path}", "params": {"tasks": size, "slots": size, "concurrency": concurrency}, **stats})
+    finally:
+        root_logger.setLevel(log_level)
+    return results
+
+def resident_memory_mb(pid: int) -> Optional[float]:
+    """Resident set size of a process in MB, from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def wait_for_ping(port: int, server: subprocess.Popen, start: float, timeout: float = 30.0):
+    """Polls /ping until the server answers."""
+    while True:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ping", timeout=1) as response:
+                response.read()
+            return
+        except OSError:
+            if server.poll() is not None or time.perf_counter() - start > timeout:
+                raise RuntimeError(f"Server did not answer /ping (exit code {server.poll()})")
+            time.sleep(0.005)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def cold_start(warmup: str) -> Dict[str, Optional[float]]:
+    """
+    Starts one uvicorn worker serving app.py and returns the time until its
+    first /ping answer and its resident memory at that point.
+    """
+    port = free_port()
+    env = {**os.environ, "LLM_WARMUP": warmup}
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=here, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_ping(port, server, start)
+        return {"first_ping_s": time.perf_counter() - start, "rss_mb": resident_memory_mb(server.pid)}
+    finally:
+        server.terminate()
+        server.wait()
+
+def import_time(module: str = "app") -> float:
+    """Seconds a fresh interpreter takes to import `module`."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def bench_startup(sizes: List[int], repeats: int, warmups: tuple = ("none", "startup")) -> List[dict]:
+    """Cold starts per LLM_WARMUP mode: import time, time to first /ping and memory per worker."""
+    results = []
+    imports = [import_time() for _ in range(repeats)]
+    results.append({"name": "import_app", "params": {}, **summarize(imports)})
+    for warmup in warmups:
+        runs = [cold_start(warmup) for _ in range(repeats)]
+        rss = [r["rss_mb"] for r in runs if r["rss_mb"] is not None]
+        results.append({
+            "name": "cold_start",
+            "params": {"warmup": warmup},
+            "rss_mb": statistics.median(rss) if rss else None,
+            **summarize([r["first_ping_s"] for r in runs])
+        })
+    return results
+
+def bench_scaling(sizes: List[int], repeats: int, workers: Optional[List[int]] = None, requests: int = 400, concurrency: int = 32) -> List[dict]:
+    """
+    Throughput of /generate_schedule served by serve.py with 1 to N workers
+    (default: powers of two up to the CPU count), over real HTTP.
+    """
+    import httpx
+
+    cpus = os.cpu_count() or 1
+    workers = workers or sorted({min(2 ** i, cpus) for i in range(cpus.bit_length() + 1)})
+    size = min(max(sizes), 200) if sizes else 200 # Big enough for the engine to outweigh the HTTP overhead
+    payload = json.loads(make_study_request(size, size).model_dump_json())
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    baseline = None
+    for count in workers:
+        port = free_port()
+        env = {**os.environ, "SCHEDULE_STORE": "none", "SHARED_STATE_PATH": os.path.join(here, "bench_shared_state.db")}
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(count), "--port", str(port), "--log-level", "warning"],
+            cwd=here, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_for_ping(port, server, start)
+
+            async def run() -> Dict[str, float]:
+                async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+                    await drive_requests(client, "/generate_schedule", payload, concurrency, concurrency) # Warm every worker
+                    return await drive_requests(client, "/generate_schedule", payload, requests, concurrency)
+
+            stats = asyncio.run(run())
+        finally:
+            server.terminate()
+            server.wait()
+        baseline = baseline or stats["throughput_rps"]
+        results.append({
+            "name": "scaling /generate_schedule",
+            "params": {"workers": count, "tasks": size, "slots": size, "concurrency": concurrency},
+            "speedup": stats["throughput_rps"] / baseline,
+            "cpus": cpus,
+            **stats
+        })
+    return results
+
+SUITES = {
+    "engine": bench_engine,
+    "prompt": bench_prompt,
+    "parse": bench_parse,
+    "serialize": bench_serialize,
+    "startup": bench_startup,
+    "scaling": bench_scaling,
+}
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run_benchmarks(suites: List[str], sizes: List[int], repeats: int, endpoints: bool = True) -> dict:
+    """Runs the selected suites and returns the JSON-serializable report."""
+    results = []
+    for suite in suites:
+        results.extend(SUITES[suite](sizes, repeats))
+    if endpoints:
+        results.extend(bench_endpoints())
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "repeats": repeats
+        },
+        "results": results
+    }
+
+def result_key(result: dict) -> str:
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """Returns a line per benchmark that got more than `threshold` times slower, or bigger in peak memory, than the baseline."""
+    previous = {result_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get(result_key(result))
+        if before is not None and before.get("peak_mb") and result.get("peak_mb", 0) / before["peak_mb"] > threshold:
+            regressions.append(f"{result['name']} {result['params']}: peak memory {before['peak_mb']:.2f}MB -> {result['peak_mb']:.2f}MB")
+        metric = "median_s" if "median_s" in result else "p50_s"
+        if before is None or not before.get(metric):
+            continue
+        ratio = result[metric] / before[metric]
+        if ratio > threshold:
+            regressions.append(f"{result['name']} {result['params']}: {before[metric]:.6f}s -> {result[metric]:.6f}s ({ratio:.2f}x)")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the StudyBuddy scheduling backend.")
+    parser.add_argument("--suites", nargs="+", choices=list(SUITES), default=list(SUITES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="Task and slot counts; the engine suite runs every tasks x slots pair")
+    parser.add_argument("--full", action="store_true", help="Use sizes up to 100k")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-endpoints", action="store_true", help="Skip the ASGI endpoint throughput run")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio that counts as a regression")
+    args = parser.parse_args(argv)
+
+    sizes = FULL_SIZES if args.full else args.sizes
+    report = run_benchmarks(args.suites, sizes, args.repeats, endpoints=not args.no_endpoints)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
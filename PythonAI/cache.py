@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Optional
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, MetaData, Table, Column, String, Text, Float, select, update, delete, func
+from sqlalchemy.dialects.sqlite import insert
+from utils import configure_sqlite
+
+load_dotenv()  # Load environment variables from .env file
+
+# Response cache settings, see docs/setup-python-backend.md
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory") # "memory", "sqlite" or "none"
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600")) # Seconds before an entry expires
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+
+def cache_key(prompt: str, **params) -> str:
+    """
+    Returns a content-addressed key for a prompt and its model parameters.
+    Parameters are serialized with sorted keys so equal requests hash equally.
+    """
+    canonical = json.dumps({"prompt": prompt, "params": params}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class MemoryCache:
+    """In-process LRU cache with per-entry TTL."""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl: float = LLM_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: Any):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any):
+        self.set(key, value)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+class SQLiteCache:
+    """On-disk LRU cache with per-entry TTL, stored in SQLite through SQLAlchemy."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl: float = LLM_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 10})
+        event.listen(self.engine, "connect", configure_sqlite) # Shared by the workers of serve.py
+        metadata = MetaData()
+        self.table = Table(
+            "llm_cache", metadata,
+            Column("key", String(64), primary_key=True),
+            Column("value", Text, nullable=False),
+            Column("expires_at", Float, nullable=False),
+            Column("accessed_at", Float, nullable=False, index=True)
+        )
+        metadata.create_all(self.engine)
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self.engine.begin() as conn:
+            row = conn.execute(select(self.table.c.value, self.table.c.expires_at).where(self.table.c.key == key)).first()
+            if row is None or row.expires_at < now:
+                if row is not None:
+                    conn.execute(delete(self.table).where(self.table.c.key == key))
+                self.misses += 1
+                return None
+            conn.execute(update(self.table).where(self.table.c.key == key).values(accessed_at=now))
+        self.hits += 1
+        return json.loads(row.value)
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        values = {"key": key, "value": json.dumps(value), "expires_at": now + self.ttl, "accessed_at": now}
+        with self.engine.begin() as conn:
+            conn.execute(insert(self.table).values(**values).on_conflict_do_update(index_elements=["key"], set_=values))
+            count = conn.execute(select(func.count()).select_from(self.table)).scalar()
+            if count > self.max_entries:
+                oldest = select(self.table.c.key).order_by(self.table.c.accessed_at).limit(count - self.max_entries)
+                conn.execute(delete(self.table).where(self.table.c.key.in_(oldest)))
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """Like get, but runs the SQLite read off the event loop."""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any):
+        """Like set, but runs the SQLite write off the event loop."""
+        await asyncio.to_thread(self.set, key, value)
+
+    def clear(self):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table))
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        with self.engine.connect() as conn:
+            entries = conn.execute(select(func.count()).select_from(self.table)).scalar()
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+def create_cache(backend: str = LLM_CACHE_BACKEND):
+    """Returns the configured cache backend, or None when caching is disabled."""
+    if backend == "none" or LLM_CACHE_TTL <= 0:
+        return None
+    if backend == "sqlite":
+        try:
+            return SQLiteCache()
+        except Exception as e:
+            logging.warning(f"[CACHE] SQLite cache unavailable ({e}), using in-memory cache")
+    return MemoryCache()
+
+response_cache = create_cache()
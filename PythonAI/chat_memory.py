@@ -0,0 +1,133 @@
+import os
+import re
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Tuple
+from dotenv import load_dotenv
+from models import Session
+from prompting import estimate_tokens
+
+load_dotenv()  # Load environment variables from .env file
+
+# Chat memory settings, see docs/setup-python-backend.md
+CHAT_MEMORY_MAX_USERS = int(os.getenv("CHAT_MEMORY_MAX_USERS", "1000"))
+CHAT_MEMORY_TURNS = int(os.getenv("CHAT_MEMORY_TURNS", "6")) # Recent exchanges kept verbatim
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300")) # Budget for the summary of older turns
+CHAT_TURN_TOKENS = 150 # A verbatim turn is clipped to this many tokens
+CHAT_SUMMARY_LINE_TOKENS = 30 # An older turn is condensed to this many tokens
+CHAT_DIGEST_TASKS = 8 # Tasks listed in the schedule digest
+CHAT_DIGEST_DAYS = 7 # Days of upcoming sessions covered by the digest
+CHAT_CLIENT_CONTEXT_TOKENS = 300 # Context sent by the client is clipped to this many tokens
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def clip_tokens(text: str, budget: int) -> str:
+    """Shortens `text` to about `budget` tokens, cutting at a word boundary."""
+    text = " ".join(text.split())
+    if estimate_tokens(text) <= budget:
+        return text
+    words = text.split(" ")
+    low, high = 0, len(words) # Longest word prefix that fits, found by bisection
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(" ".join(words[:mid])) + 1 <= budget:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low]) + "…"
+
+def condense_turn(role: str, text: str) -> str:
+    """One summary line for an older turn: its first sentence, clipped."""
+    first = _SENTENCE_END.split(" ".join(text.split()), maxsplit=1)[0]
+    return f"{role}: {clip_tokens(first, CHAT_SUMMARY_LINE_TOKENS)}"
+
+def describe_reply(reply: Any) -> str:
+    """Text stored for an assistant reply; session lists are shortened to titles and times."""
+    if isinstance(reply, list):
+        sessions = [
+            f"{item.get('task')} {item.get('start', '')[:16]}" for item in reply if isinstance(item, dict)
+        ]
+        return "Suggested sessions: " + "; ".join(sessions) if sessions else "No sessions suggested."
+    return str(reply)
+
+def schedule_digest(sessions: List[Session], max_tasks: int = CHAT_DIGEST_TASKS) -> str:
+    """
+    Compact digest of a stored schedule: one line per task with its number of
+    upcoming sessions, total minutes, next session and due date.
+    """
+    tasks: Dict[str, list] = {}
+    for s in sorted(sessions, key=lambda s: s.start_time):
+        entry = tasks.get(s.task.title)
+        if entry is None:
+            entry = tasks[s.task.title] = [0, 0, s.start_time, s.task.due_date]
+        entry[0] += 1
+        entry[1] += int((s.end_time - s.start_time).total_seconds() / 60)
+    lines = [
+        f"- {title}: {count} sessions, {minutes} min, next {start:%a %m-%d %H:%M}, due {due:%m-%d %H:%M}"
+        for title, (count, minutes, start, due) in list(tasks.items())[:max_tasks]
+    ]
+    if len(tasks) > max_tasks:
+        lines.append(f"- and {len(tasks) - max_tasks} more tasks")
+    return "\n".join(lines)
+
+@dataclass
+class ChatSession:
+    """Conversation state of one user: recent turns verbatim, older ones condensed."""
+    turns: Deque[Tuple[str, str]] = field(default_factory=deque)
+    summary: Deque[str] = field(default_factory=deque)
+    summary_tokens: int = 0
+
+class ChatMemory:
+    """
+    Server-side chat history per user, in an LRU map of at most `max_users`
+    sessions. Each session keeps the last `window` turns verbatim; turns that
+    fall out of the window are condensed into summary lines, and the oldest
+    summary lines are dropped past `summary_tokens`, so the context built for
+    a prompt stays bounded however long the conversation runs.
+    """
+
+    def __init__(self, max_users: int = CHAT_MEMORY_MAX_USERS, window: int = CHAT_MEMORY_TURNS, summary_tokens: int = CHAT_SUMMARY_TOKENS):
+        self.max_users = max_users
+        self.window = window
+        self.summary_tokens = summary_tokens
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def _session(self, user_id: str) -> ChatSession:
+        session = self.sessions.get(user_id)
+        if session is None:
+            session = self.sessions[user_id] = ChatSession()
+            if len(self.sessions) > self.max_users:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(user_id)
+        return session
+
+    def record(self, user_id: str, message: str, reply: str):
+        """Adds one exchange to the user's history."""
+        session = self._session(user_id)
+        session.turns.append(("User", clip_tokens(message, CHAT_TURN_TOKENS)))
+        session.turns.append(("Assistant", clip_tokens(reply, CHAT_TURN_TOKENS)))
+        while len(session.turns) > 2 * self.window:
+            line = condense_turn(*session.turns.popleft())
+            session.summary.append(line)
+            session.summary_tokens += estimate_tokens(line)
+        while session.summary_tokens > self.summary_tokens and session.summary:
+            session.summary_tokens -= estimate_tokens(session.summary.popleft())
+
+    def context(self, user_id: str, digest: str = "") -> str:
+        """Builds the prompt context: schedule digest, summary of older turns, then recent turns."""
+        session = self.sessions.get(user_id)
+        parts = []
+        if digest:
+            parts.append("The user's upcoming study schedule:\n" + digest)
+        if session is not None and session.summary:
+            parts.append("Earlier in this conversation (condensed):\n" + "\n".join(session.summary))
+        if session is not None and session.turns:
+            parts.append("Recent conversation:\n" + "\n".join(f"{role}: {text}" for role, text in session.turns))
+        return "\n\n".join(parts)
+
+    def reset(self, user_id: str) -> bool:
+        """Forgets a user's conversation. Returns whether there was one."""
+        return self.sessions.pop(user_id, None) is not None
+
+chat_memory = ChatMemory()
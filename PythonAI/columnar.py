@@ -0,0 +1,122 @@
+from array import array
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from availability import slot_stream
+from models import Session, StudyRequest, TaskSchema
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = EPOCH.replace(tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+MINUTE = 60_000_000 # Column time units per minute
+
+def to_micros(moment: datetime) -> int:
+    """Epoch microseconds of `moment`; naive datetimes are read as UTC."""
+    return (moment - (EPOCH if moment.tzinfo is None else EPOCH_UTC)) // MICROSECOND
+
+def encode(values: Iterable[Optional[int]]) -> Tuple[array, List[int]]:
+    """
+    Categorical encoding: a code per value into the list of distinct values,
+    in first-seen order, and -1 for None.
+    """
+    categories: Dict[int, int] = {}
+    codes = array("h", [-1 if value is None else categories.setdefault(value, len(categories)) for value in values])
+    return codes, list(categories)
+
+class RequestColumns:
+    """
+    Struct-of-arrays view of a StudyRequest for the scheduling engines.
+
+    Slot and task times are int64 epoch microseconds and durations are int64
+    minutes, so the engines compare and add plain ints instead of datetimes
+    and pydantic attributes. Each slot's energy level is a categorical code
+    into `energy_levels`, or -1 when the request sent none for it.
+
+    Slots are read from slot_stream, so recurring availability rules are
+    expanded straight into the arrays without building TimeSlot models.
+    `slot_origin` keeps each slot's start datetime for the output.
+    """
+
+    __slots__ = ("request", "slot_start", "slot_end", "slot_origin", "slot_energy", "energy_levels", "slot_order", "task_due", "task_duration", "task_order")
+
+    def __init__(self, request: StudyRequest, now: Union[date, datetime, None] = None):
+        self.request = request
+        self.slot_start = array("q")
+        self.slot_end = array("q")
+        self.slot_origin: List[datetime] = []
+        levels: List[Optional[int]] = []
+        for start, end, level in slot_stream(request, now):
+            self.slot_start.append(to_micros(start))
+            self.slot_end.append(to_micros(end))
+            self.slot_origin.append(start)
+            levels.append(level)
+        self.slot_energy, self.energy_levels = encode(levels)
+        self.slot_order = array("q", sorted(range(len(levels)), key=self.slot_start.__getitem__))
+        self.task_due = array("q", [to_micros(t.due_date) for t in request.tasks])
+        self.task_duration = array("q", [t.duration_minutes for t in request.tasks])
+        self.task_order = array("q", sorted(range(len(request.tasks)), key=self.task_due.__getitem__))
+
+class PlacementColumns:
+    """
+    Engine output as parallel arrays with one entry per placement: the task
+    and original slot index, start and end in epoch microseconds and the
+    energy-adjusted minutes. `unscheduled` holds the skipped task indices.
+    """
+
+    __slots__ = ("columns", "break_after", "task", "slot", "start", "end", "minutes", "unscheduled")
+
+    def __init__(self, columns: RequestColumns, break_after: int):
+        self.columns = columns
+        self.break_after = break_after
+        self.task = array("q")
+        self.slot = array("q")
+        self.start = array("q")
+        self.end = array("q")
+        self.minutes = array("q")
+        self.unscheduled = array("q")
+
+    def __len__(self) -> int:
+        return len(self.task)
+
+    def add(self, task: int, slot: int, start: int, end: int, minutes: int):
+        self.task.append(task)
+        self.slot.append(slot)
+        self.start.append(start)
+        self.end.append(end)
+        self.minutes.append(minutes)
+
+    def truncate(self, size: int):
+        """Drops the placements added after the first `size`."""
+        for column in (self.task, self.slot, self.start, self.end, self.minutes):
+            del column[size:]
+
+    def sort_by_start(self):
+        """Reorders the placements by start time; ties keep their order."""
+        order = sorted(range(len(self)), key=self.start.__getitem__)
+        for name in ("task", "slot", "start", "end", "minutes"):
+            column = getattr(self, name)
+            setattr(self, name, array("q", [column[i] for i in order]))
+
+    def times(self) -> Iterable[Tuple[int, int, datetime, datetime]]:
+        """
+        Yields (task index, slot index, start, end) per placement as datetimes,
+        offset from the slot's own start so they keep its timezone.
+        """
+        origins = self.columns.slot_origin
+        slot_start = self.columns.slot_start
+        for task, slot, start, end in zip(self.task, self.slot, self.start, self.end):
+            origin = origins[slot]
+            base = slot_start[slot]
+            yield task, slot, origin + timedelta(microseconds=start - base), origin + timedelta(microseconds=end - base)
+
+    def to_sessions(self) -> List[Session]:
+        """Builds the Sessions; the only place engine output becomes pydantic models."""
+        tasks = self.columns.request.tasks
+        # Placements come from validated requests, so models are built without validating them again
+        return [
+            Session.model_construct(task=tasks[task], start_time=start, end_time=end, break_after=self.break_after)
+            for task, _, start, end in self.times()
+        ]
+
+    def unscheduled_tasks(self) -> List[TaskSchema]:
+        tasks = self.columns.request.tasks
+        return [tasks[t] for t in self.unscheduled]
@@ -0,0 +1,70 @@
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from models import ScheduleResponse, Session, SessionDiagnostic, StudyRequest, TaskSchema, TimeSlot
+from scheduler import Placement
+
+MIN_FREE_MINUTES = 10 # Free intervals shorter than this are not offered to the LLM
+
+def free_intervals(request: StudyRequest, placements: List[Placement], min_minutes: int = MIN_FREE_MINUTES) -> Tuple[List[TimeSlot], List[int]]:
+    """
+    Returns the parts of the available slots not taken by `placements` (or the
+    break after them), sorted by start time, with each part's energy level.
+    """
+    busy: Dict[int, List[Placement]] = defaultdict(list)
+    for p in placements:
+        busy[p.slot_index].append(p)
+
+    parts: List[Tuple[TimeSlot, int]] = []
+    minimum = timedelta(minutes=min_minutes)
+    for i, slot in enumerate(request.available_slots):
+        energy = request.energy_level[i] if i < len(request.energy_level) else 2
+        cursor = slot.start_time
+        for p in sorted(busy.get(i, []), key=lambda p: p.start_time):
+            if p.start_time - cursor >= minimum:
+                parts.append((TimeSlot(start_time=cursor, end_time=p.start_time), energy))
+            cursor = max(cursor, p.end_time + timedelta(minutes=p.break_after))
+        if slot.end_time - cursor >= minimum:
+            parts.append((TimeSlot(start_time=cursor, end_time=slot.end_time), energy))
+    parts.sort(key=lambda part: part[0].start_time)
+    return [slot for slot, _ in parts], [energy for _, energy in parts]
+
+def remainder_request(request: StudyRequest, placements: List[Placement], unscheduled: List[TaskSchema]) -> StudyRequest:
+    """Builds the request sent to the LLM: only the unscheduled tasks and the time left over."""
+    slots, energy = free_intervals(request, placements)
+    return StudyRequest(
+        user_id=request.user_id,
+        energy_level=energy,
+        pomodoro_length=request.pomodoro_length,
+        available_slots=slots,
+        tasks=unscheduled
+    )
+
+def merge_schedules(
+    request: StudyRequest,
+    rule_sessions: List[Session],
+    remainder: StudyRequest,
+    llm_sessions: List[Session],
+    diagnostics: Optional[List[SessionDiagnostic]] = None
+) -> ScheduleResponse:
+    """
+    Merges the rule-based sessions with the LLM sessions for the remainder,
+    which must already be validated against `remainder` (see validation.py).
+    LLM sessions are re-attached to the original TaskSchema.
+    """
+    tasks = {task.title: task for task in remainder.tasks}
+    accepted = [s.model_copy(update={"task": tasks[s.task.title]}) for s in llm_sessions]
+    sessions = sorted(rule_sessions + accepted, key=lambda s: s.start_time)
+    scheduled_titles = {s.task.title for s in sessions}
+    unscheduled = [t for t in remainder.tasks if t.title not in scheduled_titles]
+    warnings = [f"AI did not schedule task: '{t.title}'" for t in unscheduled]
+    return ScheduleResponse(
+        user_id=request.user_id,
+        sessions=sessions,
+        total_study_time=sum(round((s.end_time - s.start_time).total_seconds() / 60) for s in sessions),
+        total_break_time=sum(s.break_after for s in sessions if s.break_after),
+        success=not unscheduled,
+        message="Schedule generated by rules with AI for the remaining tasks.",
+        warnings=warnings,
+        diagnostics=diagnostics or None
+    )
@@ -0,0 +1,181 @@
+"""
+Load test of the AI endpoints over real HTTP against the local LLM stand-in.
+
+Run from the PythonAI folder:
+    python loadtest.py --requests 200 --concurrency 16 --latency lognormal:0.5,0.5 --error-rate 0.05 --malformed-rate 0.05
+    python loadtest.py --path /chat/stream --latency fixed:0.2 --stream-delay 0.02
+
+Starts mock_llm.py and one app worker whose OpenAI client points at it
+(OPENAI_BASE_URL), so the real SDK, connection pool, timeouts and retries are
+exercised. It then sends distinct requests to the chosen endpoint and prints
+throughput, p50/p99 latency, the fallback rate and what the stand-in
+injected, as JSON. Response caching and the per-user rate limit are off,
+so every request reaches the stand-in.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from benchmark import free_port, make_study_request, wait_for_ping
+from mock_llm import MockConfig, add_mock_arguments, config_from_args, mock_arguments
+
+PATHS = ("/generate_ai_schedule", "/chat", "/chat/stream")
+
+# Warnings the app adds when it answers an AI schedule request without the AI
+FALLBACK_WARNINGS = {
+    "AI scheduling failed. Using rule-based fallback.": "fallback",
+    "AI request limit reached. Using rule-based scheduling.": "rate_limited"
+}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+@contextmanager
+def running(command: List[str], port: int, env: Optional[Dict[str, str]] = None) -> Iterator[subprocess.Popen]:
+    """Starts a server process and stops it on exit, once it answers /ping."""
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_ping(port, server, start)
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
+
+def app_environment(mock_port: int, openai_timeout: float, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Environment of the app worker under test."""
+    return {
+        **os.environ,
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+        "OPENAI_API_KEY": "mock",
+        "OPENAI_TIMEOUT": str(openai_timeout),
+        "LLM_CACHE_BACKEND": "none",
+        "LLM_RATE_LIMIT_PER_MINUTE": "0",
+        "SCHEDULE_STORE": "none",
+        "SHARED_STATE": "none",
+        **(extra or {})
+    }
+
+def make_payloads(path: str, requests: int, size: int) -> List[dict]:
+    """Distinct payloads, so no two requests share a prompt and none is coalesced."""
+    if path == "/generate_ai_schedule":
+        return [json.loads(make_study_request(size, size, seed=i).model_dump_json()) for i in range(requests)]
+    return [{"user_id": i, "message": f"I need to study chapter {i} for an hour tonight"} for i in range(requests)]
+
+def classify(path: str, status: int, body: str) -> str:
+    """Outcome of one response: "ai", "fallback", "rate_limited", "late" or "error"."""
+    if status != 200:
+        return "error"
+    if path == "/chat/stream":
+        return "error" if "event: error" in body else "ai"
+    if path == "/chat":
+        return "ai"
+    warnings = json.loads(body).get("warnings") or []
+    for warning in warnings:
+        if warning in FALLBACK_WARNINGS:
+            return FALLBACK_WARNINGS[warning]
+        if warning.startswith("AI schedule was not ready"):
+            return "late"
+    return "ai"
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+async def drive(base_url: str, path: str, payloads: List[dict], concurrency: int, params: Dict[str, str]) -> dict:
+    """Sends every payload with at most `concurrency` in flight and summarizes the responses."""
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    outcomes: Counter = Counter()
+
+    async def one(client: httpx.AsyncClient, payload: dict):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload, params=params)
+                outcome = classify(path, response.status_code, response.text)
+            except httpx.HTTPError:
+                outcome = "error"
+            latencies.append(time.perf_counter() - start)
+            outcomes[outcome] += 1
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, payload) for payload in payloads))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    total = len(payloads)
+    return {
+        "requests": total,
+        "elapsed_s": elapsed,
+        "throughput_rps": total / elapsed,
+        "p50_s": percentile(latencies, 0.5),
+        "p99_s": percentile(latencies, 0.99),
+        "fallback_rate": (total - outcomes["ai"]) / total,
+        "error_rate": outcomes["error"] / total,
+        "outcomes": dict(outcomes)
+    }
+
+def run_load(
+    path: str = "/generate_ai_schedule",
+    requests: int = 100,
+    concurrency: int = 16,
+    size: int = 20,
+    mode: str = "full",
+    config: Optional[MockConfig] = None,
+    openai_timeout: float = 5.0,
+    app_env: Optional[Dict[str, str]] = None
+) -> dict:
+    """
+    Runs one load test and returns its report. `fallback_rate` counts every
+    response not produced by the AI: rule-based fallbacks, speculative
+    answers past the deadline and errors.
+    """
+    config = config or MockConfig()
+    mock_port, app_port = free_port(), free_port()
+    params = {"mode": mode} if path == "/generate_ai_schedule" else {}
+    payloads = make_payloads(path, requests, size)
+    mock_command = [sys.executable, "mock_llm.py", "--port", str(mock_port), *mock_arguments(config)]
+    app_command = [sys.executable, "-m", "uvicorn", "app:app", "--port", str(app_port), "--log-level", "warning"]
+    with running(mock_command, mock_port):
+        with running(app_command, app_port, app_environment(mock_port, openai_timeout, app_env)):
+            report = asyncio.run(drive(f"http://127.0.0.1:{app_port}", path, payloads, concurrency, params))
+        with urllib.request.urlopen(f"http://127.0.0.1:{mock_port}/mock/stats", timeout=5) as response:
+            injected = json.loads(response.read())
+    return {
+        "name": f"load {path}",
+        "params": {"mode": mode if params else None, "tasks": size, "concurrency": concurrency, "openai_timeout": openai_timeout, **vars(config)},
+        "mock": injected,
+        **report
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the AI endpoints against the local LLM stand-in.")
+    parser.add_argument("--path", choices=PATHS, default="/generate_ai_schedule")
+    parser.add_argument("--mode", choices=("full", "hybrid", "speculative"), default="full", help="?mode= of /generate_ai_schedule")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--size", type=int, default=20, help="Tasks and slots per schedule request")
+    parser.add_argument("--openai-timeout", type=float, default=5.0, help="OPENAI_TIMEOUT of the app under test")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    report = run_load(args.path, args.requests, args.concurrency, args.size, args.mode, config_from_args(args), args.openai_timeout)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
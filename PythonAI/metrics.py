@@ -0,0 +1,175 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond engine runs to slow completions
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["Metric"] = []
+
+def _format_labels(labelnames: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Metric:
+    """Base class for metrics exposed in the Prometheus text format."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def snapshot(self) -> List[list]:
+        """Current values as JSON-serializable [label values, value...] rows."""
+        raise NotImplementedError
+
+    def merge(self, snapshots: Iterable[List[list]]) -> List[list]:
+        """Adds up snapshots of this metric taken in several worker processes."""
+        merged: Dict[Tuple, list] = {}
+        for rows in snapshots:
+            for key, *values in rows:
+                key = tuple(key)
+                total = merged.get(key)
+                merged[key] = values if total is None else [_add(a, b) for a, b in zip(total, values)]
+        return [[list(key), *values] for key, values in merged.items()]
+
+    def samples(self, rows: Optional[List[list]] = None) -> List[str]:
+        raise NotImplementedError
+
+    def render(self, rows: Optional[List[list]] = None) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self.samples(rows))
+
+class Counter(Metric):
+    """A monotonically increasing value, optionally split by labels."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def snapshot(self) -> List[list]:
+        return [[list(key), value] for key, value in self.values.items()]
+
+    def samples(self, rows: Optional[List[list]] = None) -> List[str]:
+        rows = self.snapshot() if rows is None else rows
+        return [f"{self.name}{_format_labels(self.labelnames, tuple(key))} {value}" for key, value in rows]
+
+class Histogram(Metric):
+    """
+    Fixed-bucket histogram. Observing costs one bisect and two additions;
+    cumulative bucket counts are only computed when rendering.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple, list] = {} # key -> [per-bucket counts (+Inf last), sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self.series.get(self._key(labels))
+        return series[2] if series else 0
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall-clock duration of the enclosed block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> List[list]:
+        return [[list(key), list(counts), total, count] for key, (counts, total, count) in self.series.items()]
+
+    def samples(self, rows: Optional[List[list]] = None) -> List[str]:
+        lines = []
+        for key, counts, total, count in (self.snapshot() if rows is None else rows):
+            key = tuple(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, f'le="{le}"')} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class GaugeCallback(Metric):
+    """A gauge whose labelled values are read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Dict[Tuple, float]], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def snapshot(self) -> List[list]:
+        return [[list(key), value] for key, value in self.callback().items()]
+
+    def samples(self, rows: Optional[List[list]] = None) -> List[str]:
+        rows = self.snapshot() if rows is None else rows
+        return [f"{self.name}{_format_labels(self.labelnames, tuple(key))} {value}" for key, value in rows]
+
+def _add(a, b):
+    return [x + y for x, y in zip(a, b)] if isinstance(a, list) else a + b
+
+def snapshot_metrics() -> Dict[str, List[list]]:
+    """Values of every registered metric in this process, in a JSON-serializable form."""
+    return {metric.name: metric.snapshot() for metric in _registry}
+
+def cumulative_only(snapshot: Dict[str, List[list]]) -> Dict[str, List[list]]:
+    """The counters and histograms of a snapshot, the values that still add up after their worker has exited."""
+    kinds = {metric.name: metric.kind for metric in _registry}
+    return {name: rows for name, rows in snapshot.items() if kinds.get(name) in ("counter", "histogram")}
+
+def render_metrics(others: Iterable[Dict[str, List[list]]] = ()) -> str:
+    """
+    Renders every registered metric in the Prometheus text exposition format.
+    Snapshots from other worker processes in `others` are added to this
+    process's values, so any worker can answer a scrape for all of them.
+    """
+    others = list(others)
+    if not others:
+        return "".join(metric.render() for metric in _registry)
+    return "".join(
+        metric.render(metric.merge([metric.snapshot()] + [other.get(metric.name, []) for other in others]))
+        for metric in _registry
+    )
+
+# Metrics shared by app.py and ai_model.py
+REQUEST_SECONDS = Histogram("studybuddy_http_request_duration_seconds", "HTTP request latency.", ["method", "path", "status"])
+STAGE_SECONDS = Histogram("studybuddy_stage_duration_seconds", "Latency of individual request stages.", ["stage"])
+OPENAI_REQUESTS = Counter("studybuddy_openai_requests_total", "OpenAI completion attempts by outcome.", ["outcome"])
+OPENAI_RETRIES = Counter("studybuddy_openai_retries_total", "OpenAI attempts that were retried.")
+OPENAI_TIMEOUTS = Counter("studybuddy_openai_timeouts_total", "OpenAI attempts that timed out.")
+OPENAI_TOKENS = Counter("studybuddy_openai_tokens_total", "Tokens reported in completion usage.", ["type"])
+AI_SCHEDULES = Counter("studybuddy_ai_schedule_requests_total", "AI schedule requests by result.", ["result"])
+LLM_RATE_LIMITED = Counter("studybuddy_llm_rate_limited_total", "AI requests over their user's rate limit, by endpoint.", ["endpoint"])
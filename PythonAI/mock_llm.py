@@ -0,0 +1,277 @@
+"""
+OpenAI-compatible stand-in for load testing the AI endpoints without calling OpenAI.
+
+Run from the PythonAI folder:
+    python mock_llm.py --port 9000 --latency lognormal:0.8,0.4 --error-rate 0.02 --malformed-rate 0.05
+
+and point the backend at it:
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=mock uvicorn app:app
+
+It serves POST /v1/chat/completions, streamed or not. Schedule prompts get a
+schedule computed from the slots and tasks in the prompt, and chat prompts get
+a short reply with two study blocks. Replies are deterministic: the latency
+and the fault injected into a request depend only on --seed, the prompt and
+how many times that prompt was seen before. GET /mock/stats reports what was
+injected so far.
+"""
+import re
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from prompting import estimate_tokens
+
+DEFAULT_BLOCK_MINUTES = 25
+BREAK_MINUTES = 5
+
+_COMPACT_DAY = re.compile(r"^(\d{4}-\d{2}-\d{2}): (.*)$")
+_COMPACT_WINDOW = re.compile(r"(\d{2}:\d{2})-(\d{2}:\d{2})")
+_VERBOSE_SLOT = re.compile(r"^- (\w+), (\w+ \d{2}) at (\d{2}:\d{2} [AP]M) to (\d{2}:\d{2} [AP]M)")
+_VERBOSE_TASK = re.compile(r"^- (.+), (\d+) min, due (\w+), (\w+ \d{2}), category: (.*)$")
+_BLOCK_LENGTH = re.compile(r"(?:session length of|sessions of about) (\d+) minutes")
+_TODAY = re.compile(r"Today's date is (\d{4}-\d{2}-\d{2})")
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parses a latency distribution in seconds: "fixed:S", "uniform:LOW,HIGH",
+    "lognormal:MEDIAN,SIGMA" or "exponential:MEAN".
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == "exponential" and len(values) == 1:
+        return lambda rng: rng.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution '{spec}'")
+
+@dataclass
+class MockConfig:
+    """Behaviour of the stand-in. Rates are probabilities per request and are drawn in this order."""
+    latency: str = "fixed:0.05" # Time to the reply, or to the first streamed token
+    error_rate: float = 0.0 # Answer with `error_status` instead of a completion
+    error_status: int = 500
+    timeout_rate: float = 0.0 # Hold the reply for `hang_seconds`, past the client's timeout
+    hang_seconds: float = 60.0
+    malformed_rate: float = 0.0 # Reply with a schedule that is not valid JSON
+    stream_chunk_chars: int = 16 # Characters per streamed chunk
+    stream_delay: float = 0.01 # Seconds between streamed chunks
+    seed: int = 0
+
+def _weekday_year(weekday: str, month_day: str, near: int) -> int:
+    """The year closest to `near` in which `month_day` (e.g. "June 09") falls on `weekday`."""
+    for offset in sorted(range(-10, 11), key=abs):
+        try:
+            if datetime.strptime(f"{month_day} {near + offset}", "%B %d %Y").strftime("%A") == weekday:
+                return near + offset
+        except ValueError: # February 29 in a non-leap year
+            continue
+    return near
+
+def parse_schedule_prompt(prompt: str) -> Tuple[int, List[Tuple[datetime, datetime]], List[dict]]:
+    """
+    Reads the block length, the slots and the tasks out of a verbose or compact
+    schedule prompt. Verbose prompts leave out the year; it is inferred from the weekday.
+    """
+    match = _BLOCK_LENGTH.search(prompt)
+    block = int(match.group(1)) if match else DEFAULT_BLOCK_MINUTES
+    slots: List[Tuple[datetime, datetime]] = []
+    tasks: List[dict] = []
+    categories: Dict[str, str] = {}
+    year = date.today().year
+    in_tasks = False
+    for line in prompt.splitlines():
+        if line.startswith("Categories: "):
+            categories = dict(item.split("=", 1) for item in line[len("Categories: "):].split("; ") if "=" in item)
+        elif line.startswith("Tasks"):
+            in_tasks = True
+        elif match := _COMPACT_DAY.match(line):
+            for start, end in _COMPACT_WINDOW.findall(match.group(2)):
+                slots.append((datetime.fromisoformat(f"{match.group(1)}T{start}"), datetime.fromisoformat(f"{match.group(1)}T{end}")))
+        elif match := _VERBOSE_SLOT.match(line):
+            weekday, month_day, start, end = match.groups()
+            day = datetime.strptime(f"{month_day} {_weekday_year(weekday, month_day, year)}", "%B %d %Y")
+            begin = datetime.combine(day.date(), datetime.strptime(start, "%I:%M %p").time())
+            finish = datetime.combine(day.date(), datetime.strptime(end, "%I:%M %p").time())
+            slots.append((begin, finish if finish > begin else finish + timedelta(days=1)))
+        elif in_tasks and line.count("|") == 3:
+            title, minutes, due, code = line.rsplit("|", 3)
+            tasks.append({"title": title, "minutes": int(minutes), "due": datetime.fromisoformat(due), "category": categories.get(code, code)})
+        elif in_tasks and (match := _VERBOSE_TASK.match(line)):
+            title, minutes, weekday, month_day, category = match.groups()
+            due = datetime.strptime(f"{month_day} {_weekday_year(weekday, month_day, year)}", "%B %d %Y") + timedelta(days=1)
+            tasks.append({"title": title, "minutes": int(minutes), "due": due, "category": category})
+    return block, slots, tasks
+
+def plan_sessions(block: int, slots: List[Tuple[datetime, datetime]], tasks: List[dict]) -> List[dict]:
+    """Greedy plan: each task, in due order, is split into blocks placed at the earliest free time before it is due."""
+    slots = sorted(slots)
+    cursors = [start for start, _ in slots]
+    sessions = []
+    for task in sorted(tasks, key=lambda t: t["due"]):
+        remaining = task["minutes"]
+        for i, (_, end) in enumerate(slots):
+            while remaining > 0:
+                length = min(block, remaining)
+                finish = cursors[i] + timedelta(minutes=length)
+                if finish > end or finish > task["due"]:
+                    break
+                sessions.append({"task": task["title"], "start": f"{cursors[i]:%Y-%m-%dT%H:%M:%S}", "end": f"{finish:%Y-%m-%dT%H:%M:%S}", "category": task["category"]})
+                cursors[i] = finish + timedelta(minutes=BREAK_MINUTES)
+                remaining -= length
+            if remaining <= 0:
+                break
+    return sessions
+
+def mock_reply(prompt: str) -> str:
+    """The reply text for a prompt: a JSON schedule for schedule prompts, a short answer with two blocks for chat."""
+    match = _TODAY.search(prompt)
+    if match:
+        evening = datetime.fromisoformat(match.group(1)) + timedelta(days=1, hours=18)
+        blocks = [
+            {"task": "Study session", "start": f"{evening + timedelta(minutes=30 * i):%Y-%m-%dT%H:%M:%S}", "end": f"{evening + timedelta(minutes=30 * i + 25):%Y-%m-%dT%H:%M:%S}", "category": "General"}
+            for i in range(2)
+        ]
+        return "Here is a plan for tomorrow evening, two focused blocks with a short break:\n" + json.dumps(blocks, indent=2)
+    return json.dumps(plan_sessions(*parse_schedule_prompt(prompt)), indent=2)
+
+def malformed(text: str) -> str:
+    """Breaks a JSON reply the way LLMs do: a missing comma between fields, or a cut-off array."""
+    broken = text.replace('",\n', '"\n', 1)
+    return broken if broken != text else text.rstrip("]\n") + ",\n  {\"task\": "
+
+def stream_chunks(text: str, size: int) -> Iterator[str]:
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+def create_app(config: MockConfig) -> FastAPI:
+    """Builds the stand-in server for `config`."""
+    app = FastAPI(title="StudyBuddy LLM stand-in")
+    latency = parse_latency(config.latency)
+    seen: Counter = Counter()
+    stats: Counter = Counter()
+
+    def draw(prompt: str) -> Tuple[float, str]:
+        """Latency and fault for this prompt, the same on every run with the same seed."""
+        digest = hashlib.sha256(prompt.encode()).hexdigest()
+        rng = random.Random(f"{config.seed}:{digest}:{seen[digest]}")
+        seen[digest] += 1
+        roll = rng.random()
+        if roll < config.error_rate:
+            fault = "error"
+        elif roll < config.error_rate + config.timeout_rate:
+            fault = "timeout"
+        elif roll < config.error_rate + config.timeout_rate + config.malformed_rate:
+            fault = "malformed"
+        else:
+            fault = "ok"
+        return max(0.0, latency(rng)), fault
+
+    @app.get("/ping")
+    def ping():
+        return {"message": "pong"}
+
+    @app.get("/mock/stats")
+    def mock_stats():
+        return dict(stats)
+
+    @app.get("/v1/models")
+    def models():
+        return {"object": "list", "data": [{"id": "gpt-4", "object": "model", "owned_by": "mock"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []) if m.get("role") == "user")
+        model = body.get("model", "gpt-4")
+        delay, fault = draw(prompt)
+        stats["requests"] += 1
+        stats["streamed"] += bool(body.get("stream"))
+        stats[fault] += 1
+        if fault == "timeout":
+            delay = config.hang_seconds
+        await asyncio.sleep(delay)
+        if fault == "error":
+            return JSONResponse(status_code=config.error_status, content={"error": {"message": "Injected failure", "type": "server_error", "code": None}})
+
+        text = mock_reply(prompt)
+        if fault == "malformed":
+            text = malformed(text)
+        completion_id = f"chatcmpl-mock-{stats['requests']}"
+        created = int(time.time())
+        if not body.get("stream"):
+            prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+            }
+
+        def chunk(delta: dict, finish_reason: Optional[str] = None) -> str:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in stream_chunks(text, config.stream_chunk_chars):
+                yield chunk({"content": piece})
+                await asyncio.sleep(config.stream_delay)
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """Command line options for MockConfig, shared with loadtest.py."""
+    defaults = MockConfig()
+    parser.add_argument("--latency", default=defaults.latency, help="fixed:S, uniform:LOW,HIGH, lognormal:MEDIAN,SIGMA or exponential:MEAN (seconds)")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--error-status", type=int, default=defaults.error_status)
+    parser.add_argument("--timeout-rate", type=float, default=defaults.timeout_rate)
+    parser.add_argument("--hang-seconds", type=float, default=defaults.hang_seconds)
+    parser.add_argument("--malformed-rate", type=float, default=defaults.malformed_rate)
+    parser.add_argument("--stream-chunk-chars", type=int, default=defaults.stream_chunk_chars)
+    parser.add_argument("--stream-delay", type=float, default=defaults.stream_delay)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    parse_latency(args.latency) # Fails early on a bad spec
+    return MockConfig(**{name: getattr(args, name) for name in MockConfig.__dataclass_fields__})
+
+def mock_arguments(config: MockConfig) -> List[str]:
+    """The command line that starts mock_llm.py with `config`."""
+    return [f"--{name.replace('_', '-')}={getattr(config, name)}" for name in MockConfig.__dataclass_fields__]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run an OpenAI-compatible stand-in for load testing.")
+    add_mock_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level=args.log_level)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
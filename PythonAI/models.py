@@ -1,12 +1,12 @@
-from datetime import datetime
-from pydantic import BaseModel
-from typing import List, Optional
+from datetime import date, datetime, time
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
 
 class TaskSchema(BaseModel):
     """A study task with required time, deadline, and optional category."""
     title: str
     due_date: datetime
-    duration_minutes: int
+    duration_minutes: int = Field(gt=0)
     category: Optional[str] = None
 
     def __repr__(self):
@@ -20,6 +20,27 @@ class TimeSlot(BaseModel):
     def __repr__(self):
         return f"TimeSlot({self.start_time.strftime('%H:%M')} - {self.end_time.strftime('%H:%M')})"
 
+class AvailabilityRule(BaseModel):
+    """
+    A weekly recurring availability window, expanded into slots up to the latest task due date.
+
+    Fields:
+        weekdays: Days the window repeats on, 0 = Monday to 6 = Sunday (default: every day).
+        start: Start time of the window; a time with a UTC offset gives timezone-aware slots.
+        end: End time of the window; a window ending at or before `start` runs past midnight.
+        energy_level: Energy level for every slot of this window (1-3 scale, default: 2).
+        starts_on: First date the rule applies (default: today; past dates count from today, and windows that have ended are skipped).
+        ends_on: Last date the rule applies (default: the latest task due date).
+        except_dates: Dates the window is skipped on, e.g. holidays.
+    """
+    weekdays: List[int] = [0, 1, 2, 3, 4, 5, 6]
+    start: time
+    end: time
+    energy_level: int = 2
+    starts_on: Optional[date] = None
+    ends_on: Optional[date] = None
+    except_dates: List[date] = []
+
 class StudyRequest(BaseModel):
     """
     The payload for both rule-based and AI-based scheduling requests.
@@ -29,13 +50,20 @@ class StudyRequest(BaseModel):
         energy_level: One value per available time slot, representing the user's energy level (1-3 scale).
         pomodoro_length: Preferred study block length in minutes (default: 25).
         available_slots: Time windows the user is available to study.
+        availability: Recurring weekly windows, used alongside (or instead of) available_slots.
         tasks: List of tasks to schedule.
+        strategy: Rule-based engine mode; "pack" fills the earliest slot each task fits,
+            "edd" reproduces the original earliest-due-date loop, "pomodoro" splits tasks
+            into pomodoro_length blocks spread across slots, "optimize" moves long
+            tasks into high-energy slots within a latency budget.
     """
     user_id: str
-    energy_level: List[int]
-    pomodoro_length: Optional[int] = 25
-    available_slots: List[TimeSlot]
+    energy_level: List[int] = []
+    pomodoro_length: Optional[int] = Field(25, gt=0)
+    available_slots: List[TimeSlot] = []
+    availability: List[AvailabilityRule] = []
     tasks: List[TaskSchema]
+    strategy: Literal["pack", "edd", "pomodoro", "optimize"] = "pack"
 
 class Session(BaseModel):
     """
@@ -68,6 +96,21 @@ class ScheduledSessionOut(BaseModel):
     class Config:
         orm_mode = True
 
+class SessionDiagnostic(BaseModel):
+    """
+    A problem found in a session returned by the LLM and what was done about it.
+
+    Fields:
+        index: Position of the item in the LLM reply (-1 for task-level findings).
+        code: "malformed", "unknown_task", "renamed", "empty", "overlap", "outside_slots", "after_due" or "incomplete".
+        action: "dropped", "clipped", "renamed" or "none".
+        message: Human-readable description.
+    """
+    index: int
+    code: str
+    action: str
+    message: str
+
 class ScheduleResponse(BaseModel):
     """
     Response returned to the frontend after scheduling generation.
@@ -79,6 +122,8 @@ class ScheduleResponse(BaseModel):
         total_break_time: Sum of all break times in minutes.
         success: True if all tasks were successfully scheduled.
         message: Additional info or error message.
+        stats: Optimizer report comparing the plan with the greedy one ("optimize" strategy only).
+        diagnostics: Problems found in the LLM output and how they were repaired (AI schedules only).
     """
     user_id: str
     sessions: List[Session]
@@ -86,4 +131,46 @@ class ScheduleResponse(BaseModel):
     total_break_time: int
     success: bool = True
     message: Optional[str] = None
-    warnings: Optional[List[str]] = []
\ No newline at end of file
+    warnings: Optional[List[str]] = []
+    stats: Optional[Dict[str, float]] = None
+    diagnostics: Optional[List[SessionDiagnostic]] = None
+
+class ScheduleDelta(BaseModel):
+    """
+    Changes applied to a previous schedule by the /reschedule endpoint.
+
+    Fields:
+        added_tasks: New tasks to schedule.
+        removed_tasks: Titles of tasks to drop (finished or cancelled).
+        changed_tasks: Tasks replacing the previous task with the same title.
+        added_slots: New availability windows.
+        added_energy_level: Energy level for each added slot (default: 2).
+        removed_slots: Availability windows that are no longer free.
+    """
+    added_tasks: List[TaskSchema] = []
+    removed_tasks: List[str] = []
+    changed_tasks: List[TaskSchema] = []
+    added_slots: List[TimeSlot] = []
+    added_energy_level: List[int] = []
+    removed_slots: List[TimeSlot] = []
+
+class RescheduleRequest(BaseModel):
+    """
+    Payload for patching an existing schedule instead of recomputing it.
+
+    Fields:
+        user_id: Identifier for the student.
+        previous: The schedule returned earlier for these slots.
+        energy_level: Energy levels of the slots the previous schedule was built from.
+        available_slots: The slots the previous schedule was built from.
+        pomodoro_length: Preferred study block length in minutes (default: 25).
+        strategy: Rule-based engine mode used for the recomputed part.
+        delta: The changes to apply.
+    """
+    user_id: str
+    previous: ScheduleResponse
+    energy_level: List[int]
+    available_slots: List[TimeSlot]
+    pomodoro_length: Optional[int] = Field(25, gt=0)
+    strategy: Literal["pack", "edd", "pomodoro", "optimize"] = "pack"
+    delta: ScheduleDelta
@@ -0,0 +1,70 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()  # Load environment variables from .env file
+
+# Settings for running the rule-based engine off the event loop, see docs/setup-python-backend.md
+SCHEDULER_EXECUTOR = os.getenv("SCHEDULER_EXECUTOR", "thread") # "thread" or "process"
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "4"))
+SCHEDULER_MAX_PENDING = int(os.getenv("SCHEDULER_MAX_PENDING", "32")) # Running plus queued jobs before rejecting
+SCHEDULER_RETRY_AFTER = int(os.getenv("SCHEDULER_RETRY_AFTER", "1")) # Seconds suggested to rejected clients
+
+def new_process_pool(workers: Optional[int]) -> ProcessPoolExecutor:
+    """Creates a process pool whose workers start from a clean forkserver."""
+    # Forking a threaded server can deadlock the child, so workers never fork from it directly
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+
+class ExecutorSaturated(Exception):
+    """Raised when the scheduler executor already holds its maximum number of jobs."""
+
+    def __init__(self, retry_after: int = SCHEDULER_RETRY_AFTER):
+        super().__init__("Scheduler is busy, please retry shortly.")
+        self.retry_after = retry_after
+
+class BoundedExecutor:
+    """
+    Runs blocking functions on a thread or process pool with back-pressure:
+    once `max_pending` jobs are running or queued, new jobs are rejected
+    with ExecutorSaturated instead of piling up.
+    """
+
+    def __init__(self, kind: str = SCHEDULER_EXECUTOR, workers: int = SCHEDULER_WORKERS, max_pending: int = SCHEDULER_MAX_PENDING):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = new_process_pool(self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scheduler")
+        return self._executor
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Runs `fn(*args)` on the pool, raising ExecutorSaturated if it is full."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            logging.warning(f"[SCHEDULER] Executor saturated ({self.pending} pending), rejecting request")
+            raise ExecutorSaturated()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        """Shuts down the underlying pool, if it was started."""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+scheduler_executor = BoundedExecutor()
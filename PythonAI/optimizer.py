@@ -0,0 +1,293 @@
+import os
+import time
+import bisect
+import numpy as np
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from models import StudyRequest, TaskSchema
+from scheduler import DEFAULT_BREAK_MINUTES, Placement, energy_multiplier, schedule_pack
+
+load_dotenv()  # Load environment variables from .env file
+
+# Optimizer settings, see docs/setup-python-backend.md
+OPTIMIZER_BUDGET_MS = float(os.getenv("OPTIMIZER_BUDGET_MS", "50")) # Wall-clock budget per request
+
+# Objective weights. A plan's cost is the sum over scheduled tasks of their
+# energy-adjusted minutes plus a due-date pressure term, plus a penalty per
+# unscheduled task and per slot left with an unusably short tail.
+SLACK_WEIGHT = 0.5 # Cost per base minute for a task ending right at its due date
+UNSCHEDULED_WEIGHT = 4.0 # Cost per base minute of a task left out of the plan
+FRAGMENT_WEIGHT = 1.0 # Cost per minute of a slot tail shorter than MIN_USEFUL_GAP
+MIN_USEFUL_GAP = 15 # Slot tails shorter than this many minutes are considered wasted
+CANDIDATE_SLOTS = 8 # Slots tried per task during local search
+
+class _Problem:
+    """Array view of a StudyRequest with slots sorted by start time and times in minutes."""
+
+    def __init__(self, request: StudyRequest, break_after: int):
+        self.request = request
+        self.break_after = break_after
+        self.order = sorted(range(len(request.available_slots)), key=lambda i: request.available_slots[i].start_time)
+        slots = [request.available_slots[i] for i in self.order]
+        self.origin = slots[0].start_time if slots else None
+        self.tasks = request.tasks
+
+        def minutes(moment) -> float:
+            return (moment - self.origin).total_seconds() / 60
+
+        self.dur = np.array([t.duration_minutes for t in self.tasks], dtype=np.float64)
+        self.due = np.array([minutes(t.due_date) for t in self.tasks], dtype=np.float64)
+        self.starts = np.array([minutes(s.start_time) for s in slots], dtype=np.float64)
+        self.ends = np.array([minutes(s.end_time) for s in slots], dtype=np.float64)
+        mult = np.array([energy_multiplier(request, i) for i in self.order], dtype=np.float64)
+        # Multipliers take a handful of values, so durations are computed per energy class rather than per slot
+        classes, self.cls = np.unique(mult, return_inverse=True)
+        self.adjusted = np.rint(self.dur[:, None] * classes[None, :]).astype(np.int64) # n x classes
+        self.limits = np.searchsorted(self.starts, self.due, side="left") # Slots starting before each due date
+        self.pressure = SLACK_WEIGHT * self.dur / np.maximum(self.due, 1.0)
+
+        # Plain lists for the scalar local search loop
+        self.adjusted_list = self.adjusted.tolist()
+        self.cls_list = self.cls.tolist()
+        self.due_list = self.due.tolist()
+        self.dur_list = self.dur.tolist()
+        self.pressure_list = self.pressure.tolist()
+        self.starts_list = self.starts.tolist()
+        self.ends_list = self.ends.tolist()
+        self.limits_list = self.limits.tolist()
+
+    def slot_cost(self, j: int, members: List[int]) -> Optional[float]:
+        """Cost of packing `members` (sorted by due date) into slot `j`, or None if they do not fit."""
+        cursor = self.starts_list[j]
+        end_of_slot = self.ends_list[j]
+        c = self.cls_list[j]
+        cost = 0.0
+        for t in members:
+            end = cursor + self.adjusted_list[t][c]
+            if end > end_of_slot or end > self.due_list[t]:
+                return None
+            cost += self.adjusted_list[t][c] + self.pressure_list[t] * end
+            cursor = end + self.break_after
+        left = end_of_slot - cursor
+        if 0 < left < MIN_USEFUL_GAP:
+            cost += FRAGMENT_WEIGHT * left
+        return cost
+
+    def unscheduled_cost(self, t: int) -> float:
+        return UNSCHEDULED_WEIGHT * self.dur_list[t]
+
+class _Plan:
+    """Task-to-slot assignment with cached per-slot costs."""
+
+    def __init__(self, problem: _Problem, assignment: List[int]):
+        self.problem = problem
+        self.slot_of = assignment
+        self.members: List[List[int]] = [[] for _ in range(len(problem.starts_list))]
+        for t in sorted(range(len(assignment)), key=lambda t: problem.due_list[t]):
+            if assignment[t] >= 0:
+                self.members[assignment[t]].append(t)
+        self.costs = [problem.slot_cost(j, members) for j, members in enumerate(self.members)]
+
+    def is_feasible(self) -> bool:
+        return all(cost is not None for cost in self.costs)
+
+    def total(self) -> float:
+        unscheduled = sum(self.problem.unscheduled_cost(t) for t, j in enumerate(self.slot_of) if j < 0)
+        return sum(self.costs) + unscheduled
+
+    def with_task(self, j: int, t: int) -> List[int]:
+        members = list(self.members[j])
+        due = self.problem.due_list
+        bisect.insort(members, t, key=lambda x: due[x])
+        return members
+
+    def without_task(self, j: int, t: int) -> List[int]:
+        return [x for x in self.members[j] if x != t]
+
+    def apply(self, members_by_slot: Dict[int, List[int]], costs: Dict[int, float]):
+        for k, members in members_by_slot.items():
+            self.members[k] = members
+            self.costs[k] = costs[k]
+            for x in members:
+                self.slot_of[x] = k
+
+def _construct(problem: _Problem, deadline: float, clock: Callable[[], float] = time.perf_counter) -> Optional[List[int]]:
+    """
+    Vectorized greedy construction: tasks in due-date order pick the slot with
+    the lowest marginal cost among all slots they still fit before their due
+    date. Returns None if the deadline passes first.
+    """
+    cursors = problem.starts.copy()
+    assignment = [-1] * len(problem.dur)
+    for t in np.argsort(problem.due, kind="stable").tolist():
+        if clock() > deadline:
+            return None
+        limit = problem.limits_list[t]
+        if limit == 0:
+            continue
+        adjusted = problem.adjusted[t, problem.cls[:limit]]
+        end = cursors[:limit] + adjusted
+        left = problem.ends[:limit] - end - problem.break_after
+        cost = adjusted + problem.pressure_list[t] * end + FRAGMENT_WEIGHT * left * ((left > 0) & (left < MIN_USEFUL_GAP))
+        cost[(end > problem.ends[:limit]) | (end > problem.due_list[t])] = np.inf
+        j = int(np.argmin(cost))
+        if cost[j] == np.inf:
+            continue
+        assignment[t] = j
+        cursors[j] = end[j] + problem.break_after
+    return assignment
+
+def _candidate_slots(problem: _Problem, plan: _Plan, t: int) -> List[int]:
+    """Slots where task `t` would take fewer minutes than where it is now, earliest first."""
+    limit = problem.limits_list[t]
+    if limit == 0:
+        return []
+    adjusted = problem.adjusted[t, problem.cls[:limit]]
+    current = plan.slot_of[t]
+    bound = adjusted[current] if current >= 0 else np.inf
+    better = np.flatnonzero(adjusted <= bound)
+    return [j for j in better[:CANDIDATE_SLOTS + 1].tolist() if j != current][:CANDIDATE_SLOTS]
+
+def _improve_task(problem: _Problem, plan: _Plan, t: int) -> bool:
+    """Tries to relocate task `t`, or swap it with a shorter task, into a cheaper slot. Returns True on improvement."""
+    a = plan.slot_of[t]
+    if a >= 0:
+        without = plan.without_task(a, t)
+        without_cost = problem.slot_cost(a, without)
+        base_a = plan.costs[a]
+    else:
+        without, without_cost, base_a = None, 0.0, problem.unscheduled_cost(t)
+
+    for b in _candidate_slots(problem, plan, t):
+        # Relocate
+        moved = plan.with_task(b, t)
+        moved_cost = problem.slot_cost(b, moved)
+        if moved_cost is not None and without_cost is not None:
+            if moved_cost + without_cost < base_a + plan.costs[b] - 1e-9:
+                changes = {b: moved}
+                costs = {b: moved_cost}
+                if a >= 0:
+                    changes[a], costs[a] = without, without_cost
+                plan.apply(changes, costs)
+                return True
+        if a < 0:
+            continue
+        # Swap with a shorter task from slot b
+        for k in plan.members[b]:
+            if problem.dur_list[k] >= problem.dur_list[t] or problem.limits_list[k] <= a:
+                continue
+            new_b = [x for x in moved if x != k]
+            new_b_cost = problem.slot_cost(b, new_b)
+            if new_b_cost is None:
+                continue
+            new_a = list(without)
+            bisect.insort(new_a, k, key=lambda x: problem.due_list[x])
+            new_a_cost = problem.slot_cost(a, new_a)
+            if new_a_cost is None:
+                continue
+            if new_a_cost + new_b_cost < plan.costs[a] + plan.costs[b] - 1e-9:
+                plan.apply({a: new_a, b: new_b}, {a: new_a_cost, b: new_b_cost})
+                return True
+    return False
+
+def _local_search(problem: _Problem, plan: _Plan, deadline: float, clock: Callable[[], float] = time.perf_counter):
+    """First-improvement local search over longest tasks first until no move helps or the deadline passes."""
+    order = np.argsort(-problem.dur, kind="stable").tolist()
+    improved = True
+    while improved:
+        improved = False
+        for t in order:
+            if clock() > deadline:
+                return
+            if _improve_task(problem, plan, t):
+                improved = True
+
+def _placements(problem: _Problem, plan: _Plan) -> Tuple[List[Placement], List[TaskSchema]]:
+    placements: List[Placement] = []
+    for j, members in enumerate(plan.members):
+        slot_start = problem.request.available_slots[problem.order[j]].start_time
+        offset = 0
+        for t in members:
+            adjusted = problem.adjusted_list[t][problem.cls_list[j]]
+            start = slot_start + timedelta(minutes=offset)
+            placements.append(Placement(problem.tasks[t], start, start + timedelta(minutes=adjusted), adjusted, problem.break_after, problem.order[j]))
+            offset += adjusted + problem.break_after
+    placements.sort(key=lambda p: p.start_time)
+    unscheduled = [problem.tasks[t] for t, j in enumerate(plan.slot_of) if j < 0]
+    return placements, unscheduled
+
+def _assignment_from(problem: _Problem, placements: List[Placement]) -> List[int]:
+    position = {original: j for j, original in enumerate(problem.order)}
+    index = {id(task): t for t, task in enumerate(problem.tasks)}
+    assignment = [-1] * len(problem.tasks)
+    for p in placements:
+        assignment[index[id(p.task)]] = position[p.slot_index]
+    return assignment
+
+def optimize_with_report(
+    request: StudyRequest,
+    break_after: int = DEFAULT_BREAK_MINUTES,
+    budget_ms: float = OPTIMIZER_BUDGET_MS,
+    clock: Callable[[], float] = time.perf_counter
+) -> Tuple[List[Placement], List[TaskSchema], Dict[str, float]]:
+    """
+    Energy-aware scheduler: scores task x slot assignments with numpy, builds
+    a plan greedily by marginal cost and improves it with relocate/swap local
+    search that moves long tasks into high-energy slots, all within `budget_ms`.
+
+    The greedy "pack" plan seeds the search, so the result is never worse than
+    it under the objective. Returns the placements, the unscheduled tasks and
+    a report comparing both plans. When the greedy plan alone uses up the
+    budget it is returned as it is and the report sets `budget_exceeded`;
+    the objectives are only reported when they were computed. `clock` is
+    injectable for tests.
+    """
+    started = clock()
+    deadline = started + 0.9 * budget_ms / 1000 # Leave room for building the placements
+    greedy_placements, greedy_unscheduled = schedule_pack(request, break_after)
+    placements, unscheduled = greedy_placements, greedy_unscheduled
+    objective = greedy_objective = None
+    budget_exceeded = False
+    if not request.available_slots or not request.tasks:
+        objective = greedy_objective = UNSCHEDULED_WEIGHT * sum(t.duration_minutes for t in greedy_unscheduled)
+    elif clock() > deadline:
+        # Building the cost arrays is O(n x energy classes) and would only push further past the budget
+        budget_exceeded = True
+    else:
+        problem = _Problem(request, break_after)
+        plan = _Plan(problem, _assignment_from(problem, greedy_placements))
+        objective = greedy_objective = plan.total()
+        if clock() > deadline:
+            budget_exceeded = True
+        else:
+            constructed = _construct(problem, deadline, clock)
+            if constructed is not None:
+                candidate = _Plan(problem, constructed)
+                if candidate.is_feasible() and candidate.total() < greedy_objective:
+                    plan = candidate
+            _local_search(problem, plan, deadline, clock)
+            objective = plan.total()
+            placements, unscheduled = _placements(problem, plan)
+
+    report = {}
+    if greedy_objective is not None:
+        report.update({
+            "objective": round(objective, 2),
+            "greedy_objective": round(greedy_objective, 2),
+            "improvement_pct": round(100 * (greedy_objective - objective) / greedy_objective, 2) if greedy_objective else 0.0
+        })
+    report.update({
+        "study_minutes": sum(p.duration_minutes for p in placements),
+        "greedy_study_minutes": sum(p.duration_minutes for p in greedy_placements),
+        "scheduled": len(placements),
+        "greedy_scheduled": len(greedy_placements),
+        "budget_exceeded": float(budget_exceeded),
+        "elapsed_ms": round((clock() - started) * 1000, 2)
+    })
+    return placements, unscheduled, report
+
+def optimize_schedule(request: StudyRequest, break_after: int = DEFAULT_BREAK_MINUTES) -> Tuple[List[Placement], List[TaskSchema]]:
+    """Strategy entry point returning only the placements and unscheduled tasks."""
+    placements, unscheduled, _ = optimize_with_report(request, break_after)
+    return placements, unscheduled
@@ -0,0 +1,129 @@
+import re
+import math
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Tuple
+from models import StudyRequest, TaskSchema, TimeSlot
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+# One session of the reply format, used to size the reply budget
+SAMPLE_REPLY_SESSION = '{"task": "Complete Python project", "start": "2025-07-13T09:00:00", "end": "2025-07-13T09:25:00", "category": "Programming"},'
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the token count of `text` without a tokenizer: words count one
+    token per 4 letters, numbers one per 3 digits and punctuation one each,
+    which tracks GPT tokenizers closely enough for budgeting.
+    """
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        if piece[0].isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        elif piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        else:
+            tokens += 1
+    return tokens
+
+def expected_sessions(tasks: List[TaskSchema], pomodoro_length: int) -> int:
+    """Number of sessions a reply is expected to contain when tasks are split into Pomodoro blocks."""
+    block = pomodoro_length or 25
+    return sum(max(1, math.ceil(task.duration_minutes / block)) for task in tasks)
+
+def format_compact_prompt(pomodoro_length: int, slots: List[Tuple[TimeSlot, object]], tasks: List[TaskSchema]) -> str:
+    """
+    Encodes slots and tasks as compact tables: slots are grouped by day, and
+    each distinct category is written once and referenced by a short code.
+    """
+    lines = [f"Schedule study sessions of about {pomodoro_length} minutes with short breaks."]
+
+    lines.append("Free slots by day (start-end e=energy 1 low..3 high):")
+    by_day: Dict[str, List[str]] = defaultdict(list)
+    for slot, energy in sorted(slots, key=lambda s: s[0].start_time):
+        by_day[slot.start_time.strftime("%Y-%m-%d")].append(f"{slot.start_time:%H:%M}-{slot.end_time:%H:%M} e={energy}")
+    for day, windows in by_day.items():
+        lines.append(f"{day}: {'; '.join(windows)}")
+
+    codes: Dict[str, str] = {}
+    for task in tasks:
+        codes.setdefault(task.category or "General", f"C{len(codes) + 1}")
+    lines.append("Categories: " + "; ".join(f"{code}={name}" for name, code in codes.items()))
+    lines.append("Tasks (title|minutes|due|category code):")
+    for task in tasks:
+        lines.append(f"{task.title}|{task.duration_minutes}|{task.due_date:%Y-%m-%d %H:%M}|{codes[task.category or 'General']}")
+
+    lines.append("Only use the free slots and finish each task before its due time. Use the exact title and the full category name, not its code.")
+    lines.append('Respond ONLY with a plain JSON array, no markdown: [{"task": "<title>", "start": "YYYY-MM-DDTHH:MM:SS", "end": "YYYY-MM-DDTHH:MM:SS", "category": "<category name>"}]')
+    return "\n".join(lines)
+
+def _energy_slots(request: StudyRequest) -> List[Tuple[TimeSlot, object]]:
+    return [
+        (slot, request.energy_level[i] if i < len(request.energy_level) else "unknown")
+        for i, slot in enumerate(request.available_slots)
+    ]
+
+def split_by_date(request: StudyRequest, windows: int) -> List[Tuple[List[Tuple[TimeSlot, object]], List[TaskSchema]]]:
+    """
+    Splits a request into at most `windows` consecutive date windows with
+    similar amounts of free time. Tasks go, in due-date order, to the first
+    window that starts before they are due and still has room for them.
+    """
+    slots = sorted(_energy_slots(request), key=lambda s: s[0].start_time)
+    days: Dict[datetime, List[Tuple[TimeSlot, object]]] = defaultdict(list)
+    for slot in slots:
+        days[slot[0].start_time.date()].append(slot)
+
+    def minutes(slot: TimeSlot) -> float:
+        return (slot.end_time - slot.start_time).total_seconds() / 60
+
+    total = sum(minutes(s) for s, _ in slots)
+    target = total / max(windows, 1)
+    groups: List[List[Tuple[TimeSlot, object]]] = [[]]
+    filled = 0.0
+    for day_slots in days.values():
+        if groups[-1] and filled >= target * len(groups) and len(groups) < windows:
+            groups.append([])
+        groups[-1].extend(day_slots)
+        filled += sum(minutes(s) for s, _ in day_slots)
+
+    room = [sum(minutes(s) for s, _ in group) for group in groups]
+    starts = [group[0][0].start_time for group in groups]
+    assigned: List[List[TaskSchema]] = [[] for _ in groups]
+    first_open = 0 # Windows before this one are full
+    for task in sorted(request.tasks, key=lambda t: t.due_date):
+        last = max(bisect_left(starts, task.due_date) - 1, 0) # Last window starting before the due date
+        while first_open < len(groups) - 1 and room[first_open] <= 0:
+            first_open += 1
+        window = next((i for i in range(first_open, last + 1) if room[i] >= task.duration_minutes), last)
+        assigned[window].append(task)
+        room[window] -= task.duration_minutes
+    return [(group, tasks) for group, tasks in zip(groups, assigned) if tasks]
+
+def build_compact_prompts(request: StudyRequest, token_budget: int, reply_tokens: int) -> List[str]:
+    """
+    Returns compact prompts for `request`, split into date windows until each
+    fits `token_budget` prompt tokens and its expected reply fits `reply_tokens`.
+    """
+    pomodoro = request.pomodoro_length or 25
+    per_session = estimate_tokens(SAMPLE_REPLY_SESSION)
+    reply_capacity = max(1, reply_tokens // per_session)
+    days = len({slot.start_time.date() for slot in request.available_slots})
+
+    parts = [(_energy_slots(request), list(request.tasks))]
+    prompts = [format_compact_prompt(pomodoro, *parts[0])]
+    # Start from the window count the totals call for, then refine where windows came out uneven
+    windows = 1
+    wanted = max(math.ceil(estimate_tokens(prompts[0]) / token_budget), math.ceil(expected_sessions(request.tasks, pomodoro) / reply_capacity))
+    while True:
+        fits = all(
+            estimate_tokens(prompt) <= token_budget and expected_sessions(tasks, pomodoro) <= reply_capacity
+            for prompt, (_, tasks) in zip(prompts, parts)
+        )
+        if fits or windows >= days:
+            return prompts
+        windows = min(days, max(wanted, windows + 1))
+        parts = split_by_date(request, windows)
+        prompts = [format_compact_prompt(pomodoro, slots, tasks) for slots, tasks in parts]
+        wanted = math.ceil(windows * 1.5)
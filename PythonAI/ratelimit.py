@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional
+from dotenv import load_dotenv
+from shared_state import SharedState, shared_state
+
+load_dotenv()  # Load environment variables from .env file
+
+# Per-user limits on AI endpoints, see docs/setup-python-backend.md
+LLM_RATE_LIMIT_PER_MINUTE = float(os.getenv("LLM_RATE_LIMIT_PER_MINUTE", "20")) # 0 disables the limiter
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "5"))
+LLM_RATE_LIMIT_MAX_USERS = 10000 # Buckets tracked before the least recently seen user is forgotten
+
+class RateLimited(Exception):
+    """Raised when a user has used up their AI request allowance."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Too many AI requests, please retry shortly.")
+        self.retry_after = retry_after
+
+class RateLimiter:
+    """
+    Token bucket per user: each user may make `burst` requests at once and
+    regains `per_minute` requests per minute. Buckets live in an LRU map, so
+    memory stays bounded; a forgotten user simply starts with a full bucket.
+    With a SharedState the buckets are kept there instead, shared by all workers.
+    """
+
+    def __init__(self, per_minute: float = LLM_RATE_LIMIT_PER_MINUTE, burst: int = LLM_RATE_LIMIT_BURST, max_users: int = LLM_RATE_LIMIT_MAX_USERS, state: Optional[SharedState] = None):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_users = max_users
+        self.state = state
+        self.buckets: "OrderedDict[str, list]" = OrderedDict() # user_id -> [tokens, updated_at]
+        self.rejected = 0
+
+    async def retry_after(self, user_id: str) -> float:
+        """
+        Takes one token for `user_id` if one is available. Returns 0 when the
+        request may proceed, else the seconds until a token is available.
+        """
+        if self.rate <= 0:
+            return 0.0
+        if self.state is not None:
+            # The shared bucket is a SQLite write that may wait on other workers' locks
+            retry_after = await asyncio.to_thread(self.state.take_token, user_id, self.rate, self.burst)
+            self.rejected += retry_after > 0
+            return retry_after
+        now = time.monotonic()
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            bucket = self.buckets[user_id] = [float(self.burst), now]
+            if len(self.buckets) > self.max_users:
+                self.buckets.popitem(last=False)
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self.buckets.move_to_end(user_id)
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        self.rejected += 1
+        return (1 - bucket[0]) / self.rate
+
+    async def check(self, user_id: str):
+        """Like retry_after, but raises RateLimited when the user is over the limit."""
+        retry_after = await self.retry_after(user_id)
+        if retry_after:
+            raise RateLimited(retry_after)
+
+class FairQueue:
+    """
+    Limits concurrent LLM calls to `slots`. When all slots are busy, waiters
+    are queued per user and served round-robin across users, so a client
+    with many requests in flight cannot starve the others.
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.active = 0
+        self.depth = 0
+        self.waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    def waiting_users(self) -> int:
+        return len(self.waiters)
+
+    async def acquire(self, user_id: str = ""):
+        if self.active < self.slots and not self.depth:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(user_id, deque()).append(future)
+        self.depth += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release() # The slot was handed over just as the waiter was cancelled
+            else:
+                self._discard(user_id, future)
+            raise
+
+    def release(self):
+        """Hands the slot to the next user in turn, or frees it."""
+        while self.waiters:
+            user_id, queue = next(iter(self.waiters.items()))
+            future = queue.popleft()
+            self.depth -= 1
+            if queue:
+                self.waiters.move_to_end(user_id)
+            else:
+                del self.waiters[user_id]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _discard(self, user_id: str, future: asyncio.Future):
+        queue = self.waiters.get(user_id)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.depth -= 1
+            if not queue:
+                del self.waiters[user_id]
+
+    @asynccontextmanager
+    async def slot(self, user_id: str = ""):
+        """Holds one slot for the enclosed block."""
+        await self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+rate_limiter = RateLimiter(state=shared_state)
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from ai_model import generate_schedule
+from models import RescheduleRequest, ScheduleResponse, Session, StudyRequest, TimeSlot
+
+DEFAULT_ENERGY_LEVEL = 2 # Used for added slots sent without an energy level
+
+def _minutes(session: Session) -> int:
+    return round((session.end_time - session.start_time).total_seconds() / 60)
+
+def _cut_index(request: RescheduleRequest, sessions: List[Session], first_index: Dict[str, int]) -> int:
+    """
+    Returns the index of the first session that has to be recomputed. Sessions
+    before it are kept as they are; the cut moves back until no task has
+    sessions on both sides of it.
+    """
+    delta = request.delta
+    cut = len(sessions)
+
+    for title in delta.removed_tasks + [task.title for task in delta.changed_tasks]:
+        if title in first_index:
+            cut = min(cut, first_index[title])
+
+    removed = {(slot.start_time, slot.end_time) for slot in delta.removed_slots}
+    if removed:
+        for i, session in enumerate(sessions[:cut]):
+            if any(start <= session.start_time < end for start, end in removed):
+                cut = i
+                break
+
+    # New and changed tasks go where the earliest-due-date order puts them:
+    # before the first session of a task that is due later
+    for task in delta.added_tasks + delta.changed_tasks:
+        for i, session in enumerate(sessions[:cut]):
+            if session.task.due_date > task.due_date:
+                cut = i
+                break
+
+    # Split tasks (pomodoro blocks) are recomputed as a whole
+    while True:
+        earliest = min((first_index[s.task.title] for s in sessions[cut:]), default=cut)
+        if earliest >= cut:
+            return cut
+        cut = earliest
+
+def _suffix_slots(request: RescheduleRequest, boundary: Optional[datetime]) -> Tuple[List[TimeSlot], List[int]]:
+    """Returns the free parts of the slots after `boundary` with their energy levels."""
+    removed = {(slot.start_time, slot.end_time) for slot in request.delta.removed_slots}
+    slots, energy = [], []
+    for i, slot in enumerate(request.available_slots):
+        if (slot.start_time, slot.end_time) in removed:
+            continue
+        start = slot.start_time if boundary is None else max(slot.start_time, boundary)
+        if start < slot.end_time:
+            slots.append(TimeSlot(start_time=start, end_time=slot.end_time))
+            energy.append(request.energy_level[i] if i < len(request.energy_level) else DEFAULT_ENERGY_LEVEL)
+    added_energy = request.delta.added_energy_level
+    for i, slot in enumerate(request.delta.added_slots):
+        # Added slots may overlap the kept sessions too, so they are clipped the same way
+        start = slot.start_time if boundary is None else max(slot.start_time, boundary)
+        if start < slot.end_time:
+            slots.append(TimeSlot(start_time=start, end_time=slot.end_time))
+            energy.append(added_energy[i] if i < len(added_energy) else DEFAULT_ENERGY_LEVEL)
+    return slots, energy
+
+def reschedule(request: RescheduleRequest) -> ScheduleResponse:
+    """
+    Patches a previous schedule with a delta. Sessions before the earliest
+    affected point are returned unchanged; only the tasks from that point on,
+    plus added and changed tasks, are rescheduled into the remaining slot time.
+
+    Tasks the previous schedule could not place are not retried, since it only
+    carries their warnings; send them again in `delta.added_tasks` to retry them.
+    """
+    previous = request.previous
+    delta = request.delta
+    sessions = sorted(previous.sessions, key=lambda s: s.start_time)
+    first_index: Dict[str, int] = {}
+    for i, session in enumerate(sessions):
+        first_index.setdefault(session.task.title, i)
+
+    cut = _cut_index(request, sessions, first_index)
+    kept, suffix = sessions[:cut], sessions[cut:]
+
+    # Recomputed sessions start after every kept session and its break
+    boundary = max((s.end_time + timedelta(minutes=s.break_after or 0) for s in kept), default=None)
+
+    dropped: Set[str] = set(delta.removed_tasks) | {task.title for task in delta.changed_tasks}
+    tasks = []
+    seen: Set[str] = set()
+    for session in suffix:
+        title = session.task.title
+        if title not in dropped and title not in seen:
+            seen.add(title)
+            tasks.append(session.task)
+    tasks.extend(delta.added_tasks)
+    tasks.extend(delta.changed_tasks)
+
+    slots, energy = _suffix_slots(request, boundary)
+    patch = generate_schedule(StudyRequest(
+        user_id=request.user_id,
+        energy_level=energy,
+        pomodoro_length=request.pomodoro_length,
+        available_slots=slots,
+        tasks=tasks,
+        strategy=request.strategy
+    ))
+
+    # Warnings of tasks that were already unscheduled still apply unless the task was dropped or sent again
+    retried = dropped | {task.title for task in delta.added_tasks}
+    carried = [w for w in previous.warnings or [] if not any(f"'{title}'" in w for title in retried)]
+    warnings = carried + (patch.warnings or [])
+    study_time = previous.total_study_time - sum(_minutes(s) for s in suffix) + patch.total_study_time
+    break_time = previous.total_break_time - sum(s.break_after or 0 for s in suffix) + patch.total_break_time
+
+    return ScheduleResponse(
+        user_id=request.user_id,
+        sessions=kept + patch.sessions,
+        total_study_time=study_time,
+        total_break_time=break_time,
+        success=not warnings,
+        message="All tasks scheduled successfully." if not warnings else "Some tasks could not be scheduled due to time constraints.",
+        warnings=warnings,
+        stats=patch.stats
+    )
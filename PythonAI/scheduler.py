@@ -0,0 +1,300 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from columnar import MINUTE, PlacementColumns, RequestColumns
+from models import StudyRequest, TaskSchema
+
+ENERGY_MULTIPLIERS = {1: 1.25, 2: 1.0, 3: 0.75} # 1 = low, 2 = medium, 3 = high
+DEFAULT_BREAK_MINUTES = 5 # Default break after each session in minutes
+DEFAULT_POMODORO_MINUTES = 25 # Block length used when a request sends no pomodoro_length
+
+@dataclass
+class Placement:
+    """A task placed into a slot by the scheduling engine."""
+    task: TaskSchema
+    start_time: datetime
+    end_time: datetime
+    duration_minutes: int
+    break_after: int = DEFAULT_BREAK_MINUTES
+    slot_index: int = -1 # Index into request.available_slots
+
+def energy_multiplier(request: StudyRequest, slot_index: int) -> float:
+    """Returns the duration multiplier for a slot, defaulting to 1.0 when no energy level was sent."""
+    if slot_index < len(request.energy_level):
+        return ENERGY_MULTIPLIERS.get(request.energy_level[slot_index], 1.0)
+    return 1.0
+
+def slot_multipliers(columns: RequestColumns) -> List[float]:
+    """Duration multiplier per slot, decoded from the slots' energy codes."""
+    # Code -1 (no energy level sent) picks the trailing 1.0
+    table = [ENERGY_MULTIPLIERS.get(level, 1.0) for level in columns.energy_levels] + [1.0]
+    return [table[code] for code in columns.slot_energy]
+
+def capacity(free_minutes: float, multiplier: float) -> int:
+    """
+    Returns the longest base task duration (in minutes) that still fits into
+    `free_minutes` once scaled by `multiplier`, or -1 if nothing fits.
+    """
+    if free_minutes <= 0:
+        return -1
+    minutes = int(free_minutes / multiplier)
+    while round((minutes + 1) * multiplier) <= free_minutes:
+        minutes += 1
+    while minutes >= 0 and round(minutes * multiplier) > free_minutes:
+        minutes -= 1
+    return minutes
+
+class SlotIndex:
+    """
+    Sorted free-interval index over the available slots.
+
+    Each slot keeps a single free interval [cursor, end) in epoch microseconds.
+    A max segment tree over the slots' capacities answers "earliest slot a
+    task fits into" in O(log m), and placing a task updates one leaf in O(log m).
+    """
+
+    def __init__(self, starts: Sequence[int], ends: Sequence[int], multipliers: Sequence[float]):
+        self.cursors = array("q", starts)
+        self.ends = ends
+        self.multipliers = multipliers
+        self.size = 1
+        while self.size < max(len(starts), 1):
+            self.size *= 2
+        self.tree = [-1] * (2 * self.size)
+        for i in range(len(starts)):
+            self.tree[self.size + i] = capacity(self._free_minutes(i), multipliers[i])
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def _free_minutes(self, i: int) -> float:
+        return (self.ends[i] - self.cursors[i]) / MINUTE
+
+    def find(self, minutes: int, limit: int, lo: int = 0) -> int:
+        """Returns the leftmost slot index in [lo, limit) that fits `minutes`, or -1."""
+        tree = self.tree
+        if limit <= lo or tree[1] < minutes:
+            return -1
+        if lo:
+            found = self._find_from(1, 0, self.size, minutes, lo)
+            return found if 0 <= found < limit else -1
+        node = 1
+        lo, hi = 0, self.size
+        while node < self.size:
+            mid = (lo + hi) // 2
+            if tree[2 * node] >= minutes:
+                node, hi = 2 * node, mid
+            else:
+                node, lo = 2 * node + 1, mid
+        # The leftmost fit is the only candidate; if it lies past `limit`, nothing below it fits
+        return lo if lo < limit else -1
+
+    def _find_from(self, node: int, node_lo: int, node_hi: int, minutes: int, lo: int) -> int:
+        if node_hi <= lo or self.tree[node] < minutes:
+            return -1
+        if node >= self.size:
+            return node_lo
+        mid = (node_lo + node_hi) // 2
+        found = self._find_from(2 * node, node_lo, mid, minutes, lo)
+        return found if found >= 0 else self._find_from(2 * node + 1, mid, node_hi, minutes, lo)
+
+    def advance(self, i: int, delta: int):
+        """Moves slot `i`'s free cursor forward by `delta` microseconds and refreshes its capacity."""
+        self.cursors[i] += delta
+        tree = self.tree
+        node = self.size + i
+        tree[node] = capacity(self._free_minutes(i), self.multipliers[i])
+        node //= 2
+        while node:
+            left, right = tree[2 * node], tree[2 * node + 1]
+            tree[node] = left if left > right else right
+            node //= 2
+
+def pack_columns(columns: RequestColumns, break_after: int = DEFAULT_BREAK_MINUTES) -> PlacementColumns:
+    """
+    Packs tasks in due-date order into the earliest slot they fit before
+    their due date. Tasks that do not fit are skipped instead of blocking
+    the rest of the queue. Runs in O(n log n + (n + m) log m).
+    """
+    order = columns.slot_order
+    multiplier_of = slot_multipliers(columns)
+    starts = array("q", [columns.slot_start[i] for i in order])
+    ends = array("q", [columns.slot_end[i] for i in order])
+    multipliers = [multiplier_of[i] for i in order]
+    index = SlotIndex(starts, ends, multipliers)
+    gap = break_after * MINUTE
+
+    result = PlacementColumns(columns, break_after)
+    due_of, duration_of = columns.task_due, columns.task_duration
+    for task in columns.task_order:
+        due, duration = due_of[task], duration_of[task]
+        slot = index.find(duration, bisect_left(starts, due))
+        if slot < 0:
+            result.unscheduled.append(task)
+            continue
+        adjusted = round(duration * multipliers[slot])
+        start = index.cursors[slot]
+        end = start + adjusted * MINUTE
+        if end > due:
+            result.unscheduled.append(task)
+            continue
+        result.add(task, order[slot], start, end, adjusted)
+        index.advance(slot, adjusted * MINUTE + gap)
+
+    result.sort_by_start()
+    return result
+
+def edd_columns(columns: RequestColumns, break_after: int = DEFAULT_BREAK_MINUTES) -> PlacementColumns:
+    """
+    Compatibility mode reproducing the original earliest-due-date loop: slots
+    are filled in request order and scheduling stops at the first task that
+    does not fit. Runs in O(n log n + m).
+    """
+    remaining = deque(columns.task_order)
+    multipliers = slot_multipliers(columns)
+    duration_of = columns.task_duration
+    gap = break_after * MINUTE
+    result = PlacementColumns(columns, break_after)
+
+    for slot, (cursor, slot_end) in enumerate(zip(columns.slot_start, columns.slot_end)):
+        if not remaining:
+            break
+        multiplier = multipliers[slot]
+        while remaining and cursor < slot_end:
+            task = remaining[0]
+            adjusted = round(duration_of[task] * multiplier)
+            end = cursor + adjusted * MINUTE
+            if end > slot_end:
+                break
+            result.add(task, slot, cursor, end, adjusted)
+            cursor = end + gap
+            remaining.popleft()
+
+    result.unscheduled.extend(remaining)
+    return result
+
+def full_blocks(free: int, length: int, gap: int) -> int:
+    """How many blocks of `length` microseconds, each followed by `gap`, fit into `free` microseconds."""
+    return max(0, (free + gap) // (length + gap))
+
+def pomodoro_columns(columns: RequestColumns, break_after: int = DEFAULT_BREAK_MINUTES) -> PlacementColumns:
+    """
+    Splits each task into `pomodoro_length` blocks and spreads them over the
+    slots in start order, with a break after every block. A task is placed
+    only if its last block ends by its due date; otherwise it is skipped and
+    the slots stay free for the next task.
+
+    Whether a task fits is decided before placing it: a prefix sum of the full
+    blocks each untouched slot holds locates the slot of its last full block by
+    bisection, and the slot index finds the first slot after it that fits the
+    shorter final block. Only the slot being filled has been used, so the
+    decision is O(log m) per task and the whole run is O(n log n + m log m + b)
+    for b blocks. Slots are assumed not to overlap, so blocks end in slot order.
+    """
+    block = columns.request.pomodoro_length or DEFAULT_POMODORO_MINUTES
+    if block <= 0:
+        block = DEFAULT_POMODORO_MINUTES
+    order = columns.slot_order
+    multiplier_of = slot_multipliers(columns)
+    starts = array("q", [columns.slot_start[i] for i in order])
+    ends = array("q", [columns.slot_end[i] for i in order])
+    multipliers = [multiplier_of[i] for i in order]
+    lengths = array("q", [round(block * m) * MINUTE for m in multipliers]) # Full block per slot
+    gap = break_after * MINUTE
+    blocks_before = array("q", [0]) # Full blocks held by the untouched slots before each index
+    for start, end, length in zip(starts, ends, lengths):
+        blocks_before.append(blocks_before[-1] + full_blocks(end - start, length, gap))
+    index = SlotIndex(starts, ends, multipliers)
+
+    result = PlacementColumns(columns, break_after)
+    due_of, duration_of = columns.task_due, columns.task_duration
+    pointer, cursor = 0, starts[0] if starts else 0 # Slot being filled and its free cursor
+    for task in columns.task_order:
+        due, duration = due_of[task], duration_of[task]
+        if duration <= 0 or pointer >= len(order):
+            result.unscheduled.append(task) # Durations are validated positive; anything else is reported, not dropped
+            continue
+        needed = (duration - 1) // block # Full blocks before the final one
+        last = duration - needed * block
+        here = full_blocks(ends[pointer] - cursor, lengths[pointer], gap)
+        if needed <= here:
+            slot, position = pointer, cursor + needed * (lengths[pointer] + gap)
+        else:
+            target = blocks_before[pointer + 1] + needed - here
+            slot = bisect_left(blocks_before, target, pointer + 2) - 1
+            if slot >= len(order):
+                result.unscheduled.append(task)
+                continue
+            position = starts[slot] + (target - blocks_before[slot]) * (lengths[slot] + gap)
+        end = position + round(last * multipliers[slot]) * MINUTE
+        if end > ends[slot]:
+            slot = index.find(last, bisect_left(starts, due), slot + 1)
+            end = starts[slot] + round(last * multipliers[slot]) * MINUTE if slot >= 0 else due + 1
+        if end > due:
+            result.unscheduled.append(task)
+            continue
+
+        remaining = duration
+        while remaining > 0:
+            minutes = min(block, remaining)
+            adjusted = round(minutes * multipliers[pointer])
+            end = cursor + adjusted * MINUTE
+            if end > ends[pointer]:
+                pointer += 1
+                cursor = starts[pointer]
+                continue
+            result.add(task, order[pointer], cursor, end, adjusted)
+            cursor = end + gap
+            remaining -= minutes
+
+    # Slots are only walked forward, so blocks are already in start order
+    return result
+
+def to_placements(result: PlacementColumns) -> Tuple[List[Placement], List[TaskSchema]]:
+    """Converts columnar engine output to Placements, for callers that edit or merge them."""
+    tasks = result.columns.request.tasks
+    placements = [
+        Placement(tasks[task], start, end, minutes, result.break_after, slot)
+        for (task, slot, start, end), minutes in zip(result.times(), result.minutes)
+    ]
+    return placements, result.unscheduled_tasks()
+
+def schedule_pack(request: StudyRequest, break_after: int = DEFAULT_BREAK_MINUTES) -> Tuple[List[Placement], List[TaskSchema]]:
+    """The "pack" engine (see pack_columns) returning Placements."""
+    return to_placements(pack_columns(RequestColumns(request), break_after))
+
+def schedule_edd(request: StudyRequest, break_after: int = DEFAULT_BREAK_MINUTES) -> Tuple[List[Placement], List[TaskSchema]]:
+    """The "edd" engine (see edd_columns) returning Placements."""
+    return to_placements(edd_columns(RequestColumns(request), break_after))
+
+def schedule_pomodoro(request: StudyRequest, break_after: int = DEFAULT_BREAK_MINUTES) -> Tuple[List[Placement], List[TaskSchema]]:
+    """The "pomodoro" engine (see pomodoro_columns) returning Placements."""
+    return to_placements(pomodoro_columns(RequestColumns(request), break_after))
+
+def schedule_optimize(request: StudyRequest, break_after: int = DEFAULT_BREAK_MINUTES) -> Tuple[List[Placement], List[TaskSchema]]:
+    """Energy-aware optimizing mode; see optimizer.py. Imported lazily to keep numpy off the default path."""
+    from optimizer import optimize_schedule
+    return optimize_schedule(request, break_after)
+
+STRATEGIES = {
+    "pack": schedule_pack,
+    "edd": schedule_edd,
+    "pomodoro": schedule_pomodoro,
+    "optimize": schedule_optimize,
+}
+
+def run_strategy(request: StudyRequest) -> Tuple[List[Placement], List[TaskSchema], Optional[Dict[str, float]]]:
+    """Runs the engine selected by `request.strategy`; the optimizer also returns its report against greedy."""
+    if request.strategy == "optimize":
+        from optimizer import optimize_with_report
+        return optimize_with_report(request)
+    placements, unscheduled = STRATEGIES[request.strategy](request)
+    return placements, unscheduled, None
+
+COLUMN_STRATEGIES = {
+    "pack": pack_columns,
+    "edd": edd_columns,
+    "pomodoro": pomodoro_columns,
+}
@@ -0,0 +1,69 @@
+from typing import Any, Dict, List, Tuple
+from fastapi.responses import Response
+from pydantic_core import to_json
+from models import ScheduleResponse, Session, TaskSchema
+
+class ScheduleJSONResponse(Response):
+    """
+    JSON response for schedules that skips FastAPI's response_model round trip:
+    models are serialized straight to bytes by pydantic-core without being
+    dumped to dicts and validated again.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, ScheduleResponse):
+            return ScheduleResponse.__pydantic_serializer__.to_json(content)
+        return to_json(content)
+
+def compact_schedule(response: ScheduleResponse) -> Dict[str, Any]:
+    """
+    Converts a schedule to the compact format: every distinct task is listed
+    once in `tasks`, and each session is a [task_index, start_time, end_time,
+    break_after] array referencing it.
+    """
+    tasks: List[TaskSchema] = []
+    index: Dict[Tuple, int] = {}
+    sessions = []
+    by_id: Dict[int, int] = {} # Sessions of one task usually share its TaskSchema instance
+    for session in response.sessions:
+        task = session.task
+        i = by_id.get(id(task))
+        if i is None:
+            key = (task.title, task.due_date, task.duration_minutes, task.category)
+            i = index.get(key)
+            if i is None:
+                i = index[key] = len(tasks)
+                tasks.append(task)
+            by_id[id(task)] = i
+        sessions.append([i, session.start_time, session.end_time, session.break_after])
+    return {
+        "user_id": response.user_id,
+        "tasks": [
+            {"title": t.title, "due_date": t.due_date, "duration_minutes": t.duration_minutes, "category": t.category}
+            for t in tasks
+        ],
+        "sessions": sessions,
+        "total_study_time": response.total_study_time,
+        "total_break_time": response.total_break_time,
+        "success": response.success,
+        "message": response.message,
+        "warnings": response.warnings,
+        "stats": response.stats,
+        "diagnostics": response.diagnostics
+    }
+
+def expand_compact(payload: Dict[str, Any]) -> ScheduleResponse:
+    """Rebuilds a ScheduleResponse from a compact payload, e.g. one received from the API."""
+    tasks = [TaskSchema.model_validate(t) for t in payload["tasks"]]
+    sessions = [
+        Session(task=tasks[i], start_time=start, end_time=end, break_after=break_after)
+        for i, start, end, break_after in payload["sessions"]
+    ]
+    fields = {k: v for k, v in payload.items() if k not in ("tasks", "sessions")}
+    return ScheduleResponse(sessions=sessions, **fields)
+
+def schedule_response(response: ScheduleResponse, format: str = "full", status_code: int = 200) -> ScheduleJSONResponse:
+    """Renders a schedule in the requested format ("full" or "compact")."""
+    content = compact_schedule(response) if format == "compact" else response
+    return ScheduleJSONResponse(content, status_code=status_code)
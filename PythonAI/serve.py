@@ -0,0 +1,45 @@
+"""
+Runs the StudyBuddy backend with several uvicorn worker processes.
+
+Run from the PythonAI folder:
+    python serve.py --workers 4 --port 8000
+
+With more than one worker, the workers share the LLM response cache (SQLite),
+rate limits and metrics through local SQLite files, so /metrics and
+/cache/stats report the whole server whichever worker answers.
+"""
+import os
+import sys
+import argparse
+from typing import List, Optional
+
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0")) or os.cpu_count() or 1
+
+def configure_shared_state(workers: int):
+    """Points the workers at shared state unless it was configured explicitly."""
+    if workers > 1:
+        os.environ.setdefault("SHARED_STATE", "sqlite")
+        os.environ.setdefault("LLM_CACHE_BACKEND", "sqlite")
+    # Imported only now, since shared_state reads its settings at import
+    from shared_state import SharedState, SHARED_STATE, SHARED_STATE_PATH
+    if SHARED_STATE == "sqlite":
+        # Creating the tables before the workers start keeps them from racing to do it
+        state = SharedState(SHARED_STATE_PATH)
+        state.reset()
+        state.close()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the StudyBuddy backend with several worker processes.")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="Worker processes (default: SERVE_WORKERS or the CPU count)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    configure_shared_state(args.workers)
+    uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import logging
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, text, MetaData, Table, Column, Integer, String, Text, Float, select, delete
+from sqlalchemy.dialects.sqlite import insert
+from metrics import cumulative_only
+from utils import configure_sqlite
+
+load_dotenv()  # Load environment variables from .env file
+
+# State shared by the worker processes started by serve.py, see docs/setup-python-backend.md
+SHARED_STATE = os.getenv("SHARED_STATE", "none") # "sqlite" or "none"
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "shared_state.db")
+SHARED_STATE_FLUSH_SECONDS = float(os.getenv("SHARED_STATE_FLUSH_SECONDS", "1.0"))
+STALE_AFTER_SECONDS = 3 * SHARED_STATE_FLUSH_SECONDS # A snapshot older than this comes from a worker that has exited
+
+metadata = MetaData()
+
+worker_metrics = Table(
+    "worker_metrics", metadata,
+    Column("pid", Integer, primary_key=True),
+    Column("snapshot", Text, nullable=False),
+    Column("updated_at", Float, nullable=False)
+)
+
+rate_buckets = Table(
+    "rate_buckets", metadata,
+    Column("user_id", String(128), primary_key=True),
+    Column("tokens", Float, nullable=False),
+    Column("updated_at", Float, nullable=False),
+    Column("granted", Integer, nullable=False) # Whether the last request got a token
+)
+
+_TAKE_TOKEN = text("""
+    INSERT INTO rate_buckets (user_id, tokens, updated_at, granted) VALUES (:user_id, :burst - 1, :now, 1)
+    ON CONFLICT (user_id) DO UPDATE SET
+        granted = MIN(:burst, tokens + (:now - updated_at) * :rate) >= 1,
+        tokens = MIN(:burst, tokens + (:now - updated_at) * :rate) - (MIN(:burst, tokens + (:now - updated_at) * :rate) >= 1),
+        updated_at = :now
+    RETURNING tokens, granted
+""")
+
+class SharedState:
+    """
+    State that worker processes of one server share through a local SQLite
+    file in WAL mode: each worker's metric snapshot, so any worker can answer
+    a scrape for all of them, and the per-user rate limit buckets.
+    """
+
+    def __init__(self, path: str = SHARED_STATE_PATH):
+        self.path = path
+        self.pid = os.getpid()
+        self.engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 10})
+        event.listen(self.engine, "connect", configure_sqlite)
+        metadata.create_all(self.engine)
+
+    def reset(self):
+        """Forgets the metrics of earlier runs; called by the runner before workers start."""
+        with self.engine.begin() as conn:
+            conn.execute(delete(worker_metrics))
+
+    def publish_metrics(self, snapshot: Dict[str, List[list]]):
+        """Stores this worker's metric snapshot, replacing its previous one."""
+        values = {"pid": self.pid, "snapshot": json.dumps(snapshot), "updated_at": time.time()}
+        with self.engine.begin() as conn:
+            conn.execute(insert(worker_metrics).values(**values).on_conflict_do_update(index_elements=["pid"], set_=values))
+
+    def other_metrics(self) -> List[Dict[str, List[list]]]:
+        """
+        Metric snapshots last published by the other workers. Workers that
+        have exited only contribute their counters and histograms, so their
+        gauges don't show load that is gone.
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(worker_metrics.c.snapshot, worker_metrics.c.updated_at).where(worker_metrics.c.pid != self.pid)).all()
+        stale_before = time.time() - STALE_AFTER_SECONDS
+        snapshots = [json.loads(row.snapshot) for row in rows]
+        return [cumulative_only(snapshot) if row.updated_at < stale_before else snapshot for row, snapshot in zip(rows, snapshots)]
+
+    def take_token(self, user_id: str, rate: float, burst: int) -> float:
+        """
+        Token bucket shared by all workers: takes one token for `user_id`.
+        Returns 0 on success, else the seconds until a token is available.
+        """
+        with self.engine.begin() as conn:
+            # One upsert refills and takes the token atomically, so workers never race on a bucket
+            row = conn.execute(_TAKE_TOKEN, {"user_id": user_id, "now": time.time(), "rate": rate, "burst": float(burst)}).one()
+        return 0.0 if row.granted else (1 - row.tokens) / rate
+
+    def close(self):
+        self.engine.dispose()
+
+def create_shared_state(backend: str = SHARED_STATE) -> Optional[SharedState]:
+    """Returns the shared state store when running under the multi-worker runner, else None."""
+    if backend != "sqlite":
+        return None
+    try:
+        return SharedState()
+    except Exception as e:
+        logging.warning(f"[SHARED] Shared state unavailable ({e}), workers keep their state to themselves")
+        return None
+
+shared_state = create_shared_state()
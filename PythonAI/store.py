@@ -0,0 +1,147 @@
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, MetaData, Table, Column, Index, Integer, String, DateTime, select, delete, insert
+from models import ScheduleResponse, Session, TaskSchema
+from utils import configure_sqlite
+
+load_dotenv()  # Load environment variables from .env file
+
+# Schedule store settings, see docs/setup-python-backend.md
+SCHEDULE_STORE = os.getenv("SCHEDULE_STORE", "none") # "sqlite" or "none"
+SCHEDULE_DB_URL = os.getenv("SCHEDULE_DB_URL", f"sqlite:///{os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schedules.db')}")
+SCHEDULE_DB_POOL_SIZE = int(os.getenv("SCHEDULE_DB_POOL_SIZE", "5"))
+SCHEDULE_DB_MAX_OVERFLOW = int(os.getenv("SCHEDULE_DB_MAX_OVERFLOW", "10"))
+SCHEDULE_QUERY_LIMIT = 1000 # Upper bound on sessions returned by a ranged read
+
+metadata = MetaData()
+
+scheduled_sessions = Table(
+    "scheduled_sessions", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", String(128), nullable=False),
+    # Times are stored as naive UTC; the offsets restore timezone-aware values (NULL for naive ones)
+    Column("start_time", DateTime, nullable=False),
+    Column("end_time", DateTime, nullable=False),
+    Column("utc_offset", Integer),
+    Column("break_after", Integer),
+    Column("task_id", Integer),
+    Column("title", String(512), nullable=False),
+    Column("category", String(128)),
+    Column("due_date", DateTime, nullable=False),
+    Column("due_utc_offset", Integer),
+    Column("duration_minutes", Integer, nullable=False),
+    Column("generated_at", DateTime, nullable=False),
+    # Ranged reads and replacing a user's upcoming sessions both seek on this index
+    Index("ix_scheduled_sessions_user_start", "user_id", "start_time")
+)
+
+def to_utc(moment: datetime) -> datetime:
+    """Naive UTC value stored for `moment`; naive datetimes are taken to be UTC already."""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+def utc_offset(moment: datetime) -> Optional[int]:
+    """Offset of `moment` from UTC in minutes, or None for a naive datetime."""
+    offset = moment.utcoffset()
+    return None if offset is None else round(offset.total_seconds() / 60)
+
+def from_utc(stored: datetime, offset: Optional[int]) -> datetime:
+    """Reverses to_utc, giving back a datetime with the original offset."""
+    if offset is None:
+        return stored
+    return (stored + timedelta(minutes=offset)).replace(tzinfo=timezone(timedelta(minutes=offset)))
+
+class ScheduleStore:
+    """Persists generated schedules per user in a SQL database (SQLite by default)."""
+
+    def __init__(self, url: str = SCHEDULE_DB_URL, pool_size: int = SCHEDULE_DB_POOL_SIZE, max_overflow: int = SCHEDULE_DB_MAX_OVERFLOW):
+        options = {"pool_pre_ping": True}
+        if ":memory:" not in url and url != "sqlite://":
+            options.update(pool_size=pool_size, max_overflow=max_overflow)
+        self.engine = create_engine(url, **options)
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", configure_sqlite)
+        metadata.create_all(self.engine)
+
+    def save_schedule(self, response: ScheduleResponse) -> int:
+        """
+        Stores a schedule, replacing the user's sessions from its first session
+        on, so a regenerated plan supersedes the old one but past sessions stay.
+        Rows are written with one bulk insert. Returns the number of sessions stored.
+        """
+        if not response.sessions:
+            return 0
+        now = to_utc(datetime.now(timezone.utc))
+        first_start = min(to_utc(s.start_time) for s in response.sessions)
+        rows = [{
+            "user_id": response.user_id,
+            "start_time": to_utc(s.start_time),
+            "end_time": to_utc(s.end_time),
+            "utc_offset": utc_offset(s.start_time),
+            "break_after": s.break_after,
+            "task_id": s.task_id,
+            "title": s.task.title,
+            "category": s.task.category,
+            "due_date": to_utc(s.task.due_date),
+            "due_utc_offset": utc_offset(s.task.due_date),
+            "duration_minutes": s.task.duration_minutes,
+            "generated_at": now
+        } for s in response.sessions]
+        with self.engine.begin() as conn:
+            conn.execute(delete(scheduled_sessions).where(
+                scheduled_sessions.c.user_id == response.user_id,
+                scheduled_sessions.c.start_time >= first_start
+            ))
+            conn.execute(insert(scheduled_sessions), rows)
+        logging.debug(f"[STORE] Saved {len(rows)} sessions for user_id={response.user_id}")
+        return len(rows)
+
+    def get_sessions(self, user_id: str, start: datetime, end: datetime, limit: int = SCHEDULE_QUERY_LIMIT) -> List[Session]:
+        """
+        Returns the user's stored sessions starting in [start, end), in start
+        order, with the timezone offsets they were saved with.
+        """
+        c = scheduled_sessions.c
+        query = (
+            select(scheduled_sessions)
+            .where(c.user_id == user_id, c.start_time >= to_utc(start), c.start_time < to_utc(end))
+            .order_by(c.start_time)
+            .limit(limit)
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).all()
+        return [
+            Session(
+                task=TaskSchema(title=row.title, due_date=from_utc(row.due_date, row.due_utc_offset), duration_minutes=row.duration_minutes, category=row.category),
+                task_id=row.task_id,
+                start_time=from_utc(row.start_time, row.utc_offset),
+                end_time=from_utc(row.end_time, row.utc_offset),
+                break_after=row.break_after
+            )
+            for row in rows
+        ]
+
+    def delete_user(self, user_id: str) -> int:
+        """Removes all stored sessions of a user. Returns the number of rows deleted."""
+        with self.engine.begin() as conn:
+            return conn.execute(delete(scheduled_sessions).where(scheduled_sessions.c.user_id == user_id)).rowcount
+
+    def close(self):
+        self.engine.dispose()
+
+def create_store(backend: str = SCHEDULE_STORE) -> Optional[ScheduleStore]:
+    """
+    Returns the configured schedule store, or None when persistence is disabled.
+    The app opens it at startup rather than at import.
+    """
+    if backend == "none":
+        return None
+    try:
+        return ScheduleStore()
+    except Exception as e:
+        logging.warning(f"[STORE] Schedule store unavailable ({e}), schedules will not be persisted")
+        return None
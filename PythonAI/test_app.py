@@ -1,8 +1,10 @@
 # test app.py by running pytest test_app.py
+import pytest
 from fastapi.testclient import TestClient
 from app import app
 from datetime import datetime, timedelta
 from unittest.mock import patch
+from models import StudyRequest
 
 client = TestClient(app)
 
@@ -353,3 +355,1469 @@ def test_ai_schedule_fallback_to_rule_based():
     assert data["sessions"][0]["task"]["title"] == "Fallback Task"
     assert "fallback" in data["warnings"][0].lower()
     assert data["success"] is False
+
+def test_generate_schedule_skips_task_that_does_not_fit():
+    request_data = {
+        "user_id": "pack_user",
+        "energy_level": [2, 2],
+        "pomodoro_length": 25,
+        "available_slots": [
+            {"start_time": "2025-06-11T10:00:00", "end_time": "2025-06-11T11:00:00"},
+            {"start_time": "2025-06-11T14:00:00", "end_time": "2025-06-11T16:00:00"}
+        ],
+        "tasks": [
+            {"title": "Long Task", "due_date": "2025-06-12T23:59:59", "duration_minutes": 90, "category": "Long"},
+            {"title": "Short Task", "due_date": "2025-06-13T23:59:59", "duration_minutes": 30, "category": "Short"}
+        ]
+    }
+
+    response = client.post("/generate_schedule", json=request_data)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    assert [s["task"]["title"] for s in data["sessions"]] == ["Short Task", "Long Task"]
+    assert data["sessions"][0]["start_time"] == "2025-06-11T10:00:00"
+    assert data["sessions"][1]["start_time"] == "2025-06-11T14:00:00"
+
+    # The compatibility mode keeps the original earliest-due-date output
+    response = client.post("/generate_schedule", json={**request_data, "strategy": "edd"})
+    data = response.json()
+    assert [s["task"]["title"] for s in data["sessions"]] == ["Long Task"]
+    assert data["sessions"][0]["start_time"] == "2025-06-11T14:00:00"
+    assert data["success"] is False
+
+def test_generate_schedule_respects_due_dates():
+    request_data = {
+        "user_id": "due_user",
+        "energy_level": [2, 2],
+        "pomodoro_length": 25,
+        "available_slots": [
+            {"start_time": "2025-06-11T10:00:00", "end_time": "2025-06-11T10:30:00"},
+            {"start_time": "2025-06-12T10:00:00", "end_time": "2025-06-12T12:00:00"}
+        ],
+        "tasks": [
+            {"title": "Due Tonight", "due_date": "2025-06-11T23:59:59", "duration_minutes": 60, "category": "Late"}
+        ]
+    }
+
+    response = client.post("/generate_schedule", json=request_data)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is False
+    assert data["sessions"] == []
+    assert "Due Tonight" in data["warnings"][0]
+
+def test_call_openai_api_retries_with_shared_client():
+    import asyncio
+    import httpx
+    import openai
+    import ai_model
+    from types import SimpleNamespace
+    from unittest.mock import AsyncMock, MagicMock
+
+    completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(
+        content='[{"task": "Retry", "start": "2025-06-11T10:00:00", "end": "2025-06-11T10:25:00"}]'
+    ))])
+    timeout_error = openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com"))
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(side_effect=[timeout_error, completion])
+
+    with patch("ai_model._openai_client", fake_client), patch("ai_model.asyncio.sleep", new=AsyncMock()) as sleep:
+        result = asyncio.run(ai_model.call_openai_api("prompt", delay=0.01))
+    assert result[0]["task"] == "Retry"
+    assert fake_client.chat.completions.create.await_count == 2
+    sleep.assert_awaited_once()
+
+def test_call_openai_api_serves_cached_response():
+    import asyncio
+    import ai_model
+    from cache import MemoryCache
+    from types import SimpleNamespace
+    from unittest.mock import AsyncMock, MagicMock
+
+    completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(
+        content='[{"task": "Cached", "start": "2025-06-11T10:00:00", "end": "2025-06-11T10:25:00"}]'
+    ))])
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(return_value=completion)
+    memory_cache = MemoryCache(max_entries=8, ttl=60)
+
+    with patch("ai_model._openai_client", fake_client), patch("ai_model.response_cache", memory_cache):
+        first = asyncio.run(ai_model.call_openai_api("same prompt"))
+        second = asyncio.run(ai_model.call_openai_api("same prompt"))
+    assert first == second
+    assert fake_client.chat.completions.create.await_count == 1
+    assert memory_cache.stats()["hits"] == 1
+    assert memory_cache.stats()["misses"] == 1
+
+def test_call_openai_api_returns_reply_when_cache_write_fails():
+    import asyncio
+    import ai_model
+    from cache import MemoryCache
+    from types import SimpleNamespace
+    from unittest.mock import AsyncMock, MagicMock
+
+    completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(
+        content='[{"task": "Uncached", "start": "2025-06-11T10:00:00", "end": "2025-06-11T10:25:00"}]'
+    ))])
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(return_value=completion)
+    memory_cache = MemoryCache(max_entries=8, ttl=60)
+
+    with patch("ai_model._openai_client", fake_client), patch("ai_model.response_cache", memory_cache), \
+            patch.object(memory_cache, "aset", AsyncMock(side_effect=OSError("disk full"))):
+        result = asyncio.run(ai_model.call_openai_api("unlucky prompt"))
+    assert result[0]["task"] == "Uncached"
+    assert ai_model._inflight == {}
+
+def test_sqlite_cache_evicts_least_recently_used(tmp_path):
+    from cache import SQLiteCache, cache_key
+
+    sqlite_cache = SQLiteCache(path=str(tmp_path / "cache.db"), max_entries=2, ttl=60)
+    keys = [cache_key(f"prompt {i}", model="gpt-4") for i in range(3)]
+    sqlite_cache.set(keys[0], [{"task": "A"}])
+    sqlite_cache.set(keys[1], [{"task": "B"}])
+    assert sqlite_cache.get(keys[0]) == [{"task": "A"}]
+    sqlite_cache.set(keys[2], [{"task": "C"}])
+    assert sqlite_cache.get(keys[1]) is None
+    assert sqlite_cache.get(keys[2]) == [{"task": "C"}]
+    assert sqlite_cache.stats()["entries"] == 2
+
+    expired_cache = SQLiteCache(path=str(tmp_path / "expired.db"), ttl=-1)
+    expired_cache.set(keys[0], [{"task": "A"}])
+    assert expired_cache.get(keys[0]) is None
+
+def test_call_openai_api_reads_and_writes_sqlite_cache_off_the_event_loop(tmp_path):
+    import asyncio
+    import threading
+    import ai_model
+    from cache import SQLiteCache
+    from types import SimpleNamespace
+    from unittest.mock import AsyncMock, MagicMock
+
+    completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(
+        content='[{"task": "Disk", "start": "2025-06-11T10:00:00", "end": "2025-06-11T10:25:00"}]'
+    ))])
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = AsyncMock(return_value=completion)
+    sqlite_cache = SQLiteCache(path=str(tmp_path / "cache.db"), max_entries=8, ttl=60)
+    threads = []
+    get, set_ = sqlite_cache.get, sqlite_cache.set
+    def record(method):
+        def wrapper(*args):
+            threads.append(threading.get_ident())
+            return method(*args)
+        return wrapper
+
+    with patch("ai_model._openai_client", fake_client), patch("ai_model.response_cache", sqlite_cache), \
+            patch.object(sqlite_cache, "get", record(get)), patch.object(sqlite_cache, "set", record(set_)):
+        first = asyncio.run(ai_model.call_openai_api("disk prompt"))
+        second = asyncio.run(ai_model.call_openai_api("disk prompt"))
+    assert first == second
+    assert fake_client.chat.completions.create.await_count == 1
+    assert len(threads) == 3 and threading.get_ident() not in threads # get, set, get
+    assert sqlite_cache.hits == 1
+
+def test_call_openai_api_coalesces_concurrent_prompts():
+    import asyncio
+    import ai_model
+    from types import SimpleNamespace
+    from unittest.mock import MagicMock
+
+    completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(
+        content='[{"task": "Shared", "start": "2025-06-11T10:00:00", "end": "2025-06-11T10:25:00"}]'
+    ))])
+    calls = []
+
+    async def slow_create(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.05)
+        return completion
+
+    fake_client = MagicMock()
+    fake_client.chat.completions.create = slow_create
+
+    async def run_concurrently():
+        return await asyncio.gather(*(ai_model.call_openai_api("coalesced prompt", use_cache=False) for _ in range(5)))
+
+    before = dict(ai_model.singleflight_counters)
+    with patch("ai_model._openai_client", fake_client):
+        results = asyncio.run(run_concurrently())
+    assert len(calls) == 1
+    assert all(result == results[0] for result in results)
+    assert ai_model.singleflight_counters["deduplicated"] - before["deduplicated"] == 4
+
+    # Failures fan out to every waiter as well
+    async def failing_create(**kwargs):
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    fake_client.chat.completions.create = failing_create
+    async def run_failing():
+        return await asyncio.gather(*(ai_model.call_openai_api("failing prompt", max_retries=1, use_cache=False) for _ in range(3)), return_exceptions=True)
+
+    with patch("ai_model._openai_client", fake_client):
+        errors = asyncio.run(run_failing())
+    assert all(isinstance(error, ValueError) for error in errors)
+
+def test_chat_stream_emits_sessions_incrementally():
+    import json
+
+    chunks = [
+        "Sure! Here is your plan:\n[\n  {\"task\": \"Study physics\", \"start\": \"2025-07-21T18:00:00\", ",
+        "\"end\": \"2025-07-21T18:25:00\", \"category\": \"Science\"},\n  {\"task\": \"Study {braces}\", ",
+        "\"start\": \"2025-07-21T18:30:00\", \"end\": \"2025-07-21T18:55:00\", \"category\": \"Science\"}\n]"
+    ]
+
+    async def fake_stream(prompt, **kwargs):
+        for chunk in chunks:
+            yield chunk
+
+    with patch("app.stream_openai_api", fake_stream):
+        response = client.post("/chat/stream", json={"user_id": 1, "message": "I need to study for 1 hour tonight"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    names = [name for name, _ in events]
+    assert names == ["token", "token", "session", "token", "session", "done"]
+    assert "".join(data["text"] for name, data in events if name == "token") == "".join(chunks)
+    assert events[2][1]["task"]["title"] == "Study physics"
+    assert events[4][1]["task"]["title"] == "Study {braces}"
+    assert events[-1][1] == {"sessions": 2}
+
+def test_generate_schedule_batch_streams_per_item_results():
+    import json
+
+    valid_request = {
+        "user_id": "batch_user",
+        "energy_level": [2],
+        "pomodoro_length": 25,
+        "available_slots": [{"start_time": "2025-06-11T10:00:00", "end_time": "2025-06-11T12:00:00"}],
+        "tasks": [{"title": "Batch Task", "due_date": "2025-06-12T23:59:59", "duration_minutes": 30, "category": "Batch"}]
+    }
+    no_tasks_request = {**valid_request, "user_id": "empty_user", "tasks": []}
+
+    response = client.post("/generate_schedule/batch", json=[valid_request, no_tasks_request, {"user_id": "broken"}])
+    assert response.status_code == 200
+    results = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda r: r["index"])
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert results[0]["response"]["sessions"][0]["task"]["title"] == "Batch Task"
+    assert results[1]["error"] == "No tasks provided for scheduling."
+    assert "error" in results[2]
+
+    ndjson_body = "\n".join([json.dumps(valid_request), "not json", json.dumps(valid_request)]) + "\n"
+    response = client.post("/generate_schedule/batch", content=ndjson_body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    results = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda r: r["index"])
+    assert [("response" in r) for r in results] == [True, False, True]
+
+def test_generate_schedule_batch_rejects_oversized_batches():
+    import json
+
+    item = {"user_id": "batch_limit_user", "tasks": []}
+    with patch("app.BATCH_MAX_ITEMS", 2):
+        too_many = client.post("/generate_schedule/batch", json=[item] * 3)
+        streamed = client.post("/generate_schedule/batch", content="\n".join(json.dumps(item) for _ in range(3)), headers={"Content-Type": "application/x-ndjson"})
+        allowed = client.post("/generate_schedule/batch", json=[item] * 2)
+    assert too_many.status_code == streamed.status_code == 413
+    assert "more than 2" in too_many.json()["detail"]
+    assert allowed.status_code == 200
+
+def test_submit_batch_bounds_chunks_in_flight():
+    import asyncio
+    import threading
+    import time
+    import batch
+    from concurrent.futures import ThreadPoolExecutor
+
+    running, peak = 0, 0
+    lock = threading.Lock()
+
+    def slow_chunk(chunk):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return [{"index": index} for index, _ in chunk]
+
+    async def run():
+        pending = await batch.submit_batch(range(12), chunk_size=2)
+        return [result async for result in batch.iter_completed(pending)]
+
+    with ThreadPoolExecutor(max_workers=6) as executor, patch("batch.get_batch_executor", return_value=executor), \
+            patch("batch.schedule_chunk", slow_chunk), patch("batch.BATCH_MAX_INFLIGHT_CHUNKS", 2), patch("batch._batch_slots", None):
+        results = asyncio.run(run())
+    assert sorted(r["index"] for r in results) == list(range(12))
+    assert peak == 2 # Six chunks, six threads, but never more than two in the pool
+
+def test_schedule_batch_python_api():
+    from batch import schedule_batch
+    from models import StudyRequest
+
+    requests = [
+        StudyRequest(
+            user_id=f"user_{i}",
+            energy_level=[2],
+            available_slots=[{"start_time": "2025-06-11T10:00:00", "end_time": "2025-06-11T12:00:00"}],
+            tasks=[{"title": f"Task {i}", "due_date": "2025-06-12T23:59:59", "duration_minutes": 30}]
+        )
+        for i in range(10)
+    ]
+    results = list(schedule_batch(requests, workers=2, chunk_size=3))
+    assert sorted(r["index"] for r in results) == list(range(10))
+    assert all(r["response"]["user_id"] == f"user_{r['index']}" for r in results)
+
+def test_generate_schedule_rejects_when_executor_saturated():
+    from offload import BoundedExecutor
+
+    request_data = {
+        "user_id": "busy_user",
+        "energy_level": [2],
+        "pomodoro_length": 25,
+        "available_slots": [{"start_time": "2025-06-11T10:00:00", "end_time": "2025-06-11T12:00:00"}],
+        "tasks": [{"title": "Busy Task", "due_date": "2025-06-12T23:59:59", "duration_minutes": 30, "category": "Busy"}]
+    }
+
+    with patch("app.scheduler_executor", BoundedExecutor(max_pending=0)):
+        response = client.post("/generate_schedule", json=request_data)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    process_executor = BoundedExecutor(kind="process", workers=1)
+    try:
+        with patch("app.scheduler_executor", process_executor):
+            response = client.post("/generate_schedule", json=request_data)
+    finally:
+        process_executor.shutdown()
+    assert response.status_code == 200
+    assert response.json()["sessions"][0]["task"]["title"] == "Busy Task"
+
+def test_benchmark_report_and_regression_check():
+    import benchmark
+
+    report = benchmark.run_benchmarks(["engine", "prompt", "parse"], sizes=[10], repeats=1, endpoints=False)
+    names = {r["name"] for r in report["results"]}
+    assert names == {"generate_schedule", "format_schedule_prompt", "build_schedule_prompts", "parse_llm_response"}
+    assert all(r["median_s"] >= 0 for r in report["results"])
+
+    slower = {"results": [{**r, "median_s": r["median_s"] * 10} for r in report["results"]]}
+    assert benchmark.compare(report, report, threshold=1.25) == []
+    assert len(benchmark.compare(slower, report, threshold=1.25)) == len(report["results"])
+
+    endpoint_results = benchmark.bench_endpoints(requests=4, concurrency=2, size=5)
+    assert all(r["throughput_rps"] > 0 for r in endpoint_results)
+
+def test_metrics_endpoint_exposes_prometheus_text():
+    mock_response = [{"task": "Metered", "start": "2025-06-11T10:00:00", "end": "2025-06-11T10:30:00", "category": "Metrics"}]
+    request_data = {
+        "user_id": "metrics_user",
+        "energy_level": [3],
+        "pomodoro_length": 25,
+        "available_slots": [{"start_time": "2025-06-11T10:00:00", "end_time": "2025-06-11T12:00:00"}],
+        "tasks": [{"title": "Metered", "due_date": "2025-06-11T23:59:59", "duration_minutes": 30, "category": "Metrics"}]
+    }
+
+    with patch("app.call_openai_api", return_value=mock_response):
+        client.post("/generate_ai_schedule", json=request_data)
+    with patch("app.call_openai_api", side_effect=Exception("Simulated API failure")):
+        client.post("/generate_ai_schedule", json=request_data)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE studybuddy_stage_duration_seconds histogram" in body
+    assert 'studybuddy_stage_duration_seconds_count{stage="prompt_build"}' in body
+    assert 'studybuddy_stage_duration_seconds_bucket{stage="fallback",le="+Inf"}' in body
+    assert 'studybuddy_ai_schedule_requests_total{result="ai"}' in body
+    assert 'studybuddy_ai_schedule_requests_total{result="fallback"}' in body
+    assert 'studybuddy_http_request_duration_seconds_count{method="POST",path="/generate_ai_schedule",status="200"}' in body
+
+def test_histogram_buckets_are_cumulative():
+    from metrics import Histogram, _registry
+
+    histogram = Histogram("test_latency_seconds", "Test histogram.", buckets=(0.1, 1.0))
+    _registry.remove(histogram)
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    lines = histogram.samples()
+    assert 'test_latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'test_latency_seconds_bucket{le="1.0"} 3' in lines
+    assert 'test_latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "test_latency_seconds_count 4" in lines
+
+def test_optimize_strategy_moves_long_tasks_to_high_energy_slots():
+    request_data = {
+        "user_id": "optimize_user",
+        "energy_level": [1, 3],
+        "pomodoro_length": 25,
+        "available_slots": [
+            {"start_time": "2025-06-11T09:00:00", "end_time": "2025-06-11T13:00:00"},
+            {"start_time": "2025-06-11T14:00:00", "end_time": "2025-06-11T17:00:00"}
+        ],
+        "tasks": [
+            {"title": "Long Task", "due_date": "2025-06-13T09:00:00", "duration_minutes": 120, "category": "Math"},
+            {"title": "Short Task", "due_date": "2025-06-12T09:00:00", "duration_minutes": 30, "category": "History"}
+        ]
+    }
+
+    greedy = client.post("/generate_schedule", json=request_data).json()
+    assert greedy["stats"] is None
+    assert all(s["end_time"] <= "2025-06-11T13:00:00" for s in greedy["sessions"]) # Both in the low-energy slot
+    assert greedy["total_study_time"] == 38 + 150
+
+    response = client.post("/generate_schedule", json={**request_data, "strategy": "optimize"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    long_session = next(s for s in data["sessions"] if s["task"]["title"] == "Long Task")
+    assert long_session["start_time"] >= "2025-06-11T14:00:00"
+    assert long_session["end_time"] <= "2025-06-11T17:00:00"
+    assert data["total_study_time"] < greedy["total_study_time"]
+    assert data["stats"]["greedy_study_minutes"] == 188
+    assert data["stats"]["improvement_pct"] > 0
+
+def test_optimizer_respects_latency_budget_and_never_loses_to_greedy():
+    from itertools import count
+    from benchmark import make_study_request
+    from optimizer import optimize_with_report
+
+    request = make_study_request(1000, 1000, seed=3)
+    ticks = count()
+    clock = lambda: next(ticks) / 10000 # Every clock read advances 0.1 ms, so the budget runs out after a fixed number of steps
+    placements, unscheduled, report = optimize_with_report(request, budget_ms=50, clock=clock)
+
+    assert report["budget_exceeded"] == 0
+    assert report["elapsed_ms"] <= 50
+    assert report["objective"] <= report["greedy_objective"]
+    assert len(placements) + len(unscheduled) == 1000
+    by_slot = {}
+    for p in placements:
+        slot = request.available_slots[p.slot_index]
+        assert slot.start_time <= p.start_time and p.end_time <= slot.end_time
+        assert p.end_time <= p.task.due_date
+        by_slot.setdefault(p.slot_index, []).append(p)
+    for sessions in by_slot.values():
+        sessions.sort(key=lambda p: p.start_time)
+        for before, after in zip(sessions, sessions[1:]):
+            assert before.end_time + timedelta(minutes=before.break_after) <= after.start_time
+
+def test_optimizer_returns_greedy_plan_when_budget_is_used_up():
+    from itertools import count
+    from benchmark import make_study_request
+    from optimizer import optimize_with_report
+    from scheduler import schedule_pack
+
+    request = make_study_request(200, 200, seed=5)
+    ticks = count()
+    clock = lambda: next(ticks) # Every clock read advances a full second
+    placements, unscheduled, report = optimize_with_report(request, budget_ms=50, clock=clock)
+
+    greedy_placements, greedy_unscheduled = schedule_pack(request)
+    assert report["budget_exceeded"] == 1
+    assert "objective" not in report
+    assert [(p.task.title, p.start_time) for p in placements] == [(p.task.title, p.start_time) for p in greedy_placements]
+    assert unscheduled == greedy_unscheduled
+
+def test_pomodoro_strategy_splits_long_tasks_across_slots():
+    request_data = {
+        "user_id": "pomodoro_user",
+        "energy_level": [2, 2],
+        "pomodoro_length": 50,
+        "available_slots": [
+            {"start_time": "2025-06-11T09:00:00", "end_time": "2025-06-11T11:00:00"},
+            {"start_time": "2025-06-11T13:00:00", "end_time": "2025-06-11T15:00:00"}
+        ],
+        "tasks": [
+            {"title": "Three Hour Task", "due_date": "2025-06-12T09:00:00", "duration_minutes": 180, "category": "Math"}
+        ]
+    }
+
+    greedy = client.post("/generate_schedule", json=request_data).json()
+    assert greedy["success"] is False
+
+    response = client.post("/generate_schedule", json={**request_data, "strategy": "pomodoro"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    assert [(s["start_time"][11:16], s["end_time"][11:16]) for s in data["sessions"]] == [
+        ("09:00", "09:50"), ("09:55", "10:45"), ("13:00", "13:50"), ("13:55", "14:25")
+    ]
+    assert data["total_study_time"] == 180
+
+def test_pomodoro_strategy_rolls_back_tasks_that_miss_their_due_date():
+    from models import StudyRequest
+    from scheduler import schedule_pomodoro
+
+    request = StudyRequest(
+        user_id="pomodoro_rollback",
+        energy_level=[2, 2],
+        pomodoro_length=25,
+        available_slots=[
+            {"start_time": "2025-06-11T09:00:00", "end_time": "2025-06-11T10:00:00"},
+            {"start_time": "2025-06-11T13:00:00", "end_time": "2025-06-11T14:00:00"}
+        ],
+        tasks=[
+            {"title": "Too Big", "due_date": "2025-06-11T12:00:00", "duration_minutes": 90},
+            {"title": "Fits", "due_date": "2025-06-11T18:00:00", "duration_minutes": 50}
+        ],
+        strategy="pomodoro"
+    )
+
+    placements, unscheduled = schedule_pomodoro(request)
+    assert [t.title for t in unscheduled] == ["Too Big"]
+    assert {p.task.title for p in placements} == {"Fits"}
+    assert placements[0].start_time.isoformat() == "2025-06-11T09:00:00"
+
+def test_pomodoro_length_must_be_positive():
+    from models import StudyRequest
+    from scheduler import schedule_pomodoro
+
+    request_data = {
+        "user_id": "pomodoro_negative",
+        "energy_level": [2],
+        "pomodoro_length": -25,
+        "available_slots": [{"start_time": "2025-06-11T09:00:00", "end_time": "2025-06-11T11:00:00"}],
+        "tasks": [{"title": "Essay", "due_date": "2025-06-12T09:00:00", "duration_minutes": 60}],
+        "strategy": "pomodoro"
+    }
+    assert client.post("/generate_schedule", json=request_data).status_code == 422
+
+    # Requests built without validation fall back to the default block length
+    request = StudyRequest.model_validate({**request_data, "pomodoro_length": 25}).model_copy(update={"pomodoro_length": -25})
+    placements, unscheduled = schedule_pomodoro(request)
+    assert unscheduled == []
+    assert [p.duration_minutes for p in placements] == [25, 25, 10]
+
+def test_task_duration_must_be_positive():
+    from models import StudyRequest
+    from scheduler import schedule_pomodoro
+
+    request_data = {
+        "user_id": "zero_duration",
+        "energy_level": [2],
+        "available_slots": [{"start_time": "2025-06-11T09:00:00", "end_time": "2025-06-11T11:00:00"}],
+        "tasks": [
+            {"title": "Essay", "due_date": "2025-06-12T09:00:00", "duration_minutes": 60},
+            {"title": "Nothing", "due_date": "2025-06-12T09:00:00", "duration_minutes": 0}
+        ],
+        "strategy": "pomodoro"
+    }
+    assert client.post("/generate_schedule", json=request_data).status_code == 422
+    negative = {**request_data, "tasks": [{**request_data["tasks"][1], "duration_minutes": -30}]}
+    assert client.post("/generate_schedule", json=negative).status_code == 422
+
+    # Requests built without validation report such tasks as unscheduled
+    valid = StudyRequest.model_validate({**request_data, "tasks": request_data["tasks"][:1]})
+    request = valid.model_copy(update={"tasks": [valid.tasks[0], valid.tasks[0].model_copy(update={"title": "Nothing", "duration_minutes": 0})]})
+    placements, unscheduled = schedule_pomodoro(request)
+    assert [t.title for t in unscheduled] == ["Nothing"]
+    assert {p.task.title for p in placements} == {"Essay"}
+
+def test_pomodoro_strategy_skips_many_unfittable_tasks_without_walking_slots_again():
+    from models import StudyRequest
+    from scheduler import schedule_pomodoro
+
+    base = datetime(2025, 6, 11, 8)
+    request = StudyRequest(
+        user_id="pomodoro_many",
+        pomodoro_length=25,
+        available_slots=[{"start_time": base + timedelta(hours=2 * i), "end_time": base + timedelta(hours=2 * i, minutes=60)} for i in range(3000)],
+        tasks=[{"title": f"Huge {i}", "due_date": base + timedelta(days=300), "duration_minutes": 10 ** 6} for i in range(3000)]
+        + [{"title": "Small", "due_date": base + timedelta(days=300), "duration_minutes": 60}],
+        strategy="pomodoro"
+    )
+
+    # Each unfittable task is rejected from the prefix sums; walking the slots again per task took minutes here
+    placements, unscheduled = schedule_pomodoro(request)
+    assert len(unscheduled) == 3000
+    assert [(p.start_time.strftime("%H:%M"), p.duration_minutes) for p in placements] == [("08:00", 25), ("08:30", 25), ("10:00", 10)]
+
+def _reschedule_base():
+    return {
+        "user_id": "reschedule_user",
+        "energy_level": [2, 2],
+        "pomodoro_length": 25,
+        "available_slots": [
+            {"start_time": "2025-06-11T09:00:00", "end_time": "2025-06-11T12:00:00"},
+            {"start_time": "2025-06-12T09:00:00", "end_time": "2025-06-12T12:00:00"}
+        ],
+        "tasks": [
+            {"title": "First", "due_date": "2025-06-11T18:00:00", "duration_minutes": 60, "category": "Math"},
+            {"title": "Second", "due_date": "2025-06-12T18:00:00", "duration_minutes": 60, "category": "History"},
+            {"title": "Third", "due_date": "2025-06-13T18:00:00", "duration_minutes": 90, "category": "Science"}
+        ]
+    }
+
+def test_reschedule_keeps_sessions_before_the_change():
+    base = _reschedule_base()
+    previous = client.post("/generate_schedule", json=base).json()
+    assert [s["task"]["title"] for s in previous["sessions"]] == ["First", "Second", "Third"]
+
+    response = client.post("/reschedule", json={
+        "user_id": base["user_id"],
+        "previous": previous,
+        "energy_level": base["energy_level"],
+        "available_slots": base["available_slots"],
+        "delta": {
+            "removed_tasks": ["Second"],
+            "added_tasks": [{"title": "Late Essay", "due_date": "2025-06-14T18:00:00", "duration_minutes": 30, "category": "Writing"}]
+        }
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    assert data["sessions"][0] == previous["sessions"][0] # Untouched session stays identical
+    assert [s["task"]["title"] for s in data["sessions"]] == ["First", "Third", "Late Essay"]
+
+    # The patched suffix matches what a full recompute would produce
+    full = client.post("/generate_schedule", json={**base, "tasks": [base["tasks"][0], base["tasks"][2], {"title": "Late Essay", "due_date": "2025-06-14T18:00:00", "duration_minutes": 30, "category": "Writing"}]}).json()
+    assert data["sessions"] == full["sessions"]
+    assert data["total_study_time"] == full["total_study_time"]
+    assert data["total_break_time"] == full["total_break_time"]
+
+def test_reschedule_moves_sessions_out_of_removed_slots():
+    base = _reschedule_base()
+    previous = client.post("/generate_schedule", json=base).json()
+
+    response = client.post("/reschedule", json={
+        "user_id": base["user_id"],
+        "previous": previous,
+        "energy_level": base["energy_level"],
+        "available_slots": base["available_slots"],
+        "delta": {
+            "removed_slots": [base["available_slots"][1]],
+            "added_slots": [{"start_time": "2025-06-12T14:00:00", "end_time": "2025-06-12T17:00:00"}],
+            "added_energy_level": [3]
+        }
+    })
+    data = response.json()
+    assert data["success"] is True
+    assert data["sessions"][:2] == previous["sessions"][:2]
+    assert data["sessions"][2]["task"]["title"] == "Third"
+    assert data["sessions"][2]["start_time"] == "2025-06-12T14:00:00"
+    assert data["sessions"][2]["end_time"] == "2025-06-12T15:08:00" # High-energy slot shortens the session
+
+def test_reschedule_clips_added_slots_to_the_kept_sessions():
+    base = _reschedule_base()
+    previous = client.post("/generate_schedule", json=base).json()
+    kept = previous["sessions"][:2]
+    assert [(s["start_time"], s["end_time"]) for s in kept] == [
+        ("2025-06-11T09:00:00", "2025-06-11T10:00:00"), ("2025-06-11T10:05:00", "2025-06-11T11:05:00")
+    ]
+
+    response = client.post("/reschedule", json={
+        "user_id": base["user_id"],
+        "previous": previous,
+        "energy_level": base["energy_level"],
+        "available_slots": base["available_slots"],
+        "delta": {
+            "removed_tasks": ["Third"],
+            "added_tasks": [{"title": "Quiz Prep", "due_date": "2025-06-14T18:00:00", "duration_minutes": 30}],
+            "added_slots": [{"start_time": "2025-06-11T10:00:00", "end_time": "2025-06-11T10:40:00"}]
+        }
+    })
+    data = response.json()
+    assert data["sessions"][:2] == kept
+    # The added slot lies inside the kept sessions, so it must not be double-booked
+    assert data["sessions"][2]["task"]["title"] == "Quiz Prep"
+    assert data["sessions"][2]["start_time"] == "2025-06-11T11:10:00"
+
+def test_reschedule_retries_previously_unscheduled_tasks_sent_again():
+    base = _reschedule_base()
+    too_big = {"title": "Too Big", "due_date": "2025-06-11T12:00:00", "duration_minutes": 500}
+    previous = client.post("/generate_schedule", json={**base, "tasks": base["tasks"] + [too_big]}).json()
+    assert previous["success"] is False
+
+    request = {
+        "user_id": base["user_id"],
+        "previous": previous,
+        "energy_level": base["energy_level"],
+        "available_slots": base["available_slots"]
+    }
+    kept_warning = client.post("/reschedule", json={**request, "delta": {"added_slots": [{"start_time": "2025-06-13T09:00:00", "end_time": "2025-06-13T12:00:00"}]}}).json()
+    assert any("'Too Big'" in w for w in kept_warning["warnings"])
+
+    # Sent again with a later due date, it is rescheduled and its old warning goes away
+    retried = client.post("/reschedule", json={**request, "delta": {
+        "added_tasks": [{**too_big, "due_date": "2025-06-20T12:00:00", "duration_minutes": 60}],
+        "added_slots": [{"start_time": "2025-06-13T09:00:00", "end_time": "2025-06-13T12:00:00"}]
+    }}).json()
+    assert retried["success"] is True
+    assert "Too Big" in [s["task"]["title"] for s in retried["sessions"]]
+
+def test_schedule_store_bulk_saves_and_reads_ranges(tmp_path):
+    from store import ScheduleStore
+    from models import ScheduleResponse, Session, TaskSchema
+
+    store = ScheduleStore(f"sqlite:///{tmp_path / 'schedules.db'}")
+    day = datetime(2025, 6, 11, 9, 0)
+
+    def plan(titles, first_day):
+        sessions = [
+            Session(
+                task=TaskSchema(title=title, due_date=day + timedelta(days=30), duration_minutes=60, category="Math"),
+                start_time=first_day + timedelta(days=i),
+                end_time=first_day + timedelta(days=i, hours=1)
+            )
+            for i, title in enumerate(titles)
+        ]
+        return ScheduleResponse(user_id="store_user", sessions=sessions, total_study_time=60 * len(titles), total_break_time=5 * len(titles))
+
+    assert store.save_schedule(plan([f"Old {i}" for i in range(10)], day)) == 10
+    # A regenerated plan replaces the sessions from its first session on and keeps earlier ones
+    assert store.save_schedule(plan(["New 0", "New 1"], day + timedelta(days=5))) == 2
+
+    week = store.get_sessions("store_user", day, day + timedelta(days=7))
+    assert [s.task.title for s in week] == ["Old 0", "Old 1", "Old 2", "Old 3", "Old 4", "New 0", "New 1"]
+    assert week[0].start_time == day and week[0].task.category == "Math"
+    assert store.get_sessions("other_user", day, day + timedelta(days=7)) == []
+    assert len(store.get_sessions("store_user", day, day + timedelta(days=30), limit=3)) == 3
+    assert store.delete_user("store_user") == 7
+    store.close()
+
+def test_generated_schedules_are_served_from_the_store(tmp_path):
+    from store import ScheduleStore
+
+    store = ScheduleStore(f"sqlite:///{tmp_path / 'schedules.db'}")
+    request_data = _reschedule_base()
+    with patch("app.schedule_store", store):
+        generated = client.post("/generate_schedule", json=request_data).json()
+        response = client.get("/schedules/reschedule_user", params={"start": "2025-06-11T00:00:00", "days": 7})
+        assert response.status_code == 200
+        assert response.json() == generated["sessions"]
+
+        only_first_day = client.get("/schedules/reschedule_user", params={"start": "2025-06-11T00:00:00", "end": "2025-06-12T00:00:00"}).json()
+        assert [s["task"]["title"] for s in only_first_day] == ["First", "Second"]
+    store.close()
+
+def test_schedule_store_keeps_timezones(tmp_path):
+    from store import ScheduleStore
+
+    store = ScheduleStore(f"sqlite:///{tmp_path / 'schedules.db'}")
+    request_data = {
+        "user_id": "tz_store_user",
+        "available_slots": [
+            {"start_time": "2025-06-11T09:00:00+02:00", "end_time": "2025-06-11T11:00:00+02:00"},
+            {"start_time": "2025-06-11T08:30:00+00:00", "end_time": "2025-06-11T10:00:00+00:00"}
+        ],
+        "tasks": [
+            {"title": "Berlin", "due_date": "2025-06-12T18:00:00+02:00", "duration_minutes": 60},
+            {"title": "London", "due_date": "2025-06-12T18:00:00", "duration_minutes": 60}
+        ]
+    }
+    with patch("app.schedule_store", store):
+        generated = client.post("/generate_schedule", json=request_data).json()
+        # Aware bounds are compared in UTC: 09:00+02:00 is 07:00 UTC
+        stored = client.get("/schedules/tz_store_user", params={"start": "2025-06-11T07:00:00+00:00", "days": 1}).json()
+    assert [s["start_time"] for s in generated["sessions"]] == ["2025-06-11T09:00:00+02:00", "2025-06-11T08:30:00Z"]
+    assert stored == generated["sessions"]
+    assert stored[1]["task"]["due_date"] == "2025-06-12T18:00:00" # Naive values stay naive
+    store.close()
+
+def test_compact_format_lists_tasks_once():
+    from serialization import expand_compact
+    from models import ScheduleResponse
+
+    request_data = {**_reschedule_base(), "strategy": "pomodoro"}
+    full = client.post("/generate_schedule", json=request_data)
+    compact = client.post("/generate_schedule", params={"format": "compact"}, json=request_data)
+    assert full.status_code == compact.status_code == 200
+    assert full.headers["content-type"] == compact.headers["content-type"] == "application/json"
+
+    payload = compact.json()
+    assert [t["title"] for t in payload["tasks"]] == ["First", "Second", "Third"]
+    assert len(payload["sessions"]) == len(full.json()["sessions"]) > 3 # Pomodoro blocks share their task
+    assert payload["sessions"][0] == [0, "2025-06-11T09:00:00", "2025-06-11T09:25:00", 5]
+    assert len(compact.content) < len(full.content)
+    assert expand_compact(payload) == ScheduleResponse.model_validate(full.json())
+
+def test_fast_path_serialization_matches_response_model():
+    import json
+    from benchmark import make_schedule_response
+    from models import ScheduleResponse
+    from serialization import schedule_response
+
+    response = make_schedule_response(50, 10)
+    validated = ScheduleResponse.model_validate(response.model_dump()).model_dump(mode="json")
+    assert json.loads(schedule_response(response).body) == validated
+
+    bad = client.post("/generate_schedule", params={"format": "xml"}, json=_reschedule_base())
+    assert bad.status_code == 422
+
+def test_compact_prompts_split_large_requests_by_date():
+    from benchmark import make_study_request
+    from ai_model import build_schedule_prompts, format_schedule_prompt
+    from prompting import build_compact_prompts, estimate_tokens
+
+    small = make_study_request(3, 3)
+    assert build_schedule_prompts(small) == [format_schedule_prompt(small)] # Small requests keep the verbose prompt
+
+    request = make_study_request(300, 150, skew=1.0)
+    single = build_compact_prompts(request, 10**9, 10**9)[0]
+    assert estimate_tokens(single) < 0.75 * estimate_tokens(format_schedule_prompt(request))
+    assert single.count("C1=") == 1 # Categories are written once and referenced by code
+
+    prompts = build_compact_prompts(request, 1500, 1000)
+    assert len(prompts) > 1
+    assert all(estimate_tokens(p) <= 1500 for p in prompts)
+    task_lines = [line for p in prompts for line in p.splitlines() if line.startswith("Task ")]
+    assert sorted(line.split("|")[0] for line in task_lines) == sorted(t.title for t in request.tasks)
+
+def test_ai_schedule_sends_sub_prompts_in_parallel_and_merges():
+    import asyncio
+    from benchmark import make_study_request
+
+    request = make_study_request(60, 30, skew=1.0)
+    in_flight = 0
+    peak = 0
+
+    async def fake_call_openai_api(prompt, *args, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        # One session at the start of the window's first slot
+        first_day = prompt.split("high):\n")[1].split("\n")[0]
+        day, slots = first_day.split(": ")
+        start = datetime.fromisoformat(f"{day}T{slots[:5]}")
+        title = prompt.split("category code):\n")[1].split("\nOnly use")[0].split("\n")[-1].split("|")[0] # Latest due task
+        return [{"task": title, "start": start.isoformat(), "end": (start + timedelta(minutes=25)).isoformat(), "category": "General"}]
+
+    with patch("app.call_openai_api", fake_call_openai_api), patch("ai_model.PROMPT_TOKEN_BUDGET", 600):
+        response = client.post("/generate_ai_schedule", content=request.model_dump_json(), headers={"content-type": "application/json"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["message"] == "Schedule generated by AI."
+    assert len(data["sessions"]) == peak > 1
+
+def test_hybrid_mode_skips_llm_when_rules_place_everything():
+    from unittest.mock import AsyncMock
+
+    fake = AsyncMock()
+    with patch("app.call_openai_api", fake):
+        response = client.post("/generate_ai_schedule", params={"mode": "hybrid"}, json=_reschedule_base())
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    assert [s["task"]["title"] for s in data["sessions"]] == ["First", "Second", "Third"]
+    fake.assert_not_called()
+
+def test_hybrid_mode_sends_only_the_remainder_and_checks_conflicts():
+    request_data = {
+        "user_id": "hybrid_user",
+        "energy_level": [2, 2],
+        "pomodoro_length": 60,
+        "available_slots": [
+            {"start_time": "2025-06-11T09:00:00", "end_time": "2025-06-11T11:00:00"},
+            {"start_time": "2025-06-11T13:00:00", "end_time": "2025-06-11T15:00:00"}
+        ],
+        "tasks": [
+            {"title": "Quick Review", "due_date": "2025-06-12T09:00:00", "duration_minutes": 30, "category": "History"},
+            {"title": "Big Project", "due_date": "2025-06-12T09:00:00", "duration_minutes": 150, "category": "Math"}
+        ]
+    }
+    prompts = []
+
+    async def fake_call_openai_api(prompt, *args, **kwargs):
+        prompts.append(prompt)
+        return [
+            {"task": "Big Project", "start": "2025-06-11T09:35:00", "end": "2025-06-11T11:00:00", "category": "Math"},
+            {"task": "Big Project", "start": "2025-06-11T13:00:00", "end": "2025-06-11T14:05:00", "category": "Math"},
+            {"task": "Big Project", "start": "2025-06-11T09:10:00", "end": "2025-06-11T09:30:00", "category": "Math"}, # Overlaps the rule session
+            {"task": "Made Up", "start": "2025-06-11T14:10:00", "end": "2025-06-11T14:40:00", "category": "Other"}
+        ]
+
+    with patch("app.call_openai_api", fake_call_openai_api):
+        response = client.post("/generate_ai_schedule", params={"mode": "hybrid"}, json=request_data)
+    assert response.status_code == 200
+    data = response.json()
+
+    assert len(prompts) == 1
+    assert "Big Project" in prompts[0] and "Quick Review" not in prompts[0]
+    assert "09:35 AM to 11:00 AM" in prompts[0] # Free time after the rule session and its break
+    assert [(s["task"]["title"], s["start_time"][11:16]) for s in data["sessions"]] == [
+        ("Quick Review", "09:00"), ("Big Project", "09:35"), ("Big Project", "13:00")
+    ]
+    assert data["sessions"][1]["task"]["duration_minutes"] == 150 # Original task is kept
+    assert data["success"] is True
+    assert data["total_study_time"] == 30 + 85 + 65
+
+def test_validator_repairs_overlaps_and_drops_sessions_outside_slots():
+    from validation import validate_llm_sessions
+
+    request = StudyRequest.model_validate(_reschedule_base())
+    items = [
+        {"task": "second ", "start": "2025-06-11T09:50:00", "end": "2025-06-11T10:50:00"}, # Overlaps First, renamed
+        {"task": "First", "start": "2025-06-11T09:00:00", "end": "2025-06-11T10:00:00"},
+        {"task": "Third", "start": "2025-06-11T11:30:00", "end": "2025-06-11T13:00:00"}, # Runs past the slot
+        {"task": "Third", "start": "2025-06-11T13:00:00", "end": "2025-06-11T14:00:00"}, # Between slots
+        {"task": "Fourth", "start": "2025-06-12T09:00:00", "end": "2025-06-12T10:00:00"},
+        {"task": "First", "start": "not a date", "end": "2025-06-12T10:00:00"}
+    ]
+    result = validate_llm_sessions(items, request)
+
+    assert [(s.task.title, s.start_time.strftime("%H:%M"), s.end_time.strftime("%H:%M")) for s in result.sessions] == [
+        ("First", "09:00", "10:00"), ("Second", "10:00", "10:50"), ("Third", "11:30", "12:00")
+    ]
+    assert result.sessions[1].task.duration_minutes == 50
+    assert result.unscheduled == []
+    codes = {(d.index, d.code, d.action) for d in result.diagnostics}
+    assert {(0, "renamed", "renamed"), (0, "overlap", "clipped"), (2, "outside_slots", "clipped"),
+            (3, "outside_slots", "dropped"), (4, "unknown_task", "dropped"), (5, "malformed", "dropped")} <= codes
+    assert (-1, "incomplete", "none") in codes
+
+def test_ai_schedule_returns_diagnostics_for_repaired_sessions():
+    mock_response = [
+        {"task": "Essay", "start": "2025-06-11T09:30:00", "end": "2025-06-11T10:30:00", "category": "Writing"},
+        {"task": "Essay", "start": "2025-06-11T10:15:00", "end": "2025-06-11T10:20:00", "category": "Writing"}
+    ]
+    request_data = {
+        "user_id": "diagnostics_user",
+        "energy_level": [3],
+        "pomodoro_length": 25,
+        "available_slots": [{"start_time": "2025-06-11T10:00:00", "end_time": "2025-06-11T12:00:00"}],
+        "tasks": [{"title": "Essay", "due_date": "2025-06-11T23:59:59", "duration_minutes": 30, "category": "Writing"}]
+    }
+
+    with patch("app.call_openai_api", return_value=mock_response):
+        response = client.post("/generate_ai_schedule", json=request_data)
+    assert response.status_code == 200
+    data = response.json()
+    assert [(s["start_time"][11:16], s["end_time"][11:16]) for s in data["sessions"]] == [("10:00", "10:30")]
+    assert data["total_study_time"] == 30
+    assert data["success"] is True
+    assert [(d["index"], d["code"], d["action"]) for d in data["diagnostics"]] == [(0, "outside_slots", "clipped"), (1, "overlap", "dropped")]
+
+def _speculative_request(user_id):
+    return StudyRequest.model_validate({
+        "user_id": user_id,
+        "energy_level": [3],
+        "pomodoro_length": 25,
+        "available_slots": [{"start_time": "2025-06-11T10:00:00", "end_time": "2025-06-11T12:00:00"}],
+        "tasks": [{"title": f"Essay for {user_id}", "due_date": "2025-06-11T23:59:59", "duration_minutes": 30, "category": "Writing"}]
+    })
+
+def test_speculative_mode_returns_rules_at_deadline_and_caches_late_ai_result():
+    import asyncio
+    import time
+    from app import speculative_schedule
+
+    request = _speculative_request("speculative_slow_user")
+    calls = 0
+
+    async def slow_completion(prompt, *args, **kwargs):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.3)
+        return [{"task": request.tasks[0].title, "start": "2025-06-11T11:00:00", "end": "2025-06-11T11:30:00", "category": "Writing"}]
+
+    async def run():
+        start = time.perf_counter()
+        first = await speculative_schedule(request, deadline=0.05)
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(0.4) # Let the late LLM call finish and fill the cache
+        second = await speculative_schedule(request, deadline=0.05)
+        return first, elapsed, second
+
+    with patch("ai_model._request_completion", slow_completion):
+        first, elapsed, second = asyncio.run(run())
+    assert elapsed < 0.25
+    assert first.message != "Schedule generated by AI."
+    assert first.sessions[0].start_time == datetime(2025, 6, 11, 10, 0)
+    assert "not ready within 0.05s" in first.warnings[-1]
+    assert second.message == "Schedule generated by AI."
+    assert second.sessions[0].start_time == datetime(2025, 6, 11, 11, 0)
+    assert calls == 1
+
+def test_speculative_mode_returns_ai_schedule_within_deadline():
+    request = _speculative_request("speculative_fast_user")
+    mock_response = [{"task": request.tasks[0].title, "start": "2025-06-11T11:00:00", "end": "2025-06-11T11:30:00", "category": "Writing"}]
+
+    with patch("app.call_openai_api", return_value=mock_response):
+        response = client.post("/generate_ai_schedule", params={"mode": "speculative"}, content=request.model_dump_json(), headers={"content-type": "application/json"})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["message"] == "Schedule generated by AI."
+    assert data["sessions"][0]["start_time"] == "2025-06-11T11:00:00"
+    assert data["warnings"] == []
+
+def test_rate_limit_degrades_schedules_and_rejects_chat():
+    from ratelimit import RateLimiter
+
+    mock_response = [{"task": "Essay for limited_user", "start": "2025-06-11T11:00:00", "end": "2025-06-11T11:30:00", "category": "Writing"}]
+    body = _speculative_request("limited_user").model_dump_json()
+    with patch("app.rate_limiter", RateLimiter(per_minute=1, burst=1)), patch("app.call_openai_api", return_value=mock_response) as fake:
+        first = client.post("/generate_ai_schedule", content=body, headers={"content-type": "application/json"}).json()
+        second = client.post("/generate_ai_schedule", content=body, headers={"content-type": "application/json"}).json()
+        chat = client.post("/chat", json={"user_id": 7, "message": "hi"})
+        limited_chat = client.post("/chat", json={"user_id": 7, "message": "hi again"})
+
+    assert first["message"] == "Schedule generated by AI."
+    assert second["sessions"][0]["start_time"] == "2025-06-11T10:00:00" # Rule-based answer
+    assert second["warnings"][-1] == "AI request limit reached. Using rule-based scheduling."
+    assert chat.status_code == 200
+    assert limited_chat.status_code == 429
+    assert 0 < int(limited_chat.headers["Retry-After"]) <= 60
+    assert fake.call_count == 2
+    assert 'studybuddy_llm_rate_limited_total{endpoint="chat"}' in client.get("/metrics").text
+
+def test_rate_limit_token_is_only_taken_for_llm_calls():
+    from ratelimit import RateLimiter
+
+    mock_response = [{"task": "Essay for token_user", "start": "2025-06-11T11:00:00", "end": "2025-06-11T11:30:00", "category": "Writing"}]
+    body = _speculative_request("token_user").model_dump_json()
+    headers = {"content-type": "application/json"}
+    with patch("app.rate_limiter", RateLimiter(per_minute=1, burst=1)), patch("app.call_openai_api", return_value=mock_response) as fake:
+        # The rules place everything, so hybrid requests never reach the LLM or the limiter
+        hybrid = [client.post("/generate_ai_schedule", params={"mode": "hybrid"}, content=body, headers=headers).json() for _ in range(3)]
+        full = client.post("/generate_ai_schedule", content=body, headers=headers).json()
+        speculative = client.post("/generate_ai_schedule", params={"mode": "speculative"}, content=body, headers=headers).json()
+
+    assert all(h["warnings"] == [] for h in hybrid)
+    assert full["message"] == "Schedule generated by AI."
+    assert fake.call_count == 1
+    assert speculative["sessions"][0]["start_time"] == "2025-06-11T10:00:00" # Rule-based answer
+    assert speculative["warnings"][-1] == "AI request limit reached. Using rule-based scheduling."
+
+def test_fair_queue_serves_users_round_robin():
+    import asyncio
+    from ratelimit import FairQueue
+
+    async def run():
+        queue = FairQueue(slots=1)
+        order = []
+
+        async def call(user_id, name):
+            async with queue.slot(user_id):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        tasks = [asyncio.create_task(call("heavy", f"heavy{i}")) for i in range(4)]
+        await asyncio.sleep(0) # The heavy user queues up first
+        tasks.append(asyncio.create_task(call("light", "light0")))
+        await asyncio.sleep(0)
+        assert (queue.active, queue.depth, queue.waiting_users()) == (1, 4, 2)
+        await asyncio.gather(*tasks)
+        return order, queue
+
+    order, queue = asyncio.run(run())
+    assert order.index("light0") == 2 # Served right after the heavy user's next call, not after all of them
+    assert (queue.active, queue.depth) == (0, 0)
+
+def test_chat_memory_keeps_prompt_context_bounded():
+    from chat_memory import ChatMemory
+    from prompting import estimate_tokens
+
+    memory = ChatMemory(max_users=2, window=3, summary_tokens=120)
+    sizes = []
+    for turn in range(60):
+        memory.record("1", f"Question {turn}: can you move my physics revision? " + "details " * 80, f"Answer {turn}. Moved it. " + "because " * 80)
+        sizes.append(estimate_tokens(memory.context("1")))
+
+    assert max(sizes[20:]) <= max(sizes[:20]) * 1.1 # Flat once older turns are being condensed
+    context = memory.context("1")
+    summary, recent = context.split("Recent conversation:")
+    assert "Question 57" in recent and "Question 59" in recent and "Question 56" not in recent
+    assert "User: Question 56: can you move my physics revision?" in summary # Condensed to its first sentence
+    assert "Question 40" not in summary # Oldest summary lines dropped past the budget
+    memory.record("2", "hi", "hello")
+    memory.record("3", "hi", "hello")
+    assert list(memory.sessions) == ["2", "3"] # Least recently active user evicted
+
+def test_chat_remembers_turns_and_injects_schedule_digest(tmp_path):
+    from store import ScheduleStore
+
+    tomorrow = (datetime.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+    request_data = {
+        "user_id": "42",
+        "energy_level": [3],
+        "pomodoro_length": 25,
+        "available_slots": [{"start_time": tomorrow.isoformat(), "end_time": (tomorrow + timedelta(hours=3)).isoformat()}],
+        "tasks": [{"title": "Thermodynamics", "due_date": (tomorrow + timedelta(days=1)).isoformat(), "duration_minutes": 60, "category": "Physics"}]
+    }
+    prompts = []
+
+    async def fake_call_openai_api(prompt, *args, **kwargs):
+        prompts.append(prompt)
+        return [{"task": "Thermodynamics", "start": "2025-06-11T10:00:00", "end": "2025-06-11T10:25:00"}]
+
+    store = ScheduleStore(f"sqlite:///{tmp_path / 'schedules.db'}")
+    with patch("app.schedule_store", store), patch("app.call_openai_api", fake_call_openai_api):
+        client.post("/generate_schedule", json=request_data)
+        client.post("/chat", json={"user_id": 42, "message": "When do I study physics?"})
+        client.post("/chat", json={"user_id": 42, "message": "Add another session"})
+        assert client.delete("/chat/42").json() == {"cleared": True}
+        client.post("/chat", json={"user_id": 42, "message": "Start over"})
+    store.close()
+
+    assert f"- Thermodynamics: 1 sessions, 45 min, next {tomorrow:%a %m-%d} 09:00" in prompts[0]
+    assert "Recent conversation" not in prompts[0]
+    assert "User: When do I study physics?" in prompts[1]
+    assert "Assistant: Suggested sessions: Thermodynamics 2025-06-11T10:00" in prompts[1]
+    assert "Recent conversation" not in prompts[2]
+
+def test_app_imports_llm_stack_lazily():
+    import sys
+    import subprocess
+    import benchmark
+
+    check = "import sys, app; print('openai' in sys.modules, 'httpx' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ["False", "False"]
+
+    results = benchmark.bench_startup([], 1, warmups=("none",))
+    assert [r["name"] for r in results] == ["import_app", "cold_start"]
+    assert all(r["median_s"] > 0 for r in results)
+
+def test_llm_warm_up_modes():
+    import os
+    import asyncio
+    import ai_model
+
+    async def warm_up(mode):
+        await ai_model.warm_up_llm(mode)
+        created = ai_model._openai_client is not None
+        await ai_model.close_openai_client()
+        return created
+
+    with patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"}), patch("ai_model._openai_client", None):
+        assert asyncio.run(warm_up("none")) is False
+        assert asyncio.run(warm_up("background")) is True
+        assert asyncio.run(warm_up("startup")) is True
+
+def test_shared_state_merges_worker_metrics_and_rate_limits(tmp_path):
+    import asyncio
+    import threading
+    from metrics import Counter, Histogram, render_metrics
+    from ratelimit import RateLimiter
+    from shared_state import SharedState
+
+    path = str(tmp_path / "state.db")
+    first, second = SharedState(path), SharedState(path)
+    second.pid = first.pid + 1 # Stands in for another worker process
+
+    counter = Counter("test_shared_requests_total", "Test counter.", ["route"])
+    histogram = Histogram("test_shared_seconds", "Test histogram.", buckets=(0.1, 1.0))
+    counter.inc(2, route="/a")
+    histogram.observe(0.05)
+    second.publish_metrics({counter.name: [[["/a"], 3], [["/b"], 1]], histogram.name: [[[], [0, 1, 0], 0.5, 1]]})
+
+    text = render_metrics(first.other_metrics())
+    assert 'test_shared_requests_total{route="/a"} 5' in text
+    assert 'test_shared_requests_total{route="/b"} 1' in text
+    assert 'test_shared_seconds_bucket{le="1.0"} 2' in text
+    assert "test_shared_seconds_count 2" in text
+
+    # A worker that stopped publishing keeps its counters but not its gauges
+    from metrics import GaugeCallback
+    gauge = GaugeCallback("test_shared_in_flight", "Test gauge.", lambda: {(): 1})
+    second.publish_metrics({counter.name: [[["/a"], 3]], gauge.name: [[[], 4]]})
+    assert "test_shared_in_flight 5" in render_metrics(first.other_metrics())
+    with patch("shared_state.time.time", return_value=datetime.now().timestamp() + 60):
+        text = render_metrics(first.other_metrics())
+    assert "test_shared_in_flight 1" in text
+    assert 'test_shared_requests_total{route="/a"} 5' in text
+
+    workers = [RateLimiter(per_minute=1, burst=2, state=first), RateLimiter(per_minute=1, burst=2, state=second)]
+    assert [asyncio.run(workers[i % 2].retry_after("shared_user")) for i in range(2)] == [0.0, 0.0]
+    assert 0 < asyncio.run(workers[0].retry_after("shared_user")) <= 60 # The bucket was emptied through both workers
+    assert asyncio.run(workers[1].retry_after("other_user")) == 0.0
+
+    # The shared bucket is a blocking SQLite write, so it must run off the event loop
+    threads = []
+    take_token = first.take_token
+    def record_thread(*args):
+        threads.append(threading.get_ident())
+        return take_token(*args)
+    with patch.object(first, "take_token", record_thread):
+        asyncio.run(workers[0].retry_after("threaded_user"))
+    assert threads and threads[0] != threading.get_ident()
+    first.close()
+    second.close()
+
+def test_sqlite_backends_share_one_connection_setup(tmp_path):
+    from sqlalchemy import text
+    from cache import SQLiteCache
+    from shared_state import SharedState
+    from store import ScheduleStore
+
+    engines = [
+        SQLiteCache(str(tmp_path / "cache.db")).engine,
+        SharedState(str(tmp_path / "state.db")).engine,
+        ScheduleStore(f"sqlite:///{tmp_path / 'store.db'}").engine
+    ]
+    for engine in engines:
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        engine.dispose()
+
+def test_scaling_benchmark_runs_multi_worker_server():
+    import benchmark
+
+    results = benchmark.bench_scaling([10], 1, workers=[1, 2], requests=20, concurrency=4)
+    assert [r["params"]["workers"] for r in results] == [1, 2]
+    assert all(r["throughput_rps"] > 0 for r in results)
+    assert results[0]["speedup"] == 1.0
+
+def test_request_columns_encode_times_and_energy_levels():
+    from datetime import timezone
+    from columnar import MINUTE, RequestColumns, to_micros
+
+    request = StudyRequest(
+        user_id="columns_user",
+        energy_level=[3, 7],
+        available_slots=[
+            {"start_time": "2025-06-11T13:00:00", "end_time": "2025-06-11T14:00:00"},
+            {"start_time": "2025-06-11T09:00:00", "end_time": "2025-06-11T10:00:00"},
+            {"start_time": "2025-06-11T11:00:00", "end_time": "2025-06-11T12:00:00"}
+        ],
+        tasks=[
+            {"title": "Late", "due_date": "2025-06-12T09:00:00", "duration_minutes": 30},
+            {"title": "Early", "due_date": "2025-06-11T23:59:59", "duration_minutes": 45}
+        ]
+    )
+    columns = RequestColumns(request)
+    assert list(columns.slot_order) == [1, 2, 0]
+    assert list(columns.task_order) == [1, 0]
+    assert columns.slot_end[0] - columns.slot_start[0] == 60 * MINUTE
+    assert list(columns.task_duration) == [30, 45]
+    # Unknown levels get their own code; slots without a level get -1
+    assert columns.energy_levels == [3, 7]
+    assert list(columns.slot_energy) == [0, 1, -1]
+    assert to_micros(datetime(2025, 6, 11, 11, 0, tzinfo=timezone(timedelta(hours=2)))) == to_micros(datetime(2025, 6, 11, 9, 0))
+
+def test_columnar_engines_keep_slot_timezones_and_match_placements():
+    from ai_model import generate_schedule
+    from scheduler import STRATEGIES
+
+    request_data = {
+        "user_id": "columns_tz_user",
+        "energy_level": [1, 3],
+        "pomodoro_length": 25,
+        "available_slots": [
+            {"start_time": "2025-06-11T09:00:30+02:00", "end_time": "2025-06-11T11:00:00+02:00"},
+            {"start_time": "2025-06-11T08:00:00+00:00", "end_time": "2025-06-11T09:00:00+00:00"}
+        ],
+        "tasks": [
+            {"title": "Essay", "due_date": "2025-06-11T12:00:00+00:00", "duration_minutes": 60},
+            {"title": "Quiz", "due_date": "2025-06-11T08:30:00+00:00", "duration_minutes": 20}
+        ]
+    }
+    for strategy in ("pack", "edd", "pomodoro"):
+        request = StudyRequest(**request_data, strategy=strategy)
+        response = generate_schedule(request)
+        placements, unscheduled = STRATEGIES[strategy](request)
+        assert [(s.task.title, s.start_time, s.end_time) for s in response.sessions] == [(p.task.title, p.start_time, p.end_time) for p in placements]
+        assert response.total_study_time == sum(p.duration_minutes for p in placements)
+        assert len(response.warnings) == len(unscheduled)
+        for session in response.sessions:
+            slot = request.available_slots[0] if session.start_time.utcoffset() == timedelta(hours=2) else request.available_slots[1]
+            assert slot.start_time <= session.start_time < session.end_time <= slot.end_time
+
+    pack = generate_schedule(StudyRequest(**request_data, strategy="pack"))
+    # 09:00:30+02:00 is the earliest slot; both tasks take 1.25x their minutes there, plus a 5 minute break
+    assert [(s.task.title, s.start_time.isoformat(), s.end_time.isoformat()) for s in pack.sessions] == [
+        ("Quiz", "2025-06-11T09:00:30+02:00", "2025-06-11T09:25:30+02:00"),
+        ("Essay", "2025-06-11T09:30:30+02:00", "2025-06-11T10:45:30+02:00")
+    ]
+
+def test_availability_rules_expand_lazily_up_to_latest_due_date():
+    from datetime import date
+    from availability import AVAILABILITY_MAX_DAYS, rule_slots, slot_stream, with_expanded_slots
+
+    request = StudyRequest(
+        user_id="rules_user",
+        energy_level=[1],
+        available_slots=[{"start_time": "2025-06-10T07:00:00", "end_time": "2025-06-10T08:00:00"}],
+        availability=[
+            {"weekdays": [0, 2], "start": "18:00", "end": "20:00", "energy_level": 3, "except_dates": ["2025-06-11"]},
+            {"weekdays": [5], "start": "22:00", "end": "01:00", "starts_on": "2025-06-14"}
+        ],
+        tasks=[{"title": "Thesis", "due_date": "2025-06-16T12:00:00", "duration_minutes": 60}]
+    )
+    slots = list(slot_stream(request, now=date(2025, 6, 9)))
+    assert [(start.isoformat(), end.isoformat(), level) for start, end, level in slots] == [
+        ("2025-06-09T18:00:00", "2025-06-09T20:00:00", 3), # Listed and expanded slots are sorted by start
+        ("2025-06-10T07:00:00", "2025-06-10T08:00:00", 1),
+        ("2025-06-14T22:00:00", "2025-06-15T01:00:00", 2), # Runs past midnight
+        ("2025-06-16T18:00:00", "2025-06-16T20:00:00", 3) # Last day is the latest due date
+    ]
+
+    expanded = with_expanded_slots(request, now=date(2025, 6, 9))
+    assert [(s.start_time, s.end_time) for s in expanded.available_slots] == [(start, end) for start, end, _ in slots]
+    assert expanded.energy_level == [3, 1, 2, 3]
+    assert expanded.availability == []
+
+    # A far-off due date expands lazily and never past AVAILABILITY_MAX_DAYS
+    far = request.model_copy(update={"tasks": [request.tasks[0].model_copy(update={"due_date": datetime(2099, 1, 1)})]})
+    stream = rule_slots(far, now=date(2025, 6, 9))
+    assert next(stream)[0] == datetime(2025, 6, 9, 18, 0)
+    assert sum(1 for _ in stream) <= 3 * (AVAILABILITY_MAX_DAYS // 7 + 1) # Three windows a week
+
+def test_availability_rules_starting_in_the_past_expand_from_today():
+    from datetime import date
+    from availability import rule_slots
+
+    request = StudyRequest(
+        user_id="old_rules_user",
+        availability=[{"start": "18:00", "end": "19:00", "starts_on": "1990-01-01"}],
+        tasks=[{"title": "Thesis", "due_date": "2025-06-12T12:00:00", "duration_minutes": 60}]
+    )
+    slots = list(rule_slots(request, now=date(2025, 6, 9)))
+    assert [start.date() for start, _, _ in slots] == [date(2025, 6, 9), date(2025, 6, 10), date(2025, 6, 11), date(2025, 6, 12)]
+
+def test_availability_rules_skip_ended_windows_and_start_at_now():
+    from availability import rule_slots
+
+    request = StudyRequest(
+        user_id="now_rules_user",
+        availability=[
+            {"start": "08:00", "end": "09:00"},
+            {"start": "10:00", "end": "12:00"},
+            {"start": "23:00", "end": "01:00"}
+        ],
+        tasks=[{"title": "Thesis", "due_date": "2025-06-10T12:00:00", "duration_minutes": 60}]
+    )
+    slots = list(rule_slots(request, now=datetime(2025, 6, 9, 10, 30)))
+    assert [(start.isoformat(), end.isoformat()) for start, end, _ in slots] == [
+        ("2025-06-09T10:30:00", "2025-06-09T12:00:00"), # In progress, so it starts now
+        ("2025-06-09T23:00:00", "2025-06-10T01:00:00"),
+        ("2025-06-10T08:00:00", "2025-06-10T09:00:00"),
+        ("2025-06-10T10:00:00", "2025-06-10T12:00:00"),
+        ("2025-06-10T23:00:00", "2025-06-11T01:00:00")
+    ]
+
+    # Yesterday's window running past midnight is still in progress just after it
+    slots = list(rule_slots(request, now=datetime(2025, 6, 9, 0, 15)))
+    assert (slots[0][0].isoformat(), slots[0][1].isoformat()) == ("2025-06-09T00:15:00", "2025-06-09T01:00:00")
+
+def test_listed_slot_repeated_by_a_rule_is_booked_once():
+    from ai_model import generate_schedule
+    from availability import slot_stream
+
+    day = (datetime.now() + timedelta(days=2)).date()
+    request = StudyRequest(
+        user_id="dup_rules_user",
+        energy_level=[3],
+        available_slots=[{"start_time": f"{day}T09:00:00", "end_time": f"{day}T10:00:00"}],
+        availability=[{"start": "09:00", "end": "10:00", "energy_level": 1, "starts_on": day.isoformat(), "ends_on": day.isoformat()}],
+        tasks=[
+            {"title": "A", "due_date": f"{day}T23:00:00", "duration_minutes": 60},
+            {"title": "B", "due_date": f"{day}T23:00:00", "duration_minutes": 60}
+        ]
+    )
+    # Overlapping slots are merged and keep the lowest energy level
+    nine = datetime(day.year, day.month, day.day, 9)
+    assert list(slot_stream(request)) == [(nine, nine + timedelta(hours=1), 1)]
+
+    for strategy in ("pack", "edd", "pomodoro", "optimize"):
+        response = generate_schedule(request.model_copy(update={"strategy": strategy}))
+        sessions = sorted((s.start_time, s.end_time) for s in response.sessions)
+        assert all(previous[1] <= current[0] for previous, current in zip(sessions, sessions[1:])), strategy
+        assert sum(s.duration_minutes for s in response.sessions) <= 60, strategy
+
+def test_optimize_with_offset_rule_and_naive_due_dates():
+    day = (datetime.now() + timedelta(days=2)).date()
+    request_data = {
+        "user_id": "offset_rules_user",
+        "strategy": "optimize",
+        "availability": [{"start": "09:00:00+02:00", "end": "12:00:00+02:00", "energy_level": 2, "starts_on": day.isoformat()}],
+        "tasks": [{"title": "Essay", "due_date": f"{day}T23:00:00", "duration_minutes": 60}]
+    }
+    response = client.post("/generate_schedule", json=request_data)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    assert [(s["task"]["title"], s["start_time"]) for s in data["sessions"]] == [("Essay", f"{day}T09:00:00+02:00")]
+
+def test_generate_schedule_with_recurring_availability():
+    from datetime import date
+    from ai_model import generate_schedule
+
+    monday = date.today() - timedelta(days=date.today().weekday()) + timedelta(days=7)
+    request_data = {
+        "user_id": "rules_schedule_user",
+        "availability": [
+            {"weekdays": [0, 3], "start": "17:00", "end": "19:00", "energy_level": 3, "starts_on": monday.isoformat()}
+        ],
+        "tasks": [
+            {"title": "Lab Report", "due_date": f"{monday + timedelta(days=3)}T23:00:00", "duration_minutes": 120},
+            {"title": "Reading", "due_date": f"{monday}T23:00:00", "duration_minutes": 60}
+        ]
+    }
+    response = client.post("/generate_schedule", json=request_data)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    # High energy (3) shortens both tasks by 25%; the 90 minute report no longer fits on Monday
+    thursday = monday + timedelta(days=3)
+    assert [(s["task"]["title"], s["start_time"], s["end_time"]) for s in data["sessions"]] == [
+        ("Reading", f"{monday}T17:00:00", f"{monday}T17:45:00"),
+        ("Lab Report", f"{thursday}T17:00:00", f"{thursday}T18:30:00")
+    ]
+
+    optimized = generate_schedule(StudyRequest(**request_data, strategy="optimize"))
+    assert optimized.success is True
+    assert all(s.start_time.weekday() in (0, 3) and s.start_time.hour >= 17 for s in optimized.sessions)
+
+    empty = client.post("/generate_schedule", json={"user_id": "rules_schedule_user", "tasks": request_data["tasks"]})
+    assert empty.status_code == 400
+
+def test_mock_llm_replies_with_valid_schedules_and_injects_faults():
+    import json
+    from ai_model import format_schedule_prompt
+    from mock_llm import MockConfig, create_app, mock_reply
+    from prompting import build_compact_prompts
+    from validation import validate_llm_sessions
+    import benchmark
+
+    request = benchmark.make_study_request(12, 12, seed=3)
+    # Verbose prompts only give due days, so some sessions get clipped to the due time
+    assert validate_llm_sessions(json.loads(mock_reply(format_schedule_prompt(request))), request).sessions
+    for prompt in build_compact_prompts(request, 3000, 1000):
+        result = validate_llm_sessions(json.loads(mock_reply(prompt)), request)
+        assert result.sessions
+        assert all(d.code == "incomplete" for d in result.diagnostics)
+
+    prompt = format_schedule_prompt(request)
+    body = {"model": "gpt-4", "messages": [{"role": "user", "content": prompt}]}
+    ok = TestClient(create_app(MockConfig(latency="fixed:0")))
+    reply = ok.post("/v1/chat/completions", json=body).json()
+    assert reply["choices"][0]["message"]["content"] == mock_reply(prompt)
+    assert reply["usage"]["total_tokens"] > 0
+
+    streamed = ok.post("/v1/chat/completions", json={**body, "stream": True})
+    chunks = [json.loads(line[6:]) for line in streamed.text.splitlines() if line.startswith("data: {")]
+    assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks) == mock_reply(prompt)
+    assert streamed.text.rstrip().endswith("data: [DONE]")
+
+    failing = TestClient(create_app(MockConfig(latency="fixed:0", error_rate=1.0, error_status=503)))
+    assert failing.post("/v1/chat/completions", json=body).status_code == 503
+    broken = TestClient(create_app(MockConfig(latency="fixed:0", malformed_rate=1.0)))
+    content = broken.post("/v1/chat/completions", json=body).json()["choices"][0]["message"]["content"]
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(content)
+    assert broken.get("/mock/stats").json() == {"requests": 1, "streamed": 0, "malformed": 1}
+
+def test_load_harness_reports_throughput_latency_and_fallback_rate():
+    from loadtest import run_load
+    from mock_llm import MockConfig
+
+    healthy = run_load(requests=6, concurrency=3, size=8, config=MockConfig(latency="fixed:0.01"))
+    assert healthy["outcomes"] == {"ai": 6}
+    assert healthy["fallback_rate"] == 0.0
+    assert healthy["throughput_rps"] > 0 and healthy["p50_s"] <= healthy["p99_s"]
+    assert healthy["mock"]["requests"] == healthy["mock"]["ok"] >= 6 # Larger requests are sent as several sub-prompts
+
+    broken = run_load(requests=4, concurrency=2, size=8, config=MockConfig(latency="fixed:0.01", malformed_rate=1.0))
+    assert broken["outcomes"] == {"fallback": 4}
+    assert broken["fallback_rate"] == 1.0
@@ -1,8 +1,17 @@
+import json
 import logging
 from typing import List
 from datetime import datetime
 from models import Session, TaskSchema
 
+def configure_sqlite(dbapi_connection, connection_record):
+    """SQLAlchemy "connect" listener for the SQLite files shared by the workers of serve.py."""
+    # WAL lets readers proceed while another worker writes
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
 def parse_llm_response(structured_response: List[dict]) -> List[Session]:
     """
     Parses raw LLM response into a list of Session objects.
@@ -19,20 +28,76 @@ def parse_llm_response(structured_response: List[dict]) -> List[Session]:
 
     for item in structured_response:
         try:
-            task = TaskSchema(
-                title=item["task"],
-                due_date=datetime.fromisoformat(item["end"]), # Assuming end date is the due date for now
-                duration_minutes=int((datetime.fromisoformat(item["end"]) - datetime.fromisoformat(item["start"])).total_seconds() / 60),
-                category=item.get("category", "General")  # Default category if not specified
-            )
-            session = Session(
-                task=task,
-                start_time=datetime.fromisoformat(item["start"]),
-                end_time=datetime.fromisoformat(item["end"]),
-                break_after=item.get("break_after", 5)  # Default break after session in minutes
-            )
-            sessions.append(session)
+            sessions.append(parse_llm_item(item))
         except Exception as e:
             logging.getLogger(__name__).error(f"Skipping item due to parse failure: {e}")
             continue
-    return sessions
\ No newline at end of file
+    return sessions
+
+def parse_llm_item(item: dict) -> Session:
+    """Parses one LLM session dict, reading each timestamp once. Raises on malformed items."""
+    start = datetime.fromisoformat(item["start"])
+    end = datetime.fromisoformat(item["end"])
+    task = TaskSchema(
+        title=item["task"],
+        due_date=end, # Assuming end date is the due date for now
+        duration_minutes=int((end - start).total_seconds() / 60),
+        category=item.get("category", "General")  # Default category if not specified
+    )
+    return Session(
+        task=task,
+        start_time=start,
+        end_time=end,
+        break_after=item.get("break_after", 5)  # Default break after session in minutes
+    )
+
+class IncrementalSessionParser:
+    """
+    Extracts session objects from a JSON array embedded in streamed LLM text.
+
+    Text is fed in arbitrary chunks; each top-level object inside a
+    JSON array is returned as soon as its closing brace arrives. Text outside
+    the array (the natural-language reply) is ignored.
+    """
+
+    def __init__(self):
+        self.in_array = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.buffer: List[str] = []
+
+    def feed(self, text: str) -> List[dict]:
+        """Consumes a chunk of text and returns the objects completed by it."""
+        completed = []
+        for char in text:
+            if not self.in_array:
+                self.in_array = char == "["
+                continue
+            if self.depth > 0:
+                self.buffer.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = self.depth > 0
+            elif char == "{":
+                if self.depth == 0:
+                    self.buffer = [char]
+                self.depth += 1
+            elif char == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        completed.append(json.loads("".join(self.buffer)))
+                    except json.JSONDecodeError as e:
+                        logging.getLogger(__name__).error(f"Skipping malformed streamed object: {e}")
+                    self.buffer = []
+            elif char == "]" and self.depth == 0:
+                # Bracketed prose such as "[1]" closes without objects; keep scanning for the real array
+                self.in_array = False
+        return completed
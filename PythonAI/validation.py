@@ -0,0 +1,111 @@
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+from models import Session, SessionDiagnostic, StudyRequest, TaskSchema
+from utils import parse_llm_item
+
+MIN_SESSION_MINUTES = 10 # Repaired sessions shorter than this are dropped instead
+
+@dataclass
+class ValidationResult:
+    """Sessions that passed validation, in start order, plus what was found along the way."""
+    sessions: List[Session]
+    diagnostics: List[SessionDiagnostic] = field(default_factory=list)
+    unscheduled: List[TaskSchema] = field(default_factory=list)
+
+def normalize_title(title: str) -> str:
+    """Matching key for task titles: case, surrounding and repeated whitespace are ignored."""
+    return re.sub(r"\s+", " ", title).strip().casefold()
+
+def merge_slots(request: StudyRequest) -> List[Tuple[datetime, datetime]]:
+    """Returns the available slots as sorted, disjoint (start, end) intervals."""
+    merged: List[Tuple[datetime, datetime]] = []
+    for slot in sorted(request.available_slots, key=lambda s: s.start_time):
+        if merged and slot.start_time <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], slot.end_time))
+        else:
+            merged.append((slot.start_time, slot.end_time))
+    return merged
+
+def validate_llm_sessions(items: List[Any], request: StudyRequest, min_minutes: int = MIN_SESSION_MINUTES) -> ValidationResult:
+    """
+    Parses and checks an LLM reply against the request in O(n log n + m log m).
+
+    Each item is parsed once and matched to a request task by normalized title.
+    The sessions are then swept in start order against the merged slots:
+    a session overlapping the previous one is trimmed to start after it, one
+    reaching outside its slot is clipped to the slot, and one ending after the
+    task's due date is cut at the due date. Sessions left shorter than
+    `min_minutes`, unknown tasks and malformed items are dropped. Every repair
+    or drop is reported as a SessionDiagnostic.
+    """
+    diagnostics: List[SessionDiagnostic] = []
+    tasks: Dict[str, TaskSchema] = {normalize_title(t.title): t for t in request.tasks}
+
+    def report(index: int, code: str, action: str, message: str):
+        diagnostics.append(SessionDiagnostic(index=index, code=code, action=action, message=message))
+
+    parsed: List[Tuple[int, Session, TaskSchema]] = []
+    for index, item in enumerate(items):
+        try:
+            session = parse_llm_item(item)
+        except Exception as e:
+            report(index, "malformed", "dropped", f"Could not parse session: {e}")
+            continue
+        task = tasks.get(normalize_title(session.task.title))
+        if task is None:
+            report(index, "unknown_task", "dropped", f"Task '{session.task.title}' is not part of the request.")
+            continue
+        if session.end_time <= session.start_time:
+            report(index, "empty", "dropped", f"Session for '{task.title}' does not end after it starts.")
+            continue
+        if session.task.title != task.title:
+            report(index, "renamed", "renamed", f"Task '{session.task.title}' matched to '{task.title}'.")
+            session.task = session.task.model_copy(update={"title": task.title})
+        parsed.append((index, session, task))
+
+    parsed.sort(key=lambda entry: entry[1].start_time)
+    slots = merge_slots(request)
+    minimum = timedelta(minutes=min_minutes)
+    accepted: List[Session] = []
+    minutes_by_task: Dict[str, float] = {}
+    pointer = 0
+    last_end = None
+    for index, session, task in parsed:
+        start, end = session.start_time, session.end_time
+        problem = None
+        if last_end is not None and start < last_end:
+            start, problem = last_end, "overlap"
+        while pointer < len(slots) and slots[pointer][1] <= start:
+            pointer += 1
+        if pointer == len(slots):
+            report(index, problem or "outside_slots", "dropped", f"Session for '{task.title}' at {session.start_time:%Y-%m-%d %H:%M} is outside the available slots.")
+            continue
+        slot_start, slot_end = slots[pointer]
+        if start < slot_start or end > slot_end:
+            start, end = max(start, slot_start), min(end, slot_end)
+            problem = problem or "outside_slots"
+        if end > task.due_date:
+            end, problem = task.due_date, problem or "after_due"
+        if end - start < minimum:
+            report(index, problem or "empty", "dropped", f"Session for '{task.title}' at {session.start_time:%Y-%m-%d %H:%M} leaves less than {min_minutes} minutes after repair.")
+            continue
+        if problem:
+            report(index, problem, "clipped", f"Session for '{task.title}' moved from {session.start_time:%H:%M}-{session.end_time:%H:%M} to {start:%H:%M}-{end:%H:%M}.")
+            minutes = int((end - start).total_seconds() / 60)
+            session = session.model_copy(update={
+                "start_time": start,
+                "end_time": end,
+                "task": session.task.model_copy(update={"duration_minutes": minutes})
+            })
+        accepted.append(session)
+        last_end = end
+        minutes_by_task[task.title] = minutes_by_task.get(task.title, 0) + (end - start).total_seconds() / 60
+
+    unscheduled = [t for t in request.tasks if t.title not in minutes_by_task]
+    for task in request.tasks:
+        scheduled = minutes_by_task.get(task.title, 0)
+        if 0 < scheduled < task.duration_minutes:
+            report(-1, "incomplete", "none", f"Only {scheduled:.0f} of {task.duration_minutes} minutes of '{task.title}' were scheduled.")
+    return ValidationResult(sessions=accepted, diagnostics=diagnostics, unscheduled=unscheduled)